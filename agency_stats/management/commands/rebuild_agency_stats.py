@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from agency_stats.summaries import check_summaries, rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Verify the agency summary tables against live aggregates, or rebuild them in full."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report differences, exit with an error if any.")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            differences = check_summaries()
+            if differences:
+                preview = '\n'.join(
+                    f"{table} {key}: stored {stored}, live {live}" for table, key, stored, live in differences[:20]
+                )
+                raise CommandError(f"{len(differences)} summary rows differ from live aggregates:\n{preview}")
+            self.stdout.write(self.style.SUCCESS("All agency summaries are consistent."))
+            return
+
+        written = rebuild_summaries()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt agency summaries ({written} rows)."))
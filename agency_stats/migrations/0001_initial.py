@@ -0,0 +1,74 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:02
+
+from django.db import migrations, models
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q, Sum
+
+
+def populate_summaries(apps, schema_editor):
+    SpyCats = apps.get_model('agents_cats', 'SpyCats')
+    SpyMission = apps.get_model('agents_missions', 'SpyMission')
+    SpyTarget = apps.get_model('agents_missions', 'SpyTarget')
+    MissionSummary = apps.get_model('agency_stats', 'MissionSummary')
+    TargetSummary = apps.get_model('agency_stats', 'TargetSummary')
+    BreedSummary = apps.get_model('agency_stats', 'BreedSummary')
+
+    assigned = ExpressionWrapper(Q(agent__isnull=False), output_field=BooleanField())
+    MissionSummary.objects.bulk_create(
+        MissionSummary(**row) for row in SpyMission.objects.order_by().annotate(assigned=assigned)
+        .values('status', 'assigned').annotate(missions=Count('pk'))
+    )
+    TargetSummary.objects.bulk_create(
+        TargetSummary(**row) for row in SpyTarget.objects.order_by().values('country', 'status')
+        .annotate(targets=Count('pk'))
+    )
+    BreedSummary.objects.bulk_create(
+        BreedSummary(**row) for row in SpyCats.objects.order_by().values('breed')
+        .annotate(agents=Count('pk'), total_salary=Sum('salary'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('agents_cats', '0003_spycats_updated_at'),
+        ('agents_missions', '0006_status_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BreedSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('breed', models.CharField(max_length=100, unique=True)),
+                ('agents', models.IntegerField(default=0)),
+                ('total_salary', models.FloatField(default=0.0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MissionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('assigned', models.BooleanField()),
+                ('missions', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('status', 'assigned'), name='missionsummary_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TargetSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(max_length=200)),
+                ('status', models.CharField(max_length=20)),
+                ('targets', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('country', 'status'), name='targetsummary_key')],
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
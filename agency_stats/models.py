@@ -0,0 +1,45 @@
+from django.db import models
+
+
+# Summary tables of the agency, kept up to date by the writes (see summaries.py).
+# Counters are plain signed integers: a summary that drifted must never make a write fail,
+# rebuild_agency_stats --check reports it instead.
+
+class MissionSummary(models.Model):
+    """Number of missions per status, with or without an agent."""
+    status = models.CharField(max_length=20)
+    assigned = models.BooleanField()
+    missions = models.IntegerField(default=0)
+
+    KEY_FIELDS = ('status', 'assigned')
+    VALUE_FIELDS = ('missions',)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'assigned'], name='missionsummary_key'),
+        ]
+
+
+class TargetSummary(models.Model):
+    """Number of targets per country and status."""
+    country = models.CharField(max_length=200)
+    status = models.CharField(max_length=20)
+    targets = models.IntegerField(default=0)
+
+    KEY_FIELDS = ('country', 'status')
+    VALUE_FIELDS = ('targets',)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['country', 'status'], name='targetsummary_key'),
+        ]
+
+
+class BreedSummary(models.Model):
+    """Number of agents and sum of their salaries per breed."""
+    breed = models.CharField(max_length=100, unique=True)
+    agents = models.IntegerField(default=0)
+    total_salary = models.FloatField(default=0.0)
+
+    KEY_FIELDS = ('breed',)
+    VALUE_FIELDS = ('agents', 'total_salary')
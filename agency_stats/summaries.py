@@ -0,0 +1,232 @@
+import math
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q, Sum
+
+from agents_cats.models import SpyCats
+from agents_missions.models import SpyMission, SpyTarget, target_status_deltas
+from .models import BreedSummary, MissionSummary, TargetSummary
+
+SUMMARY_MODELS = [MissionSummary, TargetSummary, BreedSummary]
+# Rows per INSERT ... ON CONFLICT statement, well below the SQLite variable limit
+UPSERT_BATCH_SIZE = 100
+
+ASSIGNED = ExpressionWrapper(Q(agent__isnull=False), output_field=BooleanField())
+
+
+def mission_key(mission):
+    return (mission.status, mission.agent_id is not None)
+
+
+def target_key(target):
+    return (target.country, target.status)
+
+
+def agent_key(cat):
+    return (cat.breed, cat.salary)
+
+
+def add_to_summary(model, deltas):
+    """
+    Adds ``{key: {field: delta}}`` to the rows of a summary table with INSERT ... ON CONFLICT DO UPDATE
+    (PostgreSQL and SQLite), which also creates the missing rows: one statement whether the rows exist
+    or not. Keys are sorted, so concurrent writers lock the rows in the same order.
+    """
+    rows = [
+        (*key, *(deltas[key].get(field, 0) for field in model.VALUE_FIELDS))
+        for key in sorted(deltas) if any(deltas[key].values())
+    ]
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    keys = [quote(model._meta.get_field(field).column) for field in model.KEY_FIELDS]
+    values = [quote(model._meta.get_field(field).column) for field in model.VALUE_FIELDS]
+    updates = ', '.join(f'{column} = {table}.{column} + EXCLUDED.{column}' for column in values)
+    row_sql = f"({', '.join(['%s'] * (len(keys) + len(values)))})"
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(keys + values)}) VALUES {', '.join([row_sql] * len(batch))} "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}",
+                [value for row in batch for value in row]
+            )
+
+
+def record_missions(changes):
+    """``(old, new)`` pairs of mission_key values, ``None`` for a created or deleted mission."""
+    deltas = target_status_deltas(changes)
+    add_to_summary(MissionSummary, {key: {'missions': delta} for key, delta in deltas.items()})
+
+
+def record_targets(changes):
+    """``(old, new)`` pairs of target_key values, ``None`` for a created or deleted target."""
+    deltas = target_status_deltas(changes)
+    add_to_summary(TargetSummary, {key: {'targets': delta} for key, delta in deltas.items()})
+
+
+def record_agents(changes):
+    """``(old, new)`` pairs of agent_key values, ``None`` for a created or deleted agent."""
+    deltas = {}
+    for old, new in changes:
+        for key, sign in ((old, -1), (new, 1)):
+            if key is not None:
+                breed, salary = key
+                delta = deltas.setdefault((breed,), {'agents': 0, 'total_salary': 0})
+                delta['agents'] += sign
+                delta['total_salary'] += sign * salary
+    add_to_summary(BreedSummary, deltas)
+
+
+def forget_missions(missions):
+    """
+    Removes the missions of a queryset that is about to be deleted, and their targets, from the
+    summaries. Runs two GROUP BY queries whatever the number of missions.
+    """
+    rows = missions.order_by().annotate(assigned=ASSIGNED).values('status', 'assigned').annotate(count=Count('pk'))
+    add_to_summary(MissionSummary, {
+        (row['status'], row['assigned']): {'missions': -row['count']} for row in rows
+    })
+    rows = SpyTarget.objects.filter(mission__in=missions).order_by().values('country', 'status')\
+        .annotate(count=Count('pk'))
+    add_to_summary(TargetSummary, {
+        (row['country'], row['status']): {'targets': -row['count']} for row in rows
+    })
+
+
+def forget_agents(cats):
+    """
+    Removes the agents of a queryset that is about to be deleted from the summaries.
+    Their missions stay, without an agent (SET_NULL).
+    """
+    rows = cats.order_by().values('breed').annotate(agents=Count('pk'), total_salary=Sum('salary'))
+    add_to_summary(BreedSummary, {
+        (row['breed'],): {'agents': -row['agents'], 'total_salary': -row['total_salary']} for row in rows
+    })
+    rows = SpyMission.objects.filter(agent__in=cats).order_by().values('status').annotate(count=Count('pk'))
+    deltas = {}
+    for row in rows:
+        deltas[(row['status'], True)] = {'missions': -row['count']}
+        deltas[(row['status'], False)] = {'missions': row['count']}
+    add_to_summary(MissionSummary, deltas)
+
+
+def live_summaries():
+    """The summary rows computed from the agency tables: ``{model: {key: {field: value}}}``."""
+    querysets = {
+        MissionSummary: SpyMission.objects.annotate(assigned=ASSIGNED).values('status', 'assigned')
+        .annotate(missions=Count('pk')),
+        TargetSummary: SpyTarget.objects.values('country', 'status').annotate(targets=Count('pk')),
+        BreedSummary: SpyCats.objects.values('breed').annotate(agents=Count('pk'), total_salary=Sum('salary')),
+    }
+    return {model: summary_rows(model, queryset.order_by()) for model, queryset in querysets.items()}
+
+
+def stored_summaries():
+    return {model: summary_rows(model, model.objects.values()) for model in SUMMARY_MODELS}
+
+
+def summary_rows(model, rows):
+    summary = {}
+    for row in rows:
+        values = {field: row[field] for field in model.VALUE_FIELDS}
+        # An emptied row stays in the table with zero values, a GROUP BY has no row for it.
+        if not all(is_close(value, 0) for value in values.values()):
+            summary[tuple(row[field] for field in model.KEY_FIELDS)] = values
+    return summary
+
+
+def lock_summaries():
+    """
+    Blocks writes to the summary tables until the end of the transaction, after waiting for the
+    transactions that already wrote to them: live aggregates then see every change the summaries saw.
+    """
+    if connection.vendor == 'postgresql':
+        tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in SUMMARY_MODELS)
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {tables} IN SHARE ROW EXCLUSIVE MODE')
+
+
+def rebuild_summaries():
+    """Replaces the content of every summary table with live aggregates. Returns the number of rows written."""
+    written = 0
+    with transaction.atomic():
+        lock_summaries()
+        for model, rows in live_summaries().items():
+            model.objects.all().delete()
+            written += len(model.objects.bulk_create(
+                model(**dict(zip(model.KEY_FIELDS, key)), **values) for key, values in rows.items()
+            ))
+    return written
+
+
+def check_summaries():
+    """
+    Compares the summary tables with live aggregates read from the same snapshot.
+    Returns ``(table, key, stored, live)`` tuples for the rows that differ, ``None`` for a missing row.
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            # A write and its summary deltas commit together: one snapshot sees both or neither.
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        live, stored = live_summaries(), stored_summaries()
+
+    differences = []
+    for model in SUMMARY_MODELS:
+        for key in sorted(live[model].keys() | stored[model].keys()):
+            stored_values, live_values = stored[model].get(key), live[model].get(key)
+            if stored_values is None or live_values is None or not all(
+                is_close(stored_values[field], live_values[field]) for field in model.VALUE_FIELDS
+            ):
+                differences.append((model._meta.db_table, key, stored_values, live_values))
+    return differences
+
+
+def is_close(stored, live):
+    # Salary totals are float sums accumulated in a different order than SUM() adds them.
+    return math.isclose(stored, live, rel_tol=1e-9, abs_tol=1e-6)
+
+
+def read_stats():
+    """The figures served by GET /api/stats/, read from the summary tables only (three small queries)."""
+    missions = dict.fromkeys(SpyMission.MissionStatus.values, 0)
+    unassigned = busy_agents = 0
+    for status, assigned, count in MissionSummary.objects.values_list('status', 'assigned', 'missions'):
+        missions[status] = missions.get(status, 0) + count
+        if not assigned:
+            unassigned += count
+        elif status in SpyMission.ACTIVE_STATUSES:
+            # An agent has at most one active mission
+            busy_agents += count
+
+    targets = dict.fromkeys(SpyTarget.TargetStatus.values, 0)
+    countries = {}
+    rows = TargetSummary.objects.exclude(targets=0).order_by('country', 'status')\
+        .values_list('country', 'status', 'targets')
+    for country, status, count in rows:
+        countries.setdefault(country, dict.fromkeys(SpyTarget.TargetStatus.values, 0))[status] = count
+        targets[status] = targets.get(status, 0) + count
+
+    breeds = []
+    agents = 0
+    for breed, count, total in BreedSummary.objects.exclude(agents=0).order_by('breed')\
+            .values_list('breed', 'agents', 'total_salary'):
+        agents += count
+        breeds.append({
+            'breed': breed, 'agents': count,
+            'total_salary': round(total, 2), 'average_salary': round(total / count, 2),
+        })
+
+    return {
+        'missions': {'total': sum(missions.values()), 'unassigned': unassigned, 'by_status': missions},
+        'targets': {'total': sum(targets.values()), 'by_status': targets, 'by_country': countries},
+        'salaries': breeds,
+        'agents': {
+            'total': agents,
+            'on_active_missions': busy_agents,
+            'utilization': round(busy_agents / agents, 4) if agents else 0.0,
+        },
+    }
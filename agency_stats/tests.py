@@ -0,0 +1,137 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from agents_cats.models import SpyCats
+from agents_missions.models import SpyMission, SpyTarget
+from cta_project.testing import QueryBudgetMixin, StubCatAPIMixin
+from .models import BreedSummary, MissionSummary, TargetSummary
+from .summaries import check_summaries, rebuild_summaries
+
+cats_url = '/api/agents-cats/spy-cats/'
+missions_url = '/api/missions/spy-missions/'
+
+
+class SummaryMaintenanceTests(StubCatAPIMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def assertConsistent(self):
+        self.assertEqual(check_summaries(), [])
+
+    def test_api_writes_keep_summaries_consistent(self):
+        tom = self.client.post(cats_url, {'name': 'Tom', 'breed': 'Bengal', 'salary': 100}, format='json').data
+        self.client.post(f'{cats_url}bulk/', [
+            {'name': 'Luna', 'breed': 'Siamese', 'salary': 300},
+            {'name': 'Felix', 'breed': 'Bengal', 'salary': 200},
+        ], format='json')
+        luna = SpyCats.objects.get(name='Luna')
+        self.client.put(f'{cats_url}{tom["id"]}/', {'salary': 150}, format='json')
+        self.client.patch(f'{cats_url}bulk/', [{'id': luna.id, 'salary': 350}], format='json')
+        self.assertConsistent()
+
+        mission = self.client.post(missions_url, {'agent_id': tom['id'], 'targets': [
+            {'name': 'Target 1', 'country': 'UA'},
+            {'name': 'Target 2', 'country': 'PL'},
+        ]}, format='json').data
+        self.client.post(f'{missions_url}bulk/', [
+            {'targets': [{'name': 'Target 3', 'country': 'PL'}]},
+            {'agent_id': luna.id, 'targets': [{'name': 'Target 4', 'country': 'UA'}]},
+        ], format='json')
+        first, second = mission['targets']
+        self.client.patch(f'{missions_url}{mission["id"]}/', {'targets': [
+            {'id': first['id'], 'status': 'done'},
+            {'id': second['id'], 'status': 'in_progress'},
+        ]}, format='json')
+        self.assertConsistent()
+
+        unassigned = SpyMission.objects.get(agent__isnull=True)
+        self.assertEqual(self.client.delete(f'{missions_url}{unassigned.id}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'{cats_url}{luna.id}/').status_code, 204)
+        self.assertConsistent()
+
+        stats = self.client.get('/api/stats/').data
+        self.assertEqual(stats['missions'], {
+            'total': 2, 'unassigned': 1,
+            'by_status': {'not_started': 1, 'in_progress': 1, 'done': 0, 'failed': 0},
+        })
+        self.assertEqual(stats['targets']['by_country'], {
+            'PL': {'not_started': 0, 'in_progress': 1, 'done': 0, 'failed': 0},
+            'UA': {'not_started': 1, 'in_progress': 0, 'done': 1, 'failed': 0},
+        })
+        self.assertEqual(stats['salaries'], [
+            {'breed': 'Bengal', 'agents': 2, 'total_salary': 350.0, 'average_salary': 175.0},
+        ])
+        self.assertEqual(stats['agents'], {'total': 2, 'on_active_missions': 1, 'utilization': 0.5})
+
+    def test_admin_writes_keep_summaries_consistent(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        self.client.post('/admin/agents_cats/spycats/add/', {
+            'name': 'Tom', 'breed': 'Bengal', 'salary': 100, 'experience': 0,
+        })
+        agent = SpyCats.objects.get()
+        self.client.post(f'/admin/agents_cats/spycats/{agent.id}/change/', {'salary': 250, 'experience': 0})
+        self.assertEqual(SpyCats.objects.get().salary, 250)
+        self.assertEqual(BreedSummary.objects.get(breed='Bengal').total_salary, 250)
+        self.assertConsistent()
+
+        self.client.post('/admin/agents_missions/spymission/add/', {
+            'agent': agent.id,
+            'targets-TOTAL_FORMS': 2, 'targets-INITIAL_FORMS': 0,
+            'targets-MIN_NUM_FORMS': 0, 'targets-MAX_NUM_FORMS': 1000,
+            'targets-0-name': 'Target 1', 'targets-0-country': 'UA', 'targets-0-notes': '',
+            'targets-1-name': 'Target 2', 'targets-1-country': 'PL', 'targets-1-notes': '',
+        })
+        mission = SpyMission.objects.get()
+        first, second = mission.targets.order_by('id')
+        self.client.post(f'/admin/agents_missions/spymission/{mission.id}/change/', {
+            'agent': agent.id,
+            'targets-TOTAL_FORMS': 2, 'targets-INITIAL_FORMS': 2,
+            'targets-MIN_NUM_FORMS': 0, 'targets-MAX_NUM_FORMS': 1000,
+            'targets-0-id': first.id, 'targets-0-mission': mission.id, 'targets-0-notes': '', 'targets-0-status': 'failed',
+            'targets-1-id': second.id, 'targets-1-mission': mission.id, 'targets-1-notes': '', 'targets-1-status': 'failed',
+        })
+        self.assertEqual(SpyMission.objects.get().status, SpyMission.MissionStatus.FAILED)
+        self.assertConsistent()
+
+        self.client.post(f'/admin/agents_cats/spycats/{agent.id}/delete/', {'post': 'yes'})
+        self.client.post('/admin/agents_missions/spymission/', {
+            'action': 'delete_selected', '_selected_action': [mission.id], 'post': 'yes',
+        })
+        self.assertFalse(SpyMission.objects.exists())
+        self.assertConsistent()
+        self.assertEqual(self.client.get('/api/stats/').data['targets']['total'], 0)
+
+
+class RebuildAgencyStatsCommandTests(TestCase):
+    def test_check_and_rebuild(self):
+        agent = SpyCats.objects.create(name='Tom', breed='Bengal', salary=100)
+        mission = SpyMission.objects.create(agent=agent)
+        SpyTarget.objects.create(mission=mission, name='Target', country='UA')
+        TargetSummary.objects.create(country='PL', status='done', targets=3)
+
+        with self.assertRaisesMessage(CommandError, '4 summary rows differ'):
+            call_command('rebuild_agency_stats', '--check', stdout=StringIO())
+        call_command('rebuild_agency_stats', stdout=StringIO())
+
+        call_command('rebuild_agency_stats', '--check', stdout=StringIO())
+        self.assertEqual(MissionSummary.objects.get().missions, 1)
+        self.assertEqual(list(TargetSummary.objects.values_list('country', 'targets')), [('UA', 1)])
+        self.assertEqual(BreedSummary.objects.get(breed='Bengal').total_salary, 100)
+
+
+class AgencyStatsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def seed(self, count):
+        for i in range(count):
+            agent = SpyCats.objects.create(name=f'Agent {i}', breed=f'Breed {i}', salary=100)
+            mission = SpyMission.objects.create(agent=agent)
+            SpyTarget.objects.create(mission=mission, name='Target', country=f'Country {i}')
+        rebuild_summaries()
+
+    def test_stats(self):
+        self.assertQueriesDoNotScale(self.seed, lambda: APIClient().get('/api/stats/'), budget=3)
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import AgencyStatsView
+
+urlpatterns = [
+    path('', AgencyStatsView.as_view(), name='agency-stats'),
+]
@@ -0,0 +1,14 @@
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .summaries import read_stats
+
+
+class AgencyStatsView(APIView):
+    """
+    Missions per status, targets per status and country, salaries per breed and agent utilization,
+    from the summary tables: the cost does not depend on the number of agents, missions or targets.
+    """
+
+    def get(self, request):
+        return Response(read_stats())
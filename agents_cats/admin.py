@@ -1,5 +1,9 @@
 from django.contrib import admin, messages
+from django.db import transaction
 from rest_framework.exceptions import ValidationError as DRFValidationError
+from agency_stats.summaries import forget_agents
+from agents_missions.models import SpyMission
+from cta_project.caching import response_cache
 from .models import SpyCats
 from .serializers import SpyCatsSerializer
 
@@ -55,5 +59,25 @@ class SpyCatsAdmin(admin.ModelAdmin):
             messages.error(request, f"❌ Unexpected error: {e}")
             raise
 
+    def delete_model(self, request, obj):
+        cat_id = obj.pk
+        mission_ids = list(obj.missions.values_list('id', flat=True))
+        with transaction.atomic():
+            forget_agents(SpyCats.objects.filter(pk=cat_id))
+            SpyCats.objects.filter(pk=cat_id).touch_missions()
+            super().delete_model(request, obj)
+        response_cache.invalidate('cats', cat_id)
+        response_cache.invalidate('missions', *mission_ids)
+
+    def delete_queryset(self, request, queryset):
+        cat_ids = list(queryset.values_list('id', flat=True))
+        mission_ids = list(SpyMission.objects.filter(agent_id__in=cat_ids).values_list('id', flat=True))
+        with transaction.atomic():
+            forget_agents(SpyCats.objects.filter(pk__in=cat_ids))
+            SpyCats.objects.filter(pk__in=cat_ids).touch_missions()
+            super().delete_queryset(request, queryset)
+        response_cache.invalidate('cats', *cat_ids)
+        response_cache.invalidate('missions', *mission_ids)
+
     def has_change_permission(self, request, obj=None):
         return True
@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from cta_project.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class BreedCatalogUnavailable(Exception):
+    pass
+
+
+class BreedRegistry:
+    """
+    Process-wide cache of TheCatAPI breed names.
+
+    Lookups are served from an in-memory set. When the set is older than
+    BREED_CACHE_TTL it is still served while a background thread refreshes it
+    (stale-while-revalidate). A cold process loads the last persisted catalog
+    from the CatBreed table and only goes to TheCatAPI when that table is empty.
+    With BREED_REFRESH_IN_WORKERS, the background thread reloads the CatBreed
+    table and queues a refresh job instead (agents_cats.tasks).
+    """
+
+    retry_interval = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breeds = None
+        self._expires_at = 0.0
+        self._refreshing = False
+        self._refresh_thread = None
+        self._session = None
+        # Separate from _lock: the session is first built by fetch() while _load() holds _lock.
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=settings.CAT_API_POOL_SIZE,
+                        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def fetch(self):
+        try:
+            with timed('http'):
+                response = self.session.get(settings.CAT_API_BREEDS_URL, timeout=settings.CAT_API_TIMEOUT)
+        except requests.RequestException as e:
+            raise BreedCatalogUnavailable(str(e)) from e
+        if response.status_code != 200:
+            raise BreedCatalogUnavailable(f"TheCatAPI responded with {response.status_code}")
+        return [breed['name'] for breed in response.json()]
+
+    def refresh(self):
+        names = self.fetch()
+        self._persist(names)
+        return self._store(names)
+
+    def snapshot(self):
+        breeds = self._breeds
+        if breeds is None:
+            return self._load()
+        if time.monotonic() >= self._expires_at:
+            self._refresh_in_background()
+        return breeds
+
+    def contains(self, breed):
+        return breed.lower() in self.snapshot()
+
+    def wait_for_refresh(self, timeout=None):
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def clear(self):
+        with self._lock:
+            self._breeds = None
+            self._expires_at = 0.0
+
+    def after_fork(self):
+        # A forked child inherits neither the refresh thread nor a usable connection pool.
+        self._lock = threading.Lock()
+        self._session_lock = threading.Lock()
+        self._session = None
+        self._refreshing = False
+        self._refresh_thread = None
+
+    def _store(self, names, ttl=None):
+        breeds = frozenset(name.lower() for name in names)
+        self._breeds = breeds
+        self._expires_at = time.monotonic() + (settings.BREED_CACHE_TTL if ttl is None else ttl)
+        return breeds
+
+    def _load(self):
+        with self._lock:
+            if self._breeds is not None:
+                return self._breeds
+            names = self._load_persisted()
+            if names:
+                # Persisted catalog may be arbitrarily old: serve it, but revalidate right away.
+                breeds = self._store(names, ttl=0)
+            else:
+                names = self.fetch()
+                self._persist(names)
+                return self._store(names)
+        self._refresh_in_background()
+        return breeds
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._refresh_thread = threading.Thread(
+                target=self._background_refresh, name='breed-registry-refresh', daemon=True
+            )
+        self._refresh_thread.start()
+
+    def _background_refresh(self):
+        try:
+            if settings.BREED_REFRESH_IN_WORKERS:
+                self._reload_persisted()
+            else:
+                self.refresh()
+        except BreedCatalogUnavailable as e:
+            logger.warning("Breed catalog refresh failed, serving stale data: %s", e)
+            self._expires_at = time.monotonic() + self.retry_interval
+        except Exception:
+            logger.exception("Breed catalog refresh failed, serving stale data")
+            self._expires_at = time.monotonic() + self.retry_interval
+        finally:
+            self._refreshing = False
+            connection.close()
+
+    def _reload_persisted(self):
+        from .tasks import refresh_breed_catalog_later
+        # The workers update the table; this process sees their result on its next revalidation.
+        refresh_breed_catalog_later()
+        names = self._load_persisted()
+        if not names:
+            raise BreedCatalogUnavailable("The CatBreed table is empty")
+        self._store(names)
+
+    def _load_persisted(self):
+        from .models import CatBreed
+        return list(CatBreed.objects.values_list('name', flat=True))
+
+    def _persist(self, names):
+        from .models import CatBreed
+        if not names:
+            # An empty answer would wipe the catalog every cold process falls back on.
+            raise BreedCatalogUnavailable("TheCatAPI returned an empty breed catalog")
+        with transaction.atomic():
+            CatBreed.objects.exclude(name__in=names).delete()
+            CatBreed.objects.bulk_create([CatBreed(name=name) for name in names], ignore_conflicts=True)
+
+
+breed_registry = BreedRegistry()
+os.register_at_fork(after_in_child=breed_registry.after_fork)
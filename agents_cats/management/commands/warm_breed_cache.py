@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from agents_cats.breeds import breed_registry, BreedCatalogUnavailable
+
+
+class Command(BaseCommand):
+    help = "Fetch the breed catalog from TheCatAPI and persist it for the breed registry."
+
+    def handle(self, *args, **options):
+        try:
+            breeds = breed_registry.refresh()
+        except BreedCatalogUnavailable as e:
+            raise CommandError(f"Failed to fetch breeds from TheCatAPI: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Breed cache warmed with {len(breeds)} breeds."))
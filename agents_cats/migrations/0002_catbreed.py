@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_cats', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatBreed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
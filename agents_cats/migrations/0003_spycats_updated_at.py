@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_cats', '0002_catbreed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spycats',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
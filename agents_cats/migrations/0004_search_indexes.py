@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:08
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+# Admin search (icontains on name and breed, also reached from the mission admin through agent__name)
+# compares UPPER(column) LIKE UPPER('%term%'); on PostgreSQL, trigram indexes on UPPER(column) serve it.
+TRIGRAM_INDEXES = {
+    'spycats_name_trgm_idx': 'UPPER(name) gin_trgm_ops',
+    'spycats_breed_trgm_idx': 'UPPER(breed) gin_trgm_ops',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, expression in TRIGRAM_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON agents_cats_spycats USING gin ({expression})')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_cats', '0003_spycats_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='spycats',
+            index=models.Index(django.db.models.functions.text.Upper('breed'), models.F('id'), name='spycats_breed_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spycats',
+            index=models.Index(fields=['salary'], name='spycats_salary_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,10 +1,52 @@
 from django.db import models
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Upper
+from django.utils import timezone
+
+
+class SpyCatsQuerySet(models.QuerySet):
+    def available(self, mission_id=None):
+        """
+        Agents without a NOT_STARTED or IN_PROGRESS mission, as one NOT EXISTS query served by the
+        one_active_mission_per_agent index. With ``mission_id`` the agent of that mission is kept too.
+        """
+        SpyMission = self.model.missions.field.model
+        available = ~Exists(SpyMission.objects.filter(agent=OuterRef('pk'), status__in=SpyMission.ACTIVE_STATUSES))
+        if mission_id is not None:
+            available |= Exists(SpyMission.objects.filter(pk=mission_id, agent=OuterRef('pk')))
+        return self.filter(available)
+
+    def touch_missions(self):
+        """
+        Bumps updated_at of the missions of these agents before they are deleted: SET_NULL changes the
+        missions without saving them, and their ETags are seeded again from updated_at.
+        """
+        SpyMission = self.model.missions.field.model
+        return SpyMission.objects.filter(agent__in=self.values('pk')).update(updated_at=timezone.now())
+
 
 class SpyCats(models.Model):
     name = models.CharField(max_length=100)
     experience = models.FloatField(default=0.0)
     breed = models.CharField(max_length=100)
     salary = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = SpyCatsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # ?breed= (case-insensitive) in id order; admin searches use trigram indexes (migration 0004)
+            models.Index(Upper('breed'), F('id'), name='spycats_breed_upper_idx'),
+            models.Index(fields=['salary'], name='spycats_salary_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.breed})"
+
+class CatBreed(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    fetched_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.name} ({self.breed})"
\ No newline at end of file
+        return self.name
@@ -1,8 +1,12 @@
+from django.db import transaction
 from rest_framework import serializers
+from agency_stats.summaries import agent_key, record_agents
+from cta_project.caching import response_cache
+from cta_project.metrics import TimedSerializerMixin
 from .models import SpyCats
-import requests
+from .breeds import breed_registry, BreedCatalogUnavailable
 
-class SpyCatsSerializer(serializers.ModelSerializer):
+class SpyCatsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = SpyCats
         fields = ['id', 'name', 'breed', 'salary']
@@ -14,11 +18,29 @@ class SpyCatsSerializer(serializers.ModelSerializer):
             self.fields['name'].read_only = True
             self.fields['breed'].read_only = True
 
+    def create(self, validated_data):
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            record_agents([(None, agent_key(instance))])
+            response_cache.invalidate('cats', instance.pk)
+        return instance
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            # Read the stored row: the admin form has already put the posted values on ``instance``.
+            old_key = agent_key(SpyCats.objects.select_for_update().only('breed', 'salary').get(pk=instance.pk))
+            instance = super().update(instance, validated_data)
+            record_agents([(old_key, agent_key(instance))])
+            response_cache.invalidate('cats', instance.pk)
+        return instance
+
     def validate_breed(self, value):
-        response = requests.get("https://api.thecatapi.com/v1/breeds")
-        if response.status_code != 200:
-            raise serializers.ValidationError("Failed to verify breed with TheCatAPI.")
-        breeds = [breed['name'].lower() for breed in response.json()]
+        breeds = self.context.get('breeds')
+        if breeds is None:
+            try:
+                breeds = breed_registry.snapshot()
+            except BreedCatalogUnavailable:
+                raise serializers.ValidationError("Failed to verify breed with TheCatAPI.")
         if value.lower() not in breeds:
             raise serializers.ValidationError(f"Breed '{value}' not found in TheCatAPI.")
         return value
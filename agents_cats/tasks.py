@@ -0,0 +1,14 @@
+from jobs.queue import enqueue, task
+from .breeds import breed_registry
+
+REFRESH_BREED_CATALOG = 'cats.refresh_breed_catalog'
+
+
+def refresh_breed_catalog_later():
+    enqueue(REFRESH_BREED_CATALOG, dedupe_key='breed-catalog')
+
+
+@task(REFRESH_BREED_CATALOG)
+def refresh_breed_catalog():
+    """Fetches TheCatAPI breed catalog into the CatBreed table; retried with backoff while it is unavailable."""
+    breed_registry.refresh()
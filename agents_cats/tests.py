@@ -1,3 +1,323 @@
-from django.test import TestCase
+import os
+import signal
+import unittest
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from agents_missions.models import SpyMission
+from cta_project.caching import response_cache
+from cta_project.testing import QueryBudgetMixin, StubCatAPIMixin
+from jobs.models import Job
+from jobs.queue import run_workers
+from .breeds import BreedRegistry, breed_registry, BreedCatalogUnavailable
+from .models import CatBreed, SpyCats
+from .serializers import SpyCatsSerializer
+from .tasks import REFRESH_BREED_CATALOG
+
+
+class BreedRegistryTests(StubCatAPIMixin, TestCase):
+    def test_refresh_persists_catalog(self):
+        breeds = breed_registry.refresh()
+
+        self.assertIn('maine coon', breeds)
+        self.assertEqual(CatBreed.objects.count(), len(self.cat_api.breeds))
+
+    def test_snapshot_is_served_from_memory(self):
+        for _ in range(5):
+            self.assertTrue(breed_registry.contains('Bengal'))
+
+        self.assertEqual(self.cat_api.hits, 1)
+
+    def test_cold_start_uses_persisted_catalog(self):
+        CatBreed.objects.create(name='Sphynx')
+        self.cat_api.status = 503
+
+        self.assertTrue(breed_registry.contains('sphynx'))
+
+    def test_cold_start_without_persisted_catalog(self):
+        registry = BreedRegistry()
+
+        def timeout(*args):
+            raise AssertionError("Breed registry deadlocked on cold start")
+
+        previous = signal.signal(signal.SIGALRM, timeout)
+        signal.alarm(5)
+        try:
+            self.assertTrue(registry.contains('Bengal'))
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+
+    def test_unavailable_catalog_raises(self):
+        self.cat_api.status = 500
+
+        with self.assertRaises(BreedCatalogUnavailable):
+            breed_registry.snapshot()
+
+    def test_empty_catalog_is_not_persisted(self):
+        CatBreed.objects.create(name='Sphynx')
+        self.cat_api.breeds = []
+
+        with self.assertRaises(BreedCatalogUnavailable):
+            breed_registry.refresh()
+        self.assertEqual(list(CatBreed.objects.values_list('name', flat=True)), ['Sphynx'])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs os.fork")
+    def test_forked_child_gets_a_fresh_session(self):
+        breed_registry.contains('Bengal')
+        parent_session = breed_registry.session
+
+        pid = os.fork()
+        if pid == 0:
+            ok = breed_registry.session is not parent_session and breed_registry.contains('Bengal')
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+
+class BreedRegistryRevalidationTests(StubCatAPIMixin, TransactionTestCase):
+    @override_settings(BREED_CACHE_TTL=0)
+    def test_stale_snapshot_is_revalidated_in_background(self):
+        breed_registry.refresh()
+        self.cat_api.breeds = ['Sphynx']
+
+        self.assertTrue(breed_registry.contains('Bengal'))
+        breed_registry.wait_for_refresh()
+
+        self.assertTrue(breed_registry.contains('Sphynx'))
+        self.assertFalse(breed_registry.contains('Bengal'))
+
+    @override_settings(BREED_CACHE_TTL=0, BREED_REFRESH_IN_WORKERS=True)
+    def test_workers_refresh_the_catalog(self):
+        breed_registry.refresh()
+        self.cat_api.breeds = ['Sphynx']
+        hits = self.cat_api.hits
+
+        self.assertTrue(breed_registry.contains('Bengal'))
+        breed_registry.wait_for_refresh()
+        # The web process only reloaded the table and queued the refresh.
+        self.assertEqual(self.cat_api.hits, hits)
+        self.assertEqual(Job.objects.get().kind, REFRESH_BREED_CATALOG)
+
+        self.assertEqual(run_workers(once=True), 1)
+        self.assertEqual(self.cat_api.hits, hits + 1)
+        self.assertEqual(list(CatBreed.objects.values_list('name', flat=True)), ['Sphynx'])
+
+
+class SpyCatsApiTests(StubCatAPIMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def test_create_validates_breed(self):
+        response = self.client.post(
+            '/api/agents-cats/spy-cats/', {'name': 'Tom', 'breed': 'bengal', 'salary': 100}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.post(
+            '/api/agents-cats/spy-cats/', {'name': 'Tom', 'breed': 'Tiger', 'salary': 100}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('breed', response.data)
+
+    def test_create_fails_when_catalog_unavailable(self):
+        self.cat_api.status = 500
+
+        response = self.client.post(
+            '/api/agents-cats/spy-cats/', {'name': 'Tom', 'breed': 'Bengal', 'salary': 100}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(SpyCats.objects.count(), 0)
+
+    def test_update_changes_only_salary(self):
+        cat = SpyCats.objects.create(name='Tom', breed='Bengal', salary=100)
+
+        response = self.client.put(
+            f'/api/agents-cats/spy-cats/{cat.id}/', {'name': 'Jerry', 'salary': 250}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        cat.refresh_from_db()
+        self.assertEqual((cat.name, cat.salary), ('Tom', 250))
+
+    def test_list_is_revalidated_after_salary_update(self):
+        response_cache.clear()
+        cat = SpyCats.objects.create(name='Tom', breed='Bengal', salary=100)
+        etag = self.client.get('/api/agents-cats/spy-cats/')['ETag']
+
+        self.assertEqual(self.client.get('/api/agents-cats/spy-cats/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/agents-cats/spy-cats/{cat.id}/', {'salary': 250}, format='json')
+
+        response = self.client.get('/api/agents-cats/spy-cats/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['salary'], 250)
+
+
+class SpyCatsBulkApiTests(StubCatAPIMixin, TestCase):
+    url = '/api/agents-cats/spy-cats/bulk/'
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def test_bulk_create_keeps_valid_rows(self):
+        rows = [
+            {'name': 'Tom', 'breed': 'Bengal', 'salary': 100},
+            {'name': 'Felix', 'breed': 'Tiger', 'salary': 100},
+            {'name': 'Kitty', 'breed': 'persian', 'salary': 'lots'},
+            {'name': 'Luna', 'breed': 'Siamese'},
+        ]
+
+        breed_registry.refresh()
+
+        # Savepoint, one INSERT per batch, the breed summaries, release.
+        with self.assertNumQueries(5):
+            response = self.client.post(f'{self.url}?batch_size=1', rows, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([cat['name'] for cat in response.data['created']], ['Tom', 'Luna'])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(SpyCats.objects.count(), 2)
+
+    def test_bulk_create_accepts_ndjson(self):
+        body = '{"name": "Tom", "breed": "Bengal", "salary": 100}\n\n{"name": "Luna", "breed": "Siamese"}\n'
+
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(SpyCats.objects.count(), 2)
+
+    def test_bulk_create_rejects_non_list(self):
+        response = self.client.post(self.url, {'name': 'Tom', 'breed': 'Bengal'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_salary_update(self):
+        tom = SpyCats.objects.create(name='Tom', breed='Bengal', salary=100)
+        luna = SpyCats.objects.create(name='Luna', breed='Siamese', salary=100)
+        rows = [
+            {'id': tom.id, 'salary': 300},
+            {'id': luna.id, 'salary': 'lots'},
+            {'id': 0, 'salary': 10},
+            {'id': luna.id, 'name': 'Renamed', 'salary': 200},
+        ]
+
+        # One SELECT for all rows, then savepoint, UPDATE, the breed summaries, release.
+        with self.assertNumQueries(5):
+            response = self.client.patch(self.url, rows, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(
+            sorted(SpyCats.objects.values_list('name', 'salary')), [('Luna', 200), ('Tom', 300)]
+        )
+
+
+class SpyCatsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def seed_cats(self, count):
+        SpyCats.objects.bulk_create(SpyCats(name='Tom', breed='Bengal') for _ in range(count))
+
+    def test_list(self):
+        self.assertQueriesDoNotScale(self.seed_cats, lambda: self.client.get('/api/agents-cats/spy-cats/'), budget=1)
+
+    def test_admin_changelist(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+
+        self.assertQueriesDoNotScale(self.seed_cats, lambda: self.client.get('/admin/agents_cats/spycats/'))
+
+
+class AvailableSpyCatsTests(QueryBudgetMixin, TestCase):
+    url = '/api/agents-cats/spy-cats/available/'
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_lists_only_agents_without_active_mission(self):
+        idle, busy, finished, reassigned = (
+            SpyCats.objects.create(name=name, breed='Bengal') for name in ('Idle', 'Busy', 'Finished', 'Reassigned')
+        )
+        SpyMission.objects.create(agent=busy, status=SpyMission.MissionStatus.IN_PROGRESS)
+        SpyMission.objects.create(agent=finished, status=SpyMission.MissionStatus.DONE)
+        SpyMission.objects.create(agent=reassigned, status=SpyMission.MissionStatus.FAILED)
+        active = SpyMission.objects.create(agent=reassigned)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([cat['name'] for cat in response.data['results']], ['Idle', 'Finished'])
+        self.assertEqual(
+            list(SpyCats.objects.available(mission_id=active.id).order_by('id')), [idle, finished, reassigned]
+        )
+
+    def test_query_count(self):
+        def seed(count):
+            for _ in range(count):
+                SpyMission.objects.create(agent=SpyCats.objects.create(name='Busy', breed='Bengal'))
+                SpyCats.objects.create(name='Idle', breed='Bengal')
+
+        self.assertQueriesDoNotScale(seed, lambda: self.client.get(self.url), budget=1)
+
+
+class SpyCatsFilterTests(TestCase):
+    url = '/api/agents-cats/spy-cats/'
+
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+        SpyCats.objects.create(name='Tom', breed='Bengal', salary=100)
+        SpyCats.objects.create(name='Luna', breed='bengal', salary=300)
+        SpyCats.objects.create(name='Felix', breed='Siamese', salary=200)
+
+    def names(self, query):
+        response = self.client.get(f'{self.url}{query}')
+        self.assertEqual(response.status_code, 200)
+        return [cat['name'] for cat in response.data['results']]
+
+    def test_filters_by_breed_and_salary_range(self):
+        self.assertEqual(self.names('?breed=BENGAL'), ['Tom', 'Luna'])
+        self.assertEqual(self.names('?salary_min=150&salary_max=300'), ['Luna', 'Felix'])
+        self.assertEqual(self.names('?breed=bengal&salary_min=150'), ['Luna'])
+        self.assertEqual(self.names('available/?breed=siamese'), ['Felix'])
+
+    def test_invalid_filter_is_rejected(self):
+        response = self.client.get(f'{self.url}?salary_min=lots&salary_max=nan')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'salary_min', 'salary_max'})
+
+
+class SpyCatsReadPathTests(TestCase):
+    url = '/api/agents-cats/spy-cats/'
+
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+        SpyCats.objects.create(name='Tom', breed='Bengal', salary=1500.5)
+        SpyCats.objects.create(name='Мурзик \u2028', breed='Siamese', experience=3)
+
+    def test_list_and_retrieve_match_serializer(self):
+        cats = SpyCats.objects.order_by('id')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.content, self.client.get(self.url).content)
+        self.assertEqual(response.json()['results'], SpyCatsSerializer(cats, many=True).data)
+        for cat in cats:
+            # A known version without a cached response takes the .values() path.
+            response_cache.clear()
+            response_cache.seed_version('cats', cat.id)
+            self.assertEqual(self.client.get(f'{self.url}{cat.id}/').json(), SpyCatsSerializer(cat).data)
+
+    def test_retrieve_unknown_cat(self):
+        self.assertEqual(self.client.get(f'{self.url}0/').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}abc/').status_code, 404)
@@ -1,16 +1,112 @@
-from rest_framework import viewsets
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+
+from agency_stats.summaries import agent_key, forget_agents, record_agents
+from cta_project.bulk import BulkActionMixin
+from cta_project.caching import ConditionalGetMixin, response_cache
+from cta_project.filters import FilterParam, QueryParamFilterBackend, number
+from cta_project.parsers import NDJSONParser
+from cta_project.reads import ValuesReadMixin
+from .breeds import breed_registry, BreedCatalogUnavailable
 from .models import SpyCats
 from .serializers import SpyCatsSerializer
 
-class SpyCatsViewSet(viewsets.ModelViewSet):
+
+class SpyCatsViewSet(ConditionalGetMixin, ValuesReadMixin, BulkActionMixin, viewsets.ModelViewSet):
     queryset = SpyCats.objects.all()
     serializer_class = SpyCatsSerializer
+    cache_namespace = 'cats'
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'breed': FilterParam('breed__iexact', description="Agents of this breed (case-insensitive)."),
+        'salary_min': FilterParam('salary__gte', number, "Agents earning at least this salary.", 'number'),
+        'salary_max': FilterParam('salary__lte', number, "Agents earning at most this salary.", 'number'),
+    }
 
     def update(self, request, *args, **kwargs):
-        partial = kwargs.pop('partial', False)
         instance = self.get_object()
-        data = {'salary': request.data.get('salary', instance.salary)}
-        serializer = self.get_serializer(instance, data=data, partial=partial)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-        return self.retrieve(request, *args, **kwargs)
\ No newline at end of file
+        row = {'id': instance.id, 'salary': request.data.get('salary', instance.salary)}
+        updated, errors = self.update_salaries([row], {instance.id: instance})
+        if errors:
+            raise ValidationError(errors[0]['errors'])
+        return Response(self.get_serializer(updated[0]).data)
+
+    def perform_destroy(self, instance):
+        # Missions of the deleted agent lose their agent (SET_NULL).
+        mission_ids = list(instance.missions.values_list('id', flat=True))
+        with transaction.atomic():
+            forget_agents(SpyCats.objects.filter(pk=instance.pk))
+            SpyCats.objects.filter(pk=instance.pk).touch_missions()
+            super().perform_destroy(instance)
+        response_cache.invalidate('missions', *mission_ids)
+
+    @action(detail=False, methods=['get'])
+    def available(self, request):
+        queryset = self.filter_queryset(SpyCats.objects.available())
+        page = self.paginate_queryset(queryset.values(*SpyCatsSerializer.Meta.fields))
+        return self.get_paginated_response(page)
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        rows = self.get_bulk_rows(request)
+        try:
+            breeds = breed_registry.snapshot()
+        except BreedCatalogUnavailable:
+            raise ValidationError({"breed": "Failed to verify breed with TheCatAPI."})
+
+        context = {**self.get_serializer_context(), 'breeds': breeds}
+        cats, errors = [], []
+        for index, row in enumerate(rows):
+            serializer = self.get_serializer(data=row, context=context)
+            if serializer.is_valid():
+                cats.append(SpyCats(**serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+
+        with transaction.atomic():
+            created = SpyCats.objects.bulk_create(cats, batch_size=self.get_batch_size(request))
+            record_agents((None, agent_key(cat)) for cat in created)
+            response_cache.invalidate('cats', *(cat.pk for cat in created))
+
+        return Response(
+            {'created': self.get_serializer(created, many=True).data, 'errors': errors},
+            status=status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST
+        )
+
+    @bulk.mapping.patch
+    def bulk_salary(self, request):
+        rows = self.get_bulk_rows(request)
+        ids = [row.get('id') for row in rows if isinstance(row, dict) and isinstance(row.get('id'), int)]
+        updated, errors = self.update_salaries(rows, SpyCats.objects.in_bulk(ids), self.get_batch_size(request))
+        return Response(
+            {'updated': self.get_serializer(updated, many=True).data, 'errors': errors},
+            status=status.HTTP_200_OK if updated or not errors else status.HTTP_400_BAD_REQUEST
+        )
+
+    def update_salaries(self, rows, cats_by_id, batch_size=None):
+        updated, errors, changes = [], [], []
+        for index, row in enumerate(rows):
+            cat = cats_by_id.get(row.get('id')) if isinstance(row, dict) else None
+            if cat is None:
+                errors.append({'index': index, 'errors': {'id': ["Spy cat not found."]}})
+                continue
+            serializer = self.get_serializer(cat, data={'salary': row.get('salary', cat.salary)}, partial=True)
+            if serializer.is_valid():
+                old_key = agent_key(cat)
+                cat.salary = serializer.validated_data['salary']
+                cat.updated_at = timezone.now()
+                updated.append(cat)
+                changes.append((old_key, agent_key(cat)))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+
+        with transaction.atomic():
+            SpyCats.objects.bulk_update(updated, ['salary', 'updated_at'], batch_size=batch_size)
+            record_agents(changes)
+            response_cache.invalidate('cats', *(cat.pk for cat in updated))
+        return updated, errors
@@ -1,12 +1,84 @@
+from django import forms
 from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.http import HttpResponseRedirect
 from rest_framework.exceptions import ValidationError as DRFValidationError
-from .models import SpyMission, SpyTarget
-from .serializers import SpyMissionSerializer
+from .models import SpyMission, SpyTarget, is_agent_conflict
+from .services import VersionConflict, apply_target_changes, check_version, lock_mission, save_mission
+from agency_stats.summaries import forget_missions
 from agents_cats.models import SpyCats
+from cta_project.caching import response_cache
+
+
+class LoadedTargetChoiceField(forms.ModelChoiceField):
+    """Target id field resolving the posted ids among the targets the formset already loaded."""
+
+    def __init__(self, targets, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.targets = targets
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.targets[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+class SpyTargetInlineFormSet(forms.BaseInlineFormSet):
+    """
+    Collects the target changes of an admin save without writing them: SpyMissionAdmin.save_related
+    writes them together with the mission. Changes to targets of an assigned mission follow the
+    API rules (services.apply_target_changes).
+    """
+
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        # The default id field runs one SELECT per posted target.
+        pk_name = self.model._meta.pk.name
+        field = form.fields[pk_name]
+        if not hasattr(self, 'loaded_targets'):
+            self.loaded_targets = {target.pk: target for target in self.get_queryset()}
+        form.fields[pk_name] = LoadedTargetChoiceField(
+            self.loaded_targets, field.queryset, initial=field.initial, required=False, widget=field.widget
+        )
+
+    def clean(self):
+        super().clean()
+        self.new_objects, self.changed_objects, self.deleted_objects = [], [], []
+        if any(self.errors):
+            return
+
+        mission = self.instance
+        for form in self.forms:
+            target = form.instance
+            if self.can_delete and form.cleaned_data.get('DELETE'):
+                if target.pk is not None:
+                    self.deleted_objects.append(target)
+                continue
+            if not form.has_changed():
+                continue
+            if target.pk is None:
+                self.new_objects.append(target)
+                continue
+
+            if mission.agent_id is not None:
+                # The form already copied its data onto the target: start over from the stored values.
+                changes = {field: getattr(target, field) for field in form.changed_data if field in ('notes', 'status')}
+                for field in changes:
+                    setattr(target, field, form.initial[field])
+                try:
+                    apply_target_changes(target, mission, changes)
+                except DRFValidationError as e:
+                    raise ValidationError(e.detail)
+            self.changed_objects.append((target, form.changed_data))
 
 
 class SpyTargetInline(admin.TabularInline):
     model = SpyTarget
+    formset = SpyTargetInlineFormSet
     fields = ('name', 'country', 'notes', 'status')
     extra = 1
     can_delete = True
@@ -29,9 +101,47 @@ class SpyTargetInline(admin.TabularInline):
         return False if obj else True
 
 
+class SpyMissionAdminForm(forms.ModelForm):
+    # Version the page was rendered from, checked under the mission's row lock in clean().
+    base_version = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            self.fields['base_version'].initial = self.instance.version
+
+    def clean(self):
+        """
+        Locks an existing mission (services.lock_mission) and rejects the change if it moved since the
+        page was rendered. The admin view runs in one transaction, so the lock holds until save_related
+        writes the change, and a rejected change re-renders the form instead of being reported as saved.
+        """
+        cleaned_data = super().clean()
+        if self.instance.pk is not None and self.is_bound:
+            lock_mission(self.instance)
+            try:
+                check_version(self.instance, cleaned_data.get('base_version'))
+            except VersionConflict:
+                raise ValidationError(
+                    "Миссию изменили в другом окне, изменения не сохранены. Обновите страницу.", code='conflict'
+                )
+        return cleaned_data
+
+    def validate_unique(self):
+        super().validate_unique()
+        # status is read-only here, so full_clean() skips the constraints that depend on it.
+        exclude = self._get_validation_exclusions() - {'status'}
+        try:
+            self.instance.validate_constraints(exclude=exclude)
+        except ValidationError as e:
+            self._update_errors(e)
+
+
 @admin.register(SpyMission)
 class SpyMissionAdmin(admin.ModelAdmin):
+    form = SpyMissionAdminForm
     list_display = ('id', 'agent', 'status')
+    list_select_related = ('agent',)
     search_fields = ('agent__name',)
     list_filter = ('status',)
     inlines = [SpyTargetInline]
@@ -45,97 +155,57 @@ class SpyMissionAdmin(admin.ModelAdmin):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == 'agent':
-            busy_agent_ids = SpyMission.objects.filter(
-                status__in=[SpyMission.MissionStatus.NOT_STARTED, SpyMission.MissionStatus.IN_PROGRESS]
-            ).exclude(agent__isnull=True).values_list('agent_id', flat=True)
-
-            qs = SpyCats.objects.all().exclude(id__in=busy_agent_ids)
-
             obj_id = request.resolver_match.kwargs.get('object_id')
-            if obj_id:
-                try:
-                    mission = SpyMission.objects.get(pk=int(obj_id))
-                    if mission.agent:
-                        qs = qs | SpyCats.objects.filter(id=mission.agent.id)
-                except (ValueError, SpyMission.DoesNotExist):
-                    pass
-
-            kwargs['queryset'] = qs
+            try:
+                mission_id = int(obj_id) if obj_id else None
+            except ValueError:
+                mission_id = None
+            kwargs['queryset'] = SpyCats.objects.available(mission_id=mission_id)
 
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
     def save_model(self, request, obj, form, change):
-        if obj.agent:
-            active_mission = SpyMission.objects.filter(
-                agent=obj.agent
-            ).exclude(id=obj.id).filter(
-                status__in=[SpyMission.MissionStatus.NOT_STARTED, SpyMission.MissionStatus.IN_PROGRESS]
-            ).exists()
-            if active_mission:
-                messages.error(request, "❌ Этот агент уже назначен на активную миссию.")
-                return
-
-        super().save_model(request, obj, form, change)
-
-        self.update_mission_status(obj)
-
-        if obj.agent:
-            targets = obj.targets.all()
-            targets_data = [
-                {'id': t.id, 'name': t.name, 'country': t.country, 'notes': t.notes, 'status': t.status}
-                for t in targets
-            ]
-            serializer = SpyMissionSerializer(instance=obj, data={'agent_id': obj.agent.id, 'targets': targets_data}, partial=True)
-            try:
-                serializer.is_valid(raise_exception=True)
-                serializer.save()
-            except DRFValidationError as e:
-                messages.error(request, f"❌ Validation error: {e}")
+        # The mission is written together with its targets in save_related.
+        pass
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        # The form validates the constraint, but a concurrent assignment of the same agent can still
+        # make the save fail: the whole view is rolled back (no success message, no LogEntry).
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except IntegrityError as e:
+            if not is_agent_conflict(e):
                 raise
-            except Exception as e:
-                messages.error(request, f"❌ Unexpected error: {e}")
-                raise
-
-    def save_formset(self, request, form, formset, change):
-        formset.save()
-        mission = form.instance
-        self.update_mission_status(mission)
-
-        if mission.agent:
-            targets = mission.targets.all()
-            targets_data = [
-                {'id': t.id, 'name': t.name, 'country': t.country, 'notes': t.notes, 'status': t.status}
-                for t in targets
-            ]
-            serializer = SpyMissionSerializer(instance=mission, data={'agent_id': mission.agent.id, 'targets': targets_data}, partial=True)
-            try:
-                serializer.is_valid(raise_exception=True)
-                serializer.save()
-            except DRFValidationError as e:
-                messages.error(request, f"❌ Validation error: {e}")
-                raise
-            except Exception as e:
-                messages.error(request, f"❌ Unexpected error: {e}")
-                raise
-
-    def update_mission_status(self, mission):
-        if mission.agent is None:
-            return
-
-        targets = mission.targets.all()
-        if not targets:
-            return
-
-        statuses = [t.status for t in targets]
-
-        if all(s == SpyTarget.TargetStatus.FAILED for s in statuses):
-            mission.status = SpyMission.MissionStatus.FAILED
-        elif all(s in [SpyTarget.TargetStatus.DONE, SpyTarget.TargetStatus.FAILED] for s in statuses):
-            mission.status = SpyMission.MissionStatus.DONE
-        elif any(s != SpyTarget.TargetStatus.NOT_STARTED for s in statuses):
-            mission.status = SpyMission.MissionStatus.IN_PROGRESS
-
-        mission.save()
+            messages.error(request, "❌ Этот агент уже назначен на активную миссию.")
+            return HttpResponseRedirect(request.get_full_path())
+
+    def save_related(self, request, form, formsets, change):
+        targets = next((formset for formset in formsets if isinstance(formset, SpyTargetInlineFormSet)), None)
+        # The version was checked in SpyMissionAdminForm.clean(), under the lock that is still held.
+        if targets is None:
+            save_mission(form.instance)
+        else:
+            save_mission(
+                form.instance,
+                new_targets=targets.new_objects,
+                changed_targets=[target for target, _ in targets.changed_objects],
+                deleted_targets=targets.deleted_objects,
+            )
+        form.save_m2m()
+
+    def delete_model(self, request, obj):
+        mission_id = obj.pk
+        with transaction.atomic():
+            forget_missions(SpyMission.objects.filter(pk=mission_id))
+            super().delete_model(request, obj)
+        response_cache.invalidate('missions', mission_id)
+
+    def delete_queryset(self, request, queryset):
+        mission_ids = list(queryset.values_list('id', flat=True))
+        with transaction.atomic():
+            forget_missions(SpyMission.objects.filter(pk__in=mission_ids))
+            super().delete_queryset(request, queryset)
+        response_cache.invalidate('missions', *mission_ids)
 
     def has_delete_permission(self, request, obj=None):
         if obj and obj.agent is not None:
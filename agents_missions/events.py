@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from .models import StatusEvent
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'status_events'
+# Id of the current transaction (PostgreSQL 13+), stored with its events
+CURRENT_TXID = 'pg_current_xact_id()::text::bigint'
+# Every transaction with a smaller id has ended, so its events are visible for good
+SNAPSHOT_XMIN = 'pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+
+EVENT_FIELDS = ['seq', 'kind', 'object_id', 'mission_id', 'previous_status', 'status', 'created_at']
+
+
+def mission_event(mission, previous_status):
+    if mission.status == previous_status:
+        return None
+    return StatusEvent(
+        kind=StatusEvent.Kind.MISSION, object_id=mission.pk, mission_id=mission.pk,
+        previous_status=previous_status, status=mission.status,
+    )
+
+
+def target_events(targets, previous_statuses):
+    """Events of the targets whose status differs from ``previous_statuses[target.pk]``."""
+    return [
+        StatusEvent(
+            kind=StatusEvent.Kind.TARGET, object_id=target.pk, mission_id=target.mission_id,
+            previous_status=previous_statuses[target.pk], status=target.status,
+        )
+        for target in targets if target.status != previous_statuses[target.pk]
+    ]
+
+
+def append_events(events):
+    """
+    Appends status events to the log in the current transaction; the feed consumers are woken
+    once it commits. Appends take no lock: on PostgreSQL each event records the id of its
+    transaction, and readers order the log by (txid, seq) and only go up to the oldest transaction
+    still running, so a reader that has passed an event never finds one before it later.
+    """
+    events = [event for event in events if event is not None]
+    if not events:
+        return events
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            txid = RawSQL(CURRENT_TXID, [])
+            for event in events:
+                event.txid = txid
+        StatusEvent.objects.bulk_create(events)
+        broker.publish_on_commit(events[-1].seq)
+    return events
+
+
+def final_events():
+    """
+    The events no running transaction can precede, in feed order. Elsewhere than on PostgreSQL
+    writes are serialized by the database, so every committed event is final and txid is 0.
+    """
+    events = StatusEvent.objects.order_by('txid', 'seq')
+    if connection.vendor == 'postgresql':
+        events = events.filter(txid__lt=RawSQL(SNAPSHOT_XMIN, []))
+    return events
+
+
+def read_events(since, limit=None):
+    """Events after the event ``since`` (0: from the start) in feed order, as dicts."""
+    events = final_events()
+    if since:
+        # An unknown position (e.g. from another database) starts over with the transactions after txid 0.
+        txid = Coalesce(Subquery(StatusEvent.objects.filter(seq=since).values('txid')), Value(0))
+        events = events.filter(Q(txid__gt=txid) | Q(txid=txid, seq__gt=since))
+    return list(events.values(*EVENT_FIELDS)[:limit or settings.STATUS_FEED_BATCH_SIZE])
+
+
+def last_seq():
+    return final_events().reverse().values_list('seq', flat=True).first() or 0
+
+
+class Subscription:
+    """
+    Wake-up signal of one feed consumer. ``notify`` may be called from any thread,
+    ``wait`` is awaited in the event loop that created the subscription.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def __enter__(self):
+        self.broker.add(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.broker.remove(self)
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # The consumer's loop is already closed
+            self.broker.remove(self)
+
+    async def wait(self, timeout):
+        """Waits for a notification, at most ``timeout`` seconds. Tells whether one arrived."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.event.clear()
+
+
+class LocalBroker:
+    """
+    In-process fan-out: an append wakes the consumers of the same process when its transaction commits.
+    Consumers of other processes notice new events on their next poll (STATUS_FEED_POLL_INTERVAL).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self):
+        """Subscribe before reading the log, so that no append between the read and the wait is missed."""
+        return Subscription(self)
+
+    def add(self, subscription):
+        with self._lock:
+            self._subscriptions.add(subscription)
+
+    def remove(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, seq=None):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.notify()
+
+    def publish_on_commit(self, seq):
+        transaction.on_commit(lambda: self.publish(seq))
+
+
+class PostgresNotifyBroker(LocalBroker):
+    """
+    Fan-out across processes and hosts with PostgreSQL LISTEN/NOTIFY. Appends send a NOTIFY in their
+    own transaction, which PostgreSQL delivers on commit; each process runs one listener thread,
+    started with its first subscription, that turns notifications into local wake-ups.
+    """
+
+    reconnect_interval = 5
+
+    def __init__(self):
+        super().__init__()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def publish_on_commit(self, seq):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, str(seq)])
+
+    def subscribe(self):
+        self.start()
+        return super().subscribe()
+
+    def start(self):
+        with self._thread_lock:
+            # A forked worker does not inherit the thread of its parent.
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.listen, name='status-events-listener', daemon=True)
+                self._thread.start()
+
+    def listen(self):
+        while True:
+            try:
+                self.listen_once()
+            except Exception:
+                logger.exception("Status event listener failed, reconnecting")
+            time.sleep(self.reconnect_interval)
+
+    def listen_once(self):
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        database = connections['default']
+        raw = database.get_new_connection(database.get_connection_params())
+        try:
+            raw.autocommit = True
+            raw.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+            # Appends may have been missed while disconnected: let every consumer read the log again.
+            self.publish()
+            while True:
+                if is_psycopg3:
+                    received = list(raw.notifies(timeout=settings.STATUS_FEED_POLL_INTERVAL, stop_after=1))
+                else:
+                    received = []
+                    if select.select([raw], [], [], settings.STATUS_FEED_POLL_INTERVAL)[0]:
+                        raw.poll()
+                        received = list(raw.notifies)
+                        raw.notifies.clear()
+                if received:
+                    self.publish(max(int(notify.payload) for notify in received))
+        finally:
+            raw.close()
+
+
+def get_broker():
+    if settings.STATUS_FEED_BACKEND == 'postgres':
+        return PostgresNotifyBroker()
+    return LocalBroker()
+
+
+broker = get_broker()
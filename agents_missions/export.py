@@ -0,0 +1,101 @@
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+
+from .models import SpyMission, SpyTarget
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CSV_HEADER = [
+    'mission_id', 'agent_id', 'mission_status',
+    'target_id', 'target_name', 'target_country', 'target_notes', 'target_status',
+]
+
+
+def iter_missions(chunk_size):
+    """
+    Yields every mission with its targets, in the SpyMissionSerializer schema, ordered by id.
+    Missions and targets are read with two server-side cursors and merge-joined on mission id,
+    so memory use does not depend on the number of rows.
+    """
+    missions = SpyMission.objects.order_by('id').values_list('id', 'agent_id', 'status', 'version').iterator(chunk_size)
+    # Each cursor reads its own snapshot. The missions one is opened first, so every mission it returns
+    # was committed before the targets cursor is opened and none is exported without its targets.
+    first = next(missions, None)
+    if first is None:
+        return
+    targets = SpyTarget.objects.order_by('mission_id', 'id')\
+        .values_list('mission_id', 'id', 'name', 'country', 'notes', 'status', 'version').iterator(chunk_size)
+
+    target = next(targets, None)
+    for mission_id, agent_id, status, version in itertools.chain([first], missions):
+        mission_targets = []
+        # Targets of missions created after the missions cursor was opened are skipped.
+        while target is not None and target[0] <= mission_id:
+            if target[0] == mission_id:
+                mission_targets.append({
+                    'id': target[1], 'name': target[2], 'country': target[3], 'notes': target[4], 'status': target[5],
+                    'version': target[6],
+                })
+            target = next(targets, None)
+        yield {
+            'id': mission_id, 'agent_id': agent_id, 'status': status, 'version': version, 'targets': mission_targets,
+        }
+
+
+def iter_ndjson(missions):
+    for mission in missions:
+        yield json.dumps(mission, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(missions):
+    """
+    One row per target; a mission without targets gets a single row with empty target columns.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for mission in missions:
+        head = [mission['id'], mission['agent_id'], mission['status']]
+        if not mission['targets']:
+            yield writer.writerow(head + [''] * 5)
+        for target in mission['targets']:
+            yield writer.writerow(head + [
+                target['id'], target['name'], target['country'], target['notes'], target['status'],
+            ])
+
+
+def export_missions(export_format, chunk_size, buffer_size=64 * 1024):
+    """
+    Yields the export as text chunks of about ``buffer_size`` characters.
+    """
+    lines = (iter_ndjson if export_format == 'ndjson' else iter_csv)(iter_missions(chunk_size))
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+async def aiter_chunks(chunks):
+    """
+    Async view of a sync chunk iterator for the ASGI handler, which would otherwise read a sync
+    iterator to the end before sending anything. Chunks are read one by one on the request's
+    sync thread, the one holding the server-side cursors.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
@@ -0,0 +1,179 @@
+import random
+import time
+from multiprocessing import get_context
+
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+
+from agency_stats.summaries import rebuild_summaries
+from agents_cats.models import SpyCats
+from cta_project.caching import response_cache
+from .importer import default_loader
+from .models import SpyMission, SpyTarget
+
+NOT_STARTED = SpyTarget.TargetStatus.NOT_STARTED
+IN_PROGRESS = SpyTarget.TargetStatus.IN_PROGRESS
+DONE = SpyTarget.TargetStatus.DONE
+FAILED = SpyTarget.TargetStatus.FAILED
+
+FIRST_NAMES = ['Tom', 'Luna', 'Simba', 'Milo', 'Nala', 'Oscar', 'Cleo', 'Felix', 'Loki', 'Zara']
+CODE_NAMES = ['Shadow', 'Whiskers', 'Ghost', 'Velvet', 'Claw', 'Echo', 'Nova', 'Ember', 'Frost', 'Onyx']
+COUNTRIES = ['Ukraine', 'Poland', 'Germany', 'France', 'Spain', 'Italy', 'Norway', 'Japan', 'Brazil', 'Canada']
+NOTES = ['Seen near the harbour.', 'Uses a red umbrella.', 'Changes hotels nightly.', 'Speaks four languages.', '']
+
+# Share of missions created without an agent.
+UNASSIGNED_RATIO = 0.1
+
+
+class GenerationPlan:
+    """
+    What to generate and where: row counts, the seed and the first id of each table.
+    Chunk ``n`` of a kind is always generated from ``Random(f'{seed}:{kind}:{n}')``, so the same
+    seed and chunk size give the same data whatever the number of workers.
+    """
+
+    def __init__(self, cats, missions, targets_per_mission, seed, chunk_size, breeds, first_ids):
+        self.cats = cats
+        self.missions = missions
+        self.targets_per_mission = targets_per_mission
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.breeds = sorted(breed.title() for breed in breeds)
+        self.first_cat_id, self.first_mission_id, self.first_target_id = first_ids
+
+    def chunks(self, kind):
+        total = self.cats if kind == 'cats' else self.missions
+        return [(kind, start, min(start + self.chunk_size, total)) for start in range(0, total, self.chunk_size)]
+
+    def rng(self, kind, start):
+        return random.Random(f'{self.seed}:{kind}:{start // self.chunk_size}')
+
+    def agent_index(self, mission_index):
+        # Mission i goes to cat i % cats; only the last mission of each cat may still be active.
+        return mission_index % self.cats if self.cats else None
+
+    def is_last_mission_of_agent(self, mission_index):
+        return mission_index + self.cats >= self.missions
+
+
+def build_cats(plan, start, stop):
+    rng = plan.rng('cats', start)
+    return [
+        SpyCats(
+            id=plan.first_cat_id + index,
+            name=f'{rng.choice(FIRST_NAMES)} "{rng.choice(CODE_NAMES)}" {index}',
+            breed=rng.choice(plan.breeds),
+            experience=round(rng.uniform(0, 15), 1),
+            salary=round(rng.uniform(500, 5000), 2),
+        )
+        for index in range(start, stop)
+    ]
+
+
+def target_statuses(rng, count, state):
+    if state == NOT_STARTED:
+        return [NOT_STARTED] * count
+    if state == DONE:
+        return [DONE if rng.random() < 0.7 else FAILED for _ in range(count)]
+    statuses = [rng.choice((NOT_STARTED, IN_PROGRESS, DONE, FAILED)) for _ in range(count)]
+    if count and all(status == NOT_STARTED for status in statuses):
+        statuses[0] = IN_PROGRESS
+    if count and all(status in (DONE, FAILED) for status in statuses):
+        statuses[0] = IN_PROGRESS
+    return statuses
+
+
+def build_missions(plan, start, stop):
+    rng = plan.rng('missions', start)
+    missions, targets = [], []
+    for index in range(start, stop):
+        agent_index = plan.agent_index(index)
+        if agent_index is None or rng.random() < UNASSIGNED_RATIO:
+            agent_id, state = None, NOT_STARTED
+        elif not plan.is_last_mission_of_agent(index):
+            agent_id, state = plan.first_cat_id + agent_index, DONE
+        else:
+            agent_id, state = plan.first_cat_id + agent_index, rng.choice((NOT_STARTED, IN_PROGRESS, DONE))
+
+        mission = SpyMission(id=plan.first_mission_id + index, agent_id=agent_id)
+        statuses = target_statuses(rng, plan.targets_per_mission, state)
+        mission.set_target_counts(statuses)
+        # Without targets, finished missions stay DONE
+        mission.status = SpyMission.MissionStatus.DONE if state == DONE else SpyMission.MissionStatus.NOT_STARTED
+        mission.recompute_status()
+        missions.append(mission)
+        first_target_id = plan.first_target_id + index * plan.targets_per_mission
+        targets.extend(
+            SpyTarget(
+                id=first_target_id + position,
+                mission_id=mission.id,
+                name=f'{rng.choice(FIRST_NAMES)} {rng.choice(CODE_NAMES)}',
+                country=rng.choice(COUNTRIES),
+                notes=rng.choice(NOTES),
+                status=status,
+            )
+            for position, status in enumerate(statuses)
+        )
+    return missions, targets
+
+
+def load_chunk(plan, kind, start, stop):
+    loader = default_loader()
+    with transaction.atomic():
+        if kind == 'cats':
+            cats = build_cats(plan, start, stop)
+            loader.load(SpyCats, cats)
+            return len(cats)
+        missions, targets = build_missions(plan, start, stop)
+        loader.load(SpyMission, missions)
+        loader.load(SpyTarget, targets)
+        return len(missions) + len(targets)
+
+
+def _load_chunk_task(args):
+    return load_chunk(*args)
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def next_ids():
+    return tuple(
+        (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1 for model in (SpyCats, SpyMission, SpyTarget)
+    )
+
+
+def generate(plan, workers=1, report=None):
+    """
+    Inserts the planned cats, then the missions with their targets, chunk by chunk, and moves the
+    id sequences past the generated rows. Returns the number of rows inserted and the seconds it took.
+    """
+    report = report or (lambda message: None)
+    started = time.monotonic()
+    rows = 0
+    for kind in ('cats', 'missions'):
+        tasks = [(plan, *chunk) for chunk in plan.chunks(kind)]
+        if workers > 1:
+            # Children must not share the parent's database connections.
+            connections.close_all()
+            with get_context().Pool(workers, initializer=_init_worker) as pool:
+                for count in pool.imap_unordered(_load_chunk_task, tasks):
+                    rows += count
+                    report(f"{rows} rows ({rows / (time.monotonic() - started):.0f} rows/s)")
+        else:
+            for task in tasks:
+                rows += _load_chunk_task(task)
+                report(f"{rows} rows ({rows / (time.monotonic() - started):.0f} rows/s)")
+
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [SpyCats, SpyMission, SpyTarget]):
+            cursor.execute(sql)
+    # Bulk loads bypass the incremental summary updates.
+    rebuild_summaries()
+    response_cache.invalidate('cats')
+    response_cache.invalidate('missions')
+
+    return rows, time.monotonic() - started
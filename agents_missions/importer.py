@@ -0,0 +1,320 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.db import connection, transaction
+
+from agency_stats.summaries import rebuild_summaries
+from agents_cats.models import SpyCats
+from cta_project.caching import response_cache
+from .models import SpyMission, SpyTarget, mission_status_expression
+
+STAGES = {
+    'cats': SpyCats,
+    'missions': SpyMission,
+    'targets': SpyTarget,
+}
+
+
+class RowError(Exception):
+    pass
+
+
+class ActiveMissionConflict(Exception):
+    """
+    Agents that would be left with several active missions once the statuses of the imported missions
+    are derived from their targets. ``conflicts`` maps agent ids to ``(mission id, legacy id)`` pairs.
+    """
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__('; '.join(
+            f"agent {agent_id}: missions " + ', '.join(
+                f"{pk} (legacy {legacy})" if legacy is not None else str(pk) for pk, legacy in missions
+            )
+            for agent_id, missions in conflicts.items()
+        ))
+
+
+def read_records(path):
+    """
+    Yields the records of an NDJSON or CSV (by extension) file one at a time.
+    Unparsable NDJSON lines are yielded as the ValueError raised for them.
+    """
+    with open(path, encoding='utf-8', newline='') as source:
+        if path.lower().endswith('.csv'):
+            yield from csv.DictReader(source)
+            return
+        for line in source:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+
+
+class BulkCreateLoader:
+    """
+    Portable loader: one multi-row INSERT per chunk, ids read back from the backend.
+    """
+
+    def load(self, model, objs):
+        model.objects.bulk_create(objs)
+        return [obj.pk for obj in objs]
+
+
+class CopyLoader:
+    """
+    PostgreSQL loader: missing ids are drawn from the table's sequence in one query and rows are
+    streamed with COPY ... FROM STDIN in the text format.
+    """
+
+    def load(self, model, objs):
+        if not objs:
+            return []
+        table = model._meta.db_table
+        fields = [field for field in model._meta.concrete_fields]
+        with connection.cursor() as cursor:
+            missing = [obj for obj in objs if obj.pk is None]
+            if missing:
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                    [table, len(missing)]
+                )
+                for obj, (pk,) in zip(missing, cursor.fetchall()):
+                    obj.pk = pk
+
+            buffer = io.StringIO()
+            for obj in objs:
+                buffer.write('\t'.join(
+                    self.encode(field.get_db_prep_save(field.pre_save(obj, True), connection)) for field in fields
+                ))
+                buffer.write('\n')
+            buffer.seek(0)
+
+            columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+            sql = f"COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN"
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, 'copy_expert'):
+                raw_cursor.copy_expert(sql, buffer)
+            else:
+                with raw_cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        return [obj.pk for obj in objs]
+
+    @staticmethod
+    def encode(value):
+        if value is None:
+            return '\\N'
+        return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def default_loader():
+    return CopyLoader() if connection.vendor == 'postgresql' else BulkCreateLoader()
+
+
+class Checkpoint:
+    """
+    Append-only NDJSON log of committed chunks: stage, records consumed so far, the last inserted id
+    and, for cats and missions, the legacy id -> new id pairs. Replaying it restores the id maps.
+
+    A line is written and fsynced inside the chunk's transaction, just before the commit; on resume
+    the last line is dropped if its rows are not in the database, i.e. the commit never happened.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.offsets = {}
+        self.id_maps = {'cats': {}, 'missions': {}}
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as log:
+            entries = [json.loads(line) for line in log if line.strip()]
+        if entries:
+            last = entries[-1]
+            if last['last_id'] is not None and not STAGES[last['stage']].objects.filter(pk=last['last_id']).exists():
+                entries.pop()
+        for entry in entries:
+            self.apply(entry)
+        with open(self.path, 'w', encoding='utf-8') as log:
+            log.writelines(json.dumps(entry) + '\n' for entry in entries)
+
+    def apply(self, entry):
+        self.offsets[entry['stage']] = entry['offset']
+        if entry['stage'] in self.id_maps:
+            self.id_maps[entry['stage']].update((str(legacy), new) for legacy, new in entry['ids'])
+
+    def record(self, stage, offset, ids, last_id):
+        entry = {'stage': stage, 'offset': offset, 'last_id': last_id, 'ids': ids}
+        self.apply(entry)
+        if self.path:
+            with open(self.path, 'a', encoding='utf-8') as log:
+                log.write(json.dumps(entry) + '\n')
+                log.flush()
+                os.fsync(log.fileno())
+
+
+class AgencyImporter:
+    """
+    Streams cats, missions and targets from legacy exports into the database in chunks.
+
+    Foreign keys in the input refer to legacy ids and are resolved through in-memory id maps.
+    Target counters and mission statuses are recomputed in one set-based pass at the end.
+    """
+
+    def __init__(self, breeds, chunk_size=5000, checkpoint=None, loader=None, report=None, reject=None):
+        self.breeds = breeds
+        self.chunk_size = chunk_size
+        self.checkpoint = checkpoint or Checkpoint()
+        self.loader = loader or default_loader()
+        self.report = report or (lambda message: None)
+        self.reject = reject or (lambda stage, index, record, error: None)
+        self.stats = {}
+
+    def run(self, cats=None, missions=None, targets=None):
+        self.checkpoint.load()
+        for stage, path in (('cats', cats), ('missions', missions), ('targets', targets)):
+            if path:
+                self.import_stage(stage, path)
+        self.finalize()
+        return self.stats
+
+    def import_stage(self, stage, path):
+        build = getattr(self, f'build_{stage}')
+        model = STAGES[stage]
+        offset = self.checkpoint.offsets.get(stage, 0)
+        records = islice(read_records(path), offset, None)
+        if stage == 'missions':
+            self.active_agents = set(
+                SpyMission.objects.filter(status__in=SpyMission.ACTIVE_STATUSES, agent__isnull=False)
+                .values_list('agent_id', flat=True)
+            )
+
+        loaded = rejected = 0
+        started = time.monotonic()
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            objs, legacy_ids = [], []
+            for index, record in enumerate(chunk, start=offset):
+                try:
+                    if isinstance(record, Exception):
+                        raise RowError(f"Invalid JSON: {record}")
+                    legacy_id, obj = build(record)
+                except RowError as e:
+                    rejected += 1
+                    self.reject(stage, index, record, str(e))
+                    continue
+                objs.append(obj)
+                legacy_ids.append(legacy_id)
+            offset += len(chunk)
+
+            with transaction.atomic():
+                ids = self.loader.load(model, objs)
+                pairs = [[legacy, new] for legacy, new in zip(legacy_ids, ids) if legacy is not None]
+                self.checkpoint.record(stage, offset, pairs if stage != 'targets' else [], ids[-1] if ids else None)
+            loaded += len(objs)
+
+            elapsed = time.monotonic() - started
+            self.report(f"{stage}: {offset} records read, {loaded} loaded ({loaded / elapsed if elapsed else 0:.0f} rows/s)")
+
+        elapsed = time.monotonic() - started
+        self.stats[stage] = {
+            'loaded': loaded,
+            'rejected': rejected,
+            'seconds': elapsed,
+            'rows_per_second': loaded / elapsed if elapsed else 0.0,
+        }
+
+    def build_cats(self, record):
+        name = (record.get('name') or '').strip()
+        breed = (record.get('breed') or '').strip()
+        if not name or len(name) > 100:
+            raise RowError("name: must be 1 to 100 characters.")
+        if breed.lower() not in self.breeds:
+            raise RowError(f"breed: Breed '{breed}' not found in TheCatAPI.")
+        try:
+            salary = float(record.get('salary') or 0)
+            experience = float(record.get('experience') or 0)
+        except (TypeError, ValueError):
+            raise RowError("salary/experience: A valid number is required.")
+        return record.get('id'), SpyCats(name=name, breed=breed, salary=salary, experience=experience)
+
+    def build_missions(self, record):
+        status = record.get('status') or SpyMission.MissionStatus.NOT_STARTED
+        if status not in SpyMission.MissionStatus.values:
+            raise RowError(f"status: \"{status}\" is not a valid choice.")
+        agent_id = None
+        if record.get('agent_id') not in (None, ''):
+            agent_id = self.checkpoint.id_maps['cats'].get(str(record['agent_id']))
+            if agent_id is None:
+                raise RowError(f"agent_id: Unknown legacy agent {record['agent_id']}.")
+            if status in SpyMission.ACTIVE_STATUSES:
+                if agent_id in self.active_agents:
+                    raise RowError("agent_id: This agent has already been assigned to an active mission.")
+                self.active_agents.add(agent_id)
+        return record.get('id'), SpyMission(agent_id=agent_id, status=status)
+
+    def build_targets(self, record):
+        mission_id = self.checkpoint.id_maps['missions'].get(str(record.get('mission_id')))
+        if mission_id is None:
+            raise RowError(f"mission_id: Unknown legacy mission {record.get('mission_id')}.")
+        name = (record.get('name') or '').strip()
+        country = (record.get('country') or '').strip()
+        notes = record.get('notes') or ''
+        status = record.get('status') or SpyTarget.TargetStatus.NOT_STARTED
+        if not name or len(name) > 100:
+            raise RowError("name: must be 1 to 100 characters.")
+        if not country or len(country) > 200:
+            raise RowError("country: must be 1 to 200 characters.")
+        if len(notes) > 3000:
+            raise RowError("notes: Ensure this field has no more than 3000 characters.")
+        if status not in SpyTarget.TargetStatus.values:
+            raise RowError(f"status: \"{status}\" is not a valid choice.")
+        return None, SpyTarget(mission_id=mission_id, name=name, country=country, notes=notes, status=status)
+
+    def finalize(self):
+        mission_ids = self.checkpoint.id_maps['missions'].values()
+        if mission_ids:
+            started = time.monotonic()
+            missions = SpyMission.objects.filter(id__gte=min(mission_ids), id__lte=max(mission_ids))
+            with transaction.atomic():
+                missions.rebuild_target_counts()
+                conflicts = self.active_mission_conflicts(missions)
+                if conflicts:
+                    raise ActiveMissionConflict(conflicts)
+                missions.recompute_status()
+            self.report(f"Recomputed target counters and statuses in {time.monotonic() - started:.1f}s")
+        # Bulk loads bypass the incremental summary updates.
+        started = time.monotonic()
+        rebuild_summaries()
+        self.report(f"Rebuilt agency summaries in {time.monotonic() - started:.1f}s")
+        response_cache.invalidate('cats')
+        response_cache.invalidate('missions')
+
+    def active_mission_conflicts(self, missions):
+        """
+        Checks the one-active-mission-per-agent rule against the statuses recompute_status is about to
+        write: build_missions could only check the imported ones, but targets can turn a DONE or FAILED
+        mission back to IN_PROGRESS. Expects fresh target counters.
+        """
+        derived = {'derived_status': mission_status_expression()}
+        imported_agents = missions.alias(**derived).filter(
+            agent__isnull=False, derived_status__in=SpyMission.ACTIVE_STATUSES
+        ).values('agent_id')
+        active = SpyMission.objects.alias(**derived).filter(
+            agent_id__in=imported_agents, derived_status__in=SpyMission.ACTIVE_STATUSES
+        ).order_by('agent_id', 'id').values_list('agent_id', 'id')
+        legacy_ids = {pk: legacy for legacy, pk in self.checkpoint.id_maps['missions'].items()}
+        by_agent = {}
+        for agent_id, pk in active:
+            by_agent.setdefault(agent_id, []).append((pk, legacy_ids.get(pk)))
+        return {agent_id: missions for agent_id, missions in by_agent.items() if len(missions) > 1}
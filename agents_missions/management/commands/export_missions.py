@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from agents_missions.export import EXPORT_FORMATS, export_missions
+
+
+class Command(BaseCommand):
+    help = "Stream all missions with their targets as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--output', help="File to write to, stdout by default.")
+        parser.add_argument('--chunk-size', type=int, default=settings.EXPORT_CHUNK_SIZE,
+                            help="Rows fetched from the database per round trip.")
+
+    def handle(self, *args, **options):
+        chunks = export_missions(options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
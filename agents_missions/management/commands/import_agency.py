@@ -0,0 +1,74 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from agents_cats.breeds import BreedCatalogUnavailable, breed_registry
+from agents_missions.importer import ActiveMissionConflict, AgencyImporter, BulkCreateLoader, Checkpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load cats, missions and targets from legacy NDJSON or CSV exports. "
+        "Missions refer to cats and targets to missions by their legacy ids."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cats', help="NDJSON/CSV file with id, name, breed, salary, experience.")
+        parser.add_argument('--missions', help="NDJSON/CSV file with id, agent_id, status.")
+        parser.add_argument('--targets', help="NDJSON/CSV file with mission_id, name, country, notes, status.")
+        parser.add_argument('--chunk-size', type=int, default=settings.IMPORT_CHUNK_SIZE,
+                            help="Rows loaded per transaction.")
+        parser.add_argument('--checkpoint',
+                            help="Progress log; an interrupted import rerun with the same file resumes from it.")
+        parser.add_argument('--rejects', help="File to write rejected rows to as NDJSON.")
+        parser.add_argument('--no-copy', action='store_true', help="Use bulk_create even on PostgreSQL.")
+
+    def handle(self, *args, **options):
+        if not any(options[stage] for stage in ('cats', 'missions', 'targets')):
+            raise CommandError("Nothing to import: pass --cats, --missions and/or --targets.")
+
+        try:
+            breeds = breed_registry.snapshot()
+        except BreedCatalogUnavailable as e:
+            raise CommandError(f"Cannot validate breeds: {e}")
+
+        rejects = open(options['rejects'], 'w', encoding='utf-8') if options['rejects'] else None
+
+        def reject(stage, index, record, error):
+            if rejects:
+                if isinstance(record, Exception):
+                    record = None
+                rejects.write(json.dumps({'stage': stage, 'record': index, 'error': error, 'data': record}) + '\n')
+            elif options['verbosity'] >= 2:
+                self.stderr.write(f"{stage} #{index}: {error}")
+
+        importer = AgencyImporter(
+            breeds,
+            chunk_size=options['chunk_size'],
+            checkpoint=Checkpoint(options['checkpoint']),
+            loader=BulkCreateLoader() if options['no_copy'] else None,
+            report=self.stdout.write if options['verbosity'] >= 2 else None,
+            reject=reject,
+        )
+        try:
+            stats = importer.run(cats=options['cats'], missions=options['missions'], targets=options['targets'])
+        except ActiveMissionConflict as e:
+            raise CommandError(
+                "Import loaded but not finalized (target counters, statuses and summaries were not recomputed): "
+                f"with their statuses derived from the imported targets, agents would have several active missions. {e}. "
+                "Fix these missions, then rerun the import with the same --checkpoint to finalize it."
+            )
+        except IntegrityError as e:
+            raise CommandError(f"Import aborted, the last chunk was rolled back: {e}")
+        finally:
+            if rejects:
+                rejects.close()
+
+        for stage, result in stats.items():
+            self.stdout.write(
+                f"{stage}: {result['loaded']} loaded, {result['rejected']} rejected "
+                f"in {result['seconds']:.1f}s ({result['rows_per_second']:.0f} rows/s)"
+            )
+        self.stdout.write(self.style.SUCCESS("Import finished."))
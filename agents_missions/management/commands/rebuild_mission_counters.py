@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from agents_missions.models import SpyMission
+
+
+class Command(BaseCommand):
+    help = "Verify the per-mission target status counters against the targets and rebuild the stale ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report stale counters, exit with an error if any.")
+        parser.add_argument('--all', action='store_true', help="Rebuild the counters of every mission without checking.")
+
+    def handle(self, *args, **options):
+        if options['all']:
+            rebuilt = SpyMission.objects.rebuild_target_counts()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt target counters of {rebuilt} missions."))
+            return
+
+        stale_ids = list(SpyMission.objects.with_stale_target_counts().values_list('id', flat=True))
+        if not stale_ids:
+            self.stdout.write(self.style.SUCCESS("All mission target counters are consistent."))
+            return
+
+        if options['check']:
+            preview = ', '.join(str(pk) for pk in stale_ids[:20])
+            raise CommandError(f"{len(stale_ids)} missions have stale target counters: {preview}")
+
+        rebuilt = SpyMission.objects.filter(id__in=stale_ids).rebuild_target_counts()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt target counters of {rebuilt} missions."))
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:17
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_target_counters(apps, schema_editor):
+    SpyMission = apps.get_model('agents_missions', 'SpyMission')
+    SpyTarget = apps.get_model('agents_missions', 'SpyTarget')
+    SpyMission.objects.update(**{
+        f'{status}_count': Coalesce(
+            Subquery(
+                SpyTarget.objects.filter(mission=OuterRef('pk'), status=status)
+                .order_by().values('mission').annotate(count=Count('pk')).values('count')
+            ),
+            Value(0)
+        )
+        for status in ('not_started', 'in_progress', 'done', 'failed')
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_missions', '0002_alter_spymission_agent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spymission',
+            name='done_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='spymission',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='spymission',
+            name='in_progress_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='spymission',
+            name='not_started_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='spytarget',
+            name='notes',
+            field=models.TextField(blank=True, max_length=3000),
+        ),
+        migrations.RunPython(populate_target_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_cats', '0002_catbreed'),
+        ('agents_missions', '0003_spymission_target_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='spymission',
+            index=models.Index(fields=['status', 'agent'], name='spymission_status_agent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spytarget',
+            index=models.Index(fields=['mission', 'status'], name='spytarget_mission_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='spymission',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['not_started', 'in_progress'])), fields=('agent',), name='one_active_mission_per_agent', violation_error_message='This agent has already been assigned to an active mission.'),
+        ),
+    ]
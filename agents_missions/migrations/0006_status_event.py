@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_missions', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusEvent',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('mission', 'Mission'), ('target', 'Target')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('mission_id', models.BigIntegerField()),
+                ('previous_status', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
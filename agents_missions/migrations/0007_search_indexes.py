@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+# PostgreSQL indexes of the target search (agents_missions/search.py). The full-text expression must be
+# the SEARCH_VECTOR used by the queries; it is copied here so that the migration does not change with it.
+SEARCH_INDEXES = {
+    'spytarget_search_idx': (
+        "(setweight(to_tsvector('english', name), 'A') || setweight(to_tsvector('english', notes), 'B'))"
+    ),
+    'spytarget_name_trgm_idx': 'name gin_trgm_ops',
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, expression in SEARCH_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON agents_missions_spytarget USING gin ({expression})')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_cats', '0004_search_indexes'),
+        ('agents_missions', '0006_status_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='spymission',
+            index=models.Index(fields=['status', 'id'], name='spymission_status_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spytarget',
+            index=models.Index(fields=['country', 'status'], name='spytarget_country_status_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_missions', '0007_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spymission',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='spytarget',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
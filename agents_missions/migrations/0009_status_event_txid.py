@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents_missions', '0008_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statusevent',
+            name='txid',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='statusevent',
+            index=models.Index(fields=['txid', 'seq'], name='statusevent_feed_idx'),
+        ),
+    ]
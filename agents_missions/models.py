@@ -1,8 +1,48 @@
 from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from agents_cats.models import SpyCats
 
 
+class SpyMissionQuerySet(models.QuerySet):
+    def with_live_target_counts(self):
+        return self.annotate(**{
+            f'live_{field}': Count('targets', filter=Q(targets__status=status))
+            for status, field in SpyMission.COUNTER_FIELDS.items()
+        })
+
+    def with_stale_target_counts(self):
+        live = self.with_live_target_counts()
+        mismatch = Q()
+        for field in SpyMission.COUNTER_FIELDS.values():
+            mismatch |= ~Q(**{field: F(f'live_{field}')})
+        return live.filter(mismatch)
+
+    def rebuild_target_counts(self):
+        """
+        Recomputes the target counters of every mission in the queryset with a single UPDATE.
+        """
+        return self.update(**{
+            field: Coalesce(
+                Subquery(
+                    SpyTarget.objects.filter(mission=OuterRef('pk'), status=status)
+                    .order_by().values('mission').annotate(count=Count('pk')).values('count')
+                ),
+                Value(0)
+            )
+            for status, field in SpyMission.COUNTER_FIELDS.items()
+        })
+
+    def recompute_status(self):
+        """
+        Derives the status of every mission in the queryset from its counters in a single UPDATE,
+        with mission_status_expression (the SQL form of derive_mission_status).
+        """
+        return self.update(status=mission_status_expression())
+
+
 class SpyMission(models.Model):
     class MissionStatus(models.TextChoices):
         NOT_STARTED = 'not_started', 'Not Started'
@@ -23,6 +63,83 @@ class SpyMission(models.Model):
         choices=MissionStatus.choices,
         default=MissionStatus.NOT_STARTED
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Incremented by every write of the mission or of its targets; clients send it back to detect
+    # that someone else changed the mission in between (409 Conflict, see services.check_version).
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    # Number of targets per target status, only ever changed with F-expressions (see add_target_counts).
+    not_started_count = models.PositiveIntegerField(default=0, editable=False)
+    in_progress_count = models.PositiveIntegerField(default=0, editable=False)
+    done_count = models.PositiveIntegerField(default=0, editable=False)
+    failed_count = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = {
+        'not_started': 'not_started_count',
+        'in_progress': 'in_progress_count',
+        'done': 'done_count',
+        'failed': 'failed_count',
+    }
+
+    ACTIVE_STATUSES = [MissionStatus.NOT_STARTED, MissionStatus.IN_PROGRESS]
+    ONE_ACTIVE_MISSION_CONSTRAINT = 'one_active_mission_per_agent'
+
+    objects = SpyMissionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Partial unique index: an agent may only have one NOT_STARTED or IN_PROGRESS mission.
+            models.UniqueConstraint(
+                fields=['agent'],
+                condition=Q(status__in=['not_started', 'in_progress']),
+                name='one_active_mission_per_agent',
+                violation_error_message="This agent has already been assigned to an active mission.",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'agent'], name='spymission_status_agent_idx'),
+            # ?status= pages in id order
+            models.Index(fields=['status', 'id'], name='spymission_status_id_idx'),
+        ]
+
+    @property
+    def target_counts(self):
+        return {status: getattr(self, field) for status, field in self.COUNTER_FIELDS.items()}
+
+    def set_target_counts(self, statuses):
+        for field in self.COUNTER_FIELDS.values():
+            setattr(self, field, 0)
+        self.add_target_counts(target_status_deltas((None, status) for status in statuses), save=False)
+
+    def add_target_counts(self, deltas, save=True):
+        """
+        Applies ``{status: delta}`` to the counters in memory and, with ``save``,
+        atomically in the database.
+        """
+        updates = {}
+        for status, delta in deltas.items():
+            if delta:
+                field = self.COUNTER_FIELDS[status]
+                setattr(self, field, getattr(self, field) + delta)
+                updates[field] = F(field) + delta
+        if save and updates:
+            self.updated_at = timezone.now()
+            SpyMission.objects.filter(pk=self.pk).update(updated_at=self.updated_at, **updates)
+        return updates
+
+    def recompute_status(self):
+        """Derives the status from the counters in memory (derive_mission_status)."""
+        self.status = derive_mission_status(self.target_counts, self.agent_id is not None, self.status)
+
+    def save(self, *args, **kwargs):
+        # Counters of an existing mission are written only through add_target_counts,
+        # so a plain save() never overwrites concurrent increments with stale values.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS.values()
+            ]
+        super().save(*args, **kwargs)
 
 
 class SpyTarget(models.Model):
@@ -44,4 +161,95 @@ class SpyTarget(models.Model):
         max_length=20,
         choices=TargetStatus.choices,
         default=TargetStatus.NOT_STARTED
-    )
\ No newline at end of file
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['mission', 'status'], name='spytarget_mission_status_idx'),
+            models.Index(fields=['country', 'status'], name='spytarget_country_status_idx'),
+            # Full-text and trigram indexes of the target search are PostgreSQL-only (migration 0007).
+        ]
+
+
+def is_agent_conflict(error):
+    """
+    Tells whether an IntegrityError comes from the one-active-mission-per-agent constraint.
+    PostgreSQL names the index in the message, SQLite names the indexed column.
+    """
+    message = str(error)
+    return SpyMission.ONE_ACTIVE_MISSION_CONSTRAINT in message or 'spymission.agent_id' in message
+
+
+def target_status_deltas(changes):
+    """
+    Turns ``(old_status, new_status)`` pairs into ``{status: delta}`` counter changes.
+    ``None`` on either side stands for a target being added or removed.
+    """
+    deltas = {}
+    for old, new in changes:
+        if old == new:
+            continue
+        if old is not None:
+            deltas[old] = deltas.get(old, 0) - 1
+        if new is not None:
+            deltas[new] = deltas.get(new, 0) + 1
+    return deltas
+
+
+def derive_mission_status(counts, has_agent, current):
+    """
+    The mission status rule, used for every status written by the API, the admin, the jobs and the
+    bulk loads: for an assigned mission with targets, all targets failed -> FAILED, all finished -> DONE,
+    any target touched -> IN_PROGRESS. Otherwise the ``current`` status is kept.
+    mission_status_expression is the same rule in SQL; change both together.
+    """
+    total = sum(counts.values())
+    if not has_agent or not total:
+        return current
+    if counts[SpyTarget.TargetStatus.NOT_STARTED] == 0 and counts[SpyTarget.TargetStatus.IN_PROGRESS] == 0:
+        if counts[SpyTarget.TargetStatus.DONE] == 0:
+            return SpyMission.MissionStatus.FAILED
+        return SpyMission.MissionStatus.DONE
+    if counts[SpyTarget.TargetStatus.NOT_STARTED] != total:
+        return SpyMission.MissionStatus.IN_PROGRESS
+    return current
+
+
+def mission_status_expression():
+    """derive_mission_status as an SQL expression over the counter columns of a mission."""
+    untouched = Q(in_progress_count=0, done_count=0, failed_count=0)
+    finished = Q(not_started_count=0, in_progress_count=0)
+    return Case(
+        When(Q(agent__isnull=True) | (untouched & Q(not_started_count=0)), then=F('status')),
+        When(finished & Q(done_count=0), then=Value(SpyMission.MissionStatus.FAILED)),
+        When(finished, then=Value(SpyMission.MissionStatus.DONE)),
+        When(~untouched, then=Value(SpyMission.MissionStatus.IN_PROGRESS)),
+        default=F('status'),
+    )
+
+
+class StatusEvent(models.Model):
+    """
+    Append-only log of mission and target status transitions, read by the change feed.
+    Events are appended in the transaction of the change and read in (txid, seq) order: ``txid`` is
+    the id of that transaction on PostgreSQL, 0 elsewhere (see events.py). ``seq`` identifies an event
+    and is the feed position.
+    """
+    class Kind(models.TextChoices):
+        MISSION = 'mission', 'Mission'
+        TARGET = 'target', 'Target'
+
+    seq = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    # Plain ids rather than foreign keys: the log outlives deleted missions and targets.
+    object_id = models.BigIntegerField()
+    mission_id = models.BigIntegerField()
+    previous_status = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField(auto_now_add=True)
+    txid = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['txid', 'seq'], name='statusevent_feed_idx')]
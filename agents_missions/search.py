@@ -0,0 +1,130 @@
+import math
+
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.pagination import Cursor
+
+from cta_project.pagination import IdCursorPagination
+
+# Weighted document of a target: name (A) above notes (B). The expression must stay identical to the one
+# of the spytarget_search_idx GIN index (migration 0007), otherwise PostgreSQL cannot use the index.
+SEARCH_VECTOR = "(setweight(to_tsvector('english', name), 'A') || setweight(to_tsvector('english', notes), 'B'))"
+SEARCH_QUERY = "websearch_to_tsquery('english', %s)"
+# Names also match approximately (typos, partial words) through the spytarget_name_trgm_idx index.
+NAME_MATCH = "%s <%% name"
+
+MAX_QUERY_LENGTH = 200
+# SQLite fallback: every term must appear in the name or the notes
+MAX_FALLBACK_TERMS = 10
+
+
+def search_targets(queryset, q):
+    """
+    Targets of ``queryset`` matching the search ``q``, annotated with a ``rank`` (higher is better).
+
+    On PostgreSQL, full-text search over names and notes (websearch syntax: "quoted phrases", -excluded)
+    or trigram word similarity on names, ranked by ts_rank plus similarity; both are index-backed.
+    Elsewhere, a case-insensitive substring match of every term, ranked by where the terms were found.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        matches = RawSQL(f"{SEARCH_VECTOR} @@ {SEARCH_QUERY} OR {NAME_MATCH}", [q, q], output_field=BooleanField())
+        rank = RawSQL(
+            # float8: ts_rank and word_similarity are float4, which would not compare equal to the cursor's rank
+            f"(ts_rank({SEARCH_VECTOR}, {SEARCH_QUERY}) + word_similarity(%s, name))::float8", [q, q],
+            output_field=FloatField()
+        )
+        return queryset.filter(matches).annotate(rank=rank)
+
+    matches = Q()
+    rank = Value(0.0)
+    for term in q.split()[:MAX_FALLBACK_TERMS]:
+        matches &= Q(name__icontains=term) | Q(notes__icontains=term)
+        rank += Case(When(name__icontains=term, then=Value(2.0)), default=Value(0.0)) \
+            + Case(When(notes__icontains=term, then=Value(1.0)), default=Value(0.0))
+    return queryset.filter(matches).annotate(rank=rank)
+
+
+class TargetSearchFilter(BaseFilterBackend):
+    """Applies the required ``q`` query parameter with search_targets."""
+
+    def filter_queryset(self, request, queryset, view):
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            raise ValidationError({'q': ["This query parameter is required."]})
+        if len(q) > MAX_QUERY_LENGTH:
+            raise ValidationError({'q': [f"Ensure this value has at most {MAX_QUERY_LENGTH} characters."]})
+        return search_targets(queryset, q)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': 'q',
+            'required': True,
+            'in': 'query',
+            'description': "Words to find in target names and notes (\"phrase\", -excluded word).",
+            'schema': {'type': 'string'},
+        }]
+
+
+class RankCursorPagination(IdCursorPagination):
+    """
+    Keyset pagination of search results: best rank first, ties by id. The cursor holds the (rank, id)
+    of the row a page continues from, so any number of equal ranks pages correctly, with one range
+    condition per page (CursorPagination keeps only the first ordering field and skips ties by offset).
+    """
+    ordering = ('-rank', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        if self.cursor is not None:
+            rank, pk = self.decode_position(self.cursor.position)
+            if reverse:
+                queryset = queryset.filter(Q(rank__gt=rank) | Q(rank=rank, id__lt=pk))
+            else:
+                queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__gt=pk))
+        queryset = queryset.order_by(*(('rank', '-id') if reverse else self.ordering))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+        # A cursor is only handed out towards rows that exist, so the side it came from has some.
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else self.cursor is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.encode_position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.encode_position(self.page[0])))
+
+    def encode_position(self, item):
+        rank, pk = (item['rank'], item['id']) if isinstance(item, dict) else (item.rank, item.id)
+        # repr() round-trips the float exactly, ties are compared with =
+        return f'{float(rank)!r},{pk}'
+
+    def decode_position(self, position):
+        try:
+            rank, pk = position.split(',')
+            rank, pk = float(rank), int(pk)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not math.isfinite(rank):
+            raise NotFound(self.invalid_cursor_message)
+        return rank, pk
@@ -1,13 +1,31 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
+from django.utils import timezone
+from agency_stats.summaries import mission_key, record_missions, record_targets, target_key
 from agents_cats.models import SpyCats
-from .models import SpyMission, SpyTarget
+from cta_project.caching import response_cache
+from cta_project.metrics import TimedSerializerMixin
+from .models import SpyMission, SpyTarget, is_agent_conflict, target_status_deltas
+from .events import append_events, mission_event, target_events
+from .services import apply_target_changes, check_version, lock_mission, requested_version
 
 
-class SpyTargetSerializer(serializers.ModelSerializer):
+def agent_conflict_error(error):
+    """
+    Maps a violation of the one-active-mission-per-agent constraint to the API validation error.
+    """
+    if not is_agent_conflict(error):
+        raise error
+    return serializers.ValidationError({
+        "agent_id": "This agent has already been assigned to an active mission."
+    })
+
+
+class SpyTargetSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = SpyTarget
-        fields = ['id', 'name', 'country', 'notes', 'status']
-        read_only_fields = ['id']
+        fields = ['id', 'name', 'country', 'notes', 'status', 'version']
+        read_only_fields = ['id', 'version']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -16,25 +34,75 @@ class SpyTargetSerializer(serializers.ModelSerializer):
             self.fields['country'].read_only = True
 
     def update(self, instance, validated_data):
-        if instance.mission.agent is None:
-            raise serializers.ValidationError(
-                "You cannot change the target in a mission without an agent."
-            )
+        """
+        Writes the target under its mission's row lock and moves the mission's counters, status
+        and version with it, like SpyMissionSerializer.update does for nested targets.
+        """
+        expected_version = requested_version(self.initial_data)
+        mission = instance.mission
+        try:
+            with transaction.atomic():
+                lock_mission(mission)
+                previous_status = mission.status
+                previous_key = mission_key(mission)
+                instance.refresh_from_db(fields=['notes', 'status', 'version'])
+                check_version(instance, expected_version)
+                old_status = instance.status
+                self.apply_changes(instance, validated_data)
+                instance.version += 1
+                instance.save()
+                counter_updates = mission.add_target_counts(
+                    target_status_deltas([(old_status, instance.status)]), save=False
+                )
+                mission.recompute_status()
+                mission.version += 1
+                mission.updated_at = timezone.now()
+                SpyMission.objects.filter(pk=mission.pk).update(
+                    status=mission.status, version=mission.version, updated_at=mission.updated_at,
+                    **counter_updates
+                )
+                record_missions([(previous_key, mission_key(mission))])
+                record_targets([((instance.country, old_status), target_key(instance))])
+                append_events([
+                    *target_events([instance], {instance.pk: old_status}), mission_event(mission, previous_status)
+                ])
+                response_cache.invalidate('missions', instance.mission_id)
+        except IntegrityError as e:
+            raise agent_conflict_error(e)
+        return instance
 
-        if instance.status != SpyTarget.TargetStatus.DONE and \
-           instance.mission.status != SpyMission.MissionStatus.DONE:
-            for field in ['notes', 'status']:
-                if field in validated_data:
-                    setattr(instance, field, validated_data[field])
-        else:
-            if 'status' in validated_data:
-                setattr(instance, 'status', validated_data['status'])
+    def apply_changes(self, instance, validated_data):
+        apply_target_changes(instance, instance.mission, validated_data)
 
-        instance.save()
-        return instance
 
+class TargetSearchResultSerializer(SpyTargetSerializer):
+    """Documents the rows of the target search, which are read with .values()."""
+    mission_id = serializers.IntegerField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
 
-class SpyMissionSerializer(serializers.ModelSerializer):
+    class Meta(SpyTargetSerializer.Meta):
+        fields = ['id', 'mission_id', 'name', 'country', 'notes', 'status', 'rank']
+        read_only_fields = fields
+
+
+def attach_targets(missions):
+    """
+    Read fast path: adds SpyMissionSerializer's ``targets`` to mission rows read with
+    ``.values('id', 'agent_id', 'status', 'version')``, with one query for the whole page.
+    """
+    by_id = {}
+    for mission in missions:
+        mission['targets'] = []
+        by_id[mission['id']] = mission
+    fields = SpyTargetSerializer.Meta.fields
+    targets = SpyTarget.objects.filter(mission_id__in=list(by_id)).order_by('mission_id', 'id')\
+        .values_list('mission_id', *fields)
+    for mission_id, *values in targets:
+        by_id[mission_id]['targets'].append(dict(zip(fields, values)))
+    return missions
+
+
+class SpyMissionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     targets = SpyTargetSerializer(many=True, required=False)
     agent_id = serializers.PrimaryKeyRelatedField(
         source='agent',
@@ -45,96 +113,131 @@ class SpyMissionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SpyMission
-        fields = ['id', 'agent_id', 'status', 'targets']
-        read_only_fields = ['id']
+        fields = ['id', 'agent_id', 'status', 'version', 'targets']
+        read_only_fields = ['id', 'version']
 
     def create(self, validated_data):
         targets_data = validated_data.pop('targets', [])
-        mission = SpyMission.objects.create(**validated_data)
-
-        for target_data in targets_data:
-            SpyTarget.objects.create(mission=mission, **target_data)
-
-        self.update_mission_status(mission)
+        mission, targets = self.build_mission(validated_data, targets_data)
+
+        try:
+            with transaction.atomic():
+                mission.save()
+                SpyTarget.objects.bulk_create(targets)
+                record_missions([(None, mission_key(mission))])
+                record_targets((None, target_key(target)) for target in targets)
+                response_cache.invalidate('missions', mission.pk)
+        except IntegrityError as e:
+            raise agent_conflict_error(e)
         return mission
 
-    def update(self, instance, validated_data):
-        new_agent = validated_data.get('agent', instance.agent)
-
-        if new_agent != instance.agent:
-            if instance.status != SpyMission.MissionStatus.NOT_STARTED:
-                raise serializers.ValidationError({
-                    "agent_id": "You can only change the agent for missions in NOT_STARTED status."
-                })
-
-            # Проверяем только активные миссии нового агента
-            active_missions = SpyMission.objects.filter(agent=new_agent)\
-                .exclude(id=instance.id)\
-                .exclude(status__in=[SpyMission.MissionStatus.DONE, SpyMission.MissionStatus.FAILED])
-            if active_missions.exists():
-                raise serializers.ValidationError({
-                    "agent_id": "This agent has already been assigned to an active mission."
-                })
-
-            instance.agent = new_agent
-
-        if instance.agent is not None:
-            instance.status = validated_data.get('status', instance.status)
-        else:
-            if 'status' in validated_data:
-                raise serializers.ValidationError(
-                    "You cannot change the status of a mission without an agent."
-                )
-
-        instance.save()
+    def build_mission(self, validated_data, targets_data):
+        """
+        Builds an unsaved mission and its targets, with the initial status derived from the targets.
+        """
+        mission = SpyMission(**validated_data)
+        targets = [SpyTarget(mission=mission, **target_data) for target_data in targets_data]
+        mission.set_target_counts(target.status for target in targets)
+        mission.recompute_status()
+        return mission, targets
 
+    def update(self, instance, validated_data):
+        """
+        Writes the change under the mission's row lock (services.lock_mission): the checks below and
+        the new counters, status and version are computed from the committed state of the mission.
+        A ``version`` in the request (of the mission or of a target) must match it, or 409 Conflict.
+        """
+        expected_version = requested_version(self.initial_data)
         targets_data = self.initial_data.get('targets')
-        if targets_data is not None:
-            if instance.agent is None:
-                raise serializers.ValidationError(
-                    "You cannot update mission targets without an agent."
+        status_events = []
+        try:
+            with transaction.atomic():
+                lock_mission(instance)
+                check_version(instance, expected_version)
+                previous_status = instance.status
+                previous_key = mission_key(instance)
+
+                if 'agent' in validated_data:
+                    new_agent = validated_data['agent']
+                    if (new_agent.pk if new_agent else None) != instance.agent_id:
+                        if instance.status != SpyMission.MissionStatus.NOT_STARTED:
+                            raise serializers.ValidationError({
+                                "agent_id": "You can only change the agent for missions in NOT_STARTED status."
+                            })
+
+                        # Занятость нового агента проверяет constraint one_active_mission_per_agent при сохранении
+                        instance.agent = new_agent
+
+                if instance.agent_id is None and 'status' in validated_data:
+                    raise serializers.ValidationError(
+                        "You cannot change the status of a mission without an agent."
+                    )
+                instance.status = validated_data.get('status', instance.status)
+
+                counter_updates = {}
+                if targets_data is not None:
+                    if instance.agent_id is None:
+                        raise serializers.ValidationError(
+                            "You cannot update mission targets without an agent."
+                        )
+                    deltas, status_events = self.update_targets(instance, targets_data)
+                    counter_updates = instance.add_target_counts(deltas, save=False)
+
+                instance.recompute_status()
+                instance.version += 1
+                instance.updated_at = timezone.now()
+                SpyMission.objects.filter(pk=instance.pk).update(
+                    agent_id=instance.agent_id, status=instance.status, version=instance.version,
+                    updated_at=instance.updated_at, **counter_updates
                 )
-
-            for target_data in targets_data:
-                target_id = target_data.get('id')
-                if not target_id:
-                    continue
-                try:
-                    target = instance.targets.get(id=target_id)
-                except SpyTarget.DoesNotExist:
-                    continue
-
-                serializer = SpyTargetSerializer(
-                    instance=target,
-                    data=target_data,
-                    partial=True,
-                    context=self.context
-                )
-                serializer.is_valid(raise_exception=True)
-                serializer.save()
-
-        self.update_mission_status(instance)
+                record_missions([(previous_key, mission_key(instance))])
+                append_events([*status_events, mission_event(instance, previous_status)])
+                response_cache.invalidate('missions', instance.pk)
+        except IntegrityError as e:
+            raise agent_conflict_error(e)
         return instance
 
-    def update_mission_status(self, mission):
-        if mission.agent is None:
-            return
-
-        targets = mission.targets.all()
-        if not targets:
-            return
-
-        statuses = [t.status for t in targets]
-
-        if mission.status == SpyMission.MissionStatus.NOT_STARTED and \
-           any(s != SpyTarget.TargetStatus.NOT_STARTED for s in statuses):
-            mission.status = SpyMission.MissionStatus.IN_PROGRESS
-            mission.save()
-            return
-
-        if all(s == SpyTarget.TargetStatus.FAILED for s in statuses):
-            mission.status = SpyMission.MissionStatus.FAILED
-        elif all(s in [SpyTarget.TargetStatus.DONE, SpyTarget.TargetStatus.FAILED] for s in statuses):
-            mission.status = SpyMission.MissionStatus.DONE
+    def update_targets(self, mission, targets_data):
+        """
+        Validates and writes all target changes of a mission with one SELECT and one bulk UPDATE.
+        Runs under the mission's row lock, so the targets read here are current.
+        Returns the resulting ``{status: delta}`` changes of the mission's target counters
+        and the status events of the changed targets.
+        """
+        target_ids = []
+        for target_data in targets_data:
+            try:
+                target_ids.append(int(target_data.get('id')))
+            except (TypeError, ValueError):
+                continue
+        targets_by_id = mission.targets.in_bulk(target_ids)
+        changed = {}
+        old_statuses = {}
 
-        mission.save()
+        for target_data in targets_data:
+            try:
+                target = targets_by_id.get(int(target_data.get('id')))
+            except (TypeError, ValueError):
+                continue
+            if target is None:
+                continue
+
+            serializer = SpyTargetSerializer(
+                instance=target,
+                data=target_data,
+                partial=True,
+                context=self.context
+            )
+            serializer.is_valid(raise_exception=True)
+            if target.id not in changed:
+                check_version(target, requested_version(target_data))
+                target.version += 1
+            old_statuses.setdefault(target.id, target.status)
+            serializer.apply_changes(target, serializer.validated_data)
+            target.updated_at = timezone.now()
+            changed[target.id] = target
+
+        SpyTarget.objects.bulk_update(changed.values(), ['notes', 'status', 'version', 'updated_at'])
+        record_targets(((target.country, old_statuses[pk]), target_key(target)) for pk, target in changed.items())
+        deltas = target_status_deltas((old_statuses[pk], target.status) for pk, target in changed.items())
+        return deltas, target_events(changed.values(), old_statuses)
@@ -0,0 +1,147 @@
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from agency_stats.summaries import mission_key, record_missions, record_targets, target_key
+from cta_project.caching import response_cache
+from .events import append_events, mission_event, target_events
+from .models import SpyMission, SpyTarget, target_status_deltas
+
+
+# State of a mission read back under its row lock (see lock_mission)
+LOCKED_FIELDS = ['agent_id', 'status', 'version', *SpyMission.COUNTER_FIELDS.values()]
+
+
+class VersionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "This resource was changed by another request; reload it and retry."
+    default_code = 'conflict'
+
+
+def requested_version(data):
+    """The ``version`` a client based its change on, ``None`` when it did not send one."""
+    version = data.get('version') if isinstance(data, dict) else None
+    if version is None:
+        return None
+    if isinstance(version, bool) or not isinstance(version, int):
+        raise serializers.ValidationError({'version': ["A valid integer is required."]})
+    return version
+
+
+def check_version(obj, expected):
+    """Raises VersionConflict when ``obj`` is no longer at the ``expected`` version (None: no check)."""
+    if expected is not None and expected != obj.version:
+        raise VersionConflict(
+            f"{obj._meta.verbose_name.capitalize()} {obj.pk} is at version {obj.version}, not {expected}: "
+            "it was changed by another request; reload it and retry."
+        )
+
+
+def lock_mission(mission, keep=()):
+    """
+    Locks the row of an existing mission until the end of the transaction (SELECT ... FOR UPDATE) and
+    copies its committed state (LOCKED_FIELDS but ``keep``) onto ``mission``. Returns that state.
+
+    Only writers of the same mission wait for each other, and each one then starts from what the
+    previous one committed: counters, status and versions computed under the lock are exact.
+    Call it first in the transaction, before reading the mission's targets.
+    """
+    state = SpyMission.objects.select_for_update().values(*LOCKED_FIELDS).get(pk=mission.pk)
+    for field, value in state.items():
+        if field not in keep:
+            setattr(mission, field, value)
+    return state
+
+
+def apply_target_changes(target, mission, changes):
+    """
+    Applies ``changes`` (``notes`` and/or ``status``) to an existing target of ``mission`` in memory,
+    following the API rules: targets of a mission without an agent cannot change, and the notes of a
+    finished target or of a finished mission are frozen.
+    """
+    if mission.agent_id is None:
+        raise serializers.ValidationError(
+            "You cannot change the target in a mission without an agent."
+        )
+
+    if target.status != SpyTarget.TargetStatus.DONE and \
+       mission.status != SpyMission.MissionStatus.DONE:
+        for field in ['notes', 'status']:
+            if field in changes:
+                setattr(target, field, changes[field])
+    else:
+        if 'status' in changes:
+            setattr(target, 'status', changes['status'])
+
+
+def save_mission(mission, new_targets=(), changed_targets=(), deleted_targets=(), expected_version=None):
+    """
+    Writes a mission together with its target changes in one transaction: one INSERT or UPDATE of the
+    mission (counters, status and version included), one bulk INSERT, one bulk UPDATE and one DELETE of
+    targets, the status events of an existing mission and its changed targets, and the agency summaries.
+    ``changed_targets`` and ``deleted_targets`` are existing targets.
+
+    An existing mission is locked first (lock_mission) and the previous statuses of its targets are read
+    under that lock, so the counters stay exact whatever was committed since the form was loaded.
+    ``expected_version`` is the version the change was based on: VersionConflict if it moved since.
+    """
+    with transaction.atomic():
+        previous_status = previous_key = None
+        old_statuses = {}
+        if mission._state.adding:
+            mission.set_target_counts(target.status for target in new_targets)
+            mission.recompute_status()
+            mission.save()
+        else:
+            # The posted agent replaces the stored one.
+            previous = lock_mission(mission, keep=['agent_id'])
+            check_version(mission, expected_version)
+            previous_status = previous['status']
+            previous_key = (previous_status, previous['agent_id'] is not None)
+
+            stored = SpyTarget.objects.filter(
+                mission=mission, pk__in=[target.pk for target in [*changed_targets, *deleted_targets]]
+            ).values_list('pk', 'status', 'version')
+            versions = {}
+            for pk, target_status, version in stored:
+                old_statuses[pk], versions[pk] = target_status, version
+            # Targets deleted in the meantime are left alone.
+            changed_targets = [target for target in changed_targets if target.pk in old_statuses]
+            deleted_targets = [target for target in deleted_targets if target.pk in old_statuses]
+            for target in changed_targets:
+                target.version = versions[target.pk] + 1
+
+        changes = [(None, target.status) for target in new_targets]
+        changes += [(old_statuses[target.pk], target.status) for target in changed_targets]
+        changes += [(old_statuses[target.pk], None) for target in deleted_targets]
+        summary_changes = [(None, target_key(target)) for target in new_targets]
+        summary_changes += [((target.country, old_statuses[target.pk]), target_key(target)) for target in changed_targets]
+        summary_changes += [((target.country, old_statuses[target.pk]), None) for target in deleted_targets]
+
+        if previous_status is not None:
+            counter_updates = mission.add_target_counts(target_status_deltas(changes), save=False)
+            mission.recompute_status()
+            mission.version += 1
+            mission.updated_at = timezone.now()
+            # Counters move with F-expressions (see SpyMission.add_target_counts), the rest is overwritten.
+            SpyMission.objects.filter(pk=mission.pk).update(
+                agent=mission.agent, status=mission.status, version=mission.version,
+                updated_at=mission.updated_at, **counter_updates
+            )
+
+        now = timezone.now()
+        for target in new_targets:
+            target.mission = mission
+        SpyTarget.objects.bulk_create(new_targets)
+        for target in changed_targets:
+            target.updated_at = now
+        SpyTarget.objects.bulk_update(changed_targets, ['notes', 'status', 'version', 'updated_at'])
+        if deleted_targets:
+            SpyTarget.objects.filter(pk__in=[target.pk for target in deleted_targets]).delete()
+        record_missions([(previous_key, mission_key(mission))])
+        record_targets(summary_changes)
+        if previous_status is not None:
+            append_events([*target_events(changed_targets, old_statuses), mission_event(mission, previous_status)])
+        response_cache.invalidate('missions', mission.pk)
+    return mission
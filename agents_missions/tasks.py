@@ -0,0 +1,64 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from agency_stats.summaries import mission_key, record_missions
+from cta_project.caching import response_cache
+from jobs.queue import task
+from .events import append_events, mission_event
+from .models import SpyMission, SpyTarget
+from .services import lock_mission
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_MISSION = 'missions.reconcile'
+RECONCILE_STALE_MISSIONS = 'missions.reconcile_stale'
+
+
+@task(RECONCILE_MISSION)
+def reconcile_mission(mission_id):
+    """
+    Recounts the targets of a mission under its row lock and, if its counters drifted from them
+    (a write that bypassed the API, a restore...), repairs the counters and recomputes the status.
+    Returns whether the mission was repaired.
+    """
+    with transaction.atomic():
+        mission = SpyMission(pk=mission_id)
+        try:
+            previous = lock_mission(mission)
+        except SpyMission.DoesNotExist:
+            return False
+        counts = dict.fromkeys(SpyMission.COUNTER_FIELDS, 0)
+        counts.update(
+            SpyTarget.objects.filter(mission_id=mission_id).order_by().values_list('status').annotate(Count('pk'))
+        )
+        if counts == mission.target_counts:
+            return False
+
+        for status, count in counts.items():
+            setattr(mission, SpyMission.COUNTER_FIELDS[status], count)
+        mission.recompute_status()
+        mission.version += 1
+        SpyMission.objects.filter(pk=mission_id).update(
+            status=mission.status, version=mission.version, updated_at=timezone.now(),
+            **{field: getattr(mission, field) for field in SpyMission.COUNTER_FIELDS.values()}
+        )
+        record_missions([((previous['status'], previous['agent_id'] is not None), mission_key(mission))])
+        append_events([mission_event(mission, previous['status'])])
+        # Reaches the ETags of the web processes only with a shared RESPONSE_CACHE_BACKEND.
+        response_cache.invalidate('missions', mission_id)
+    logger.warning("Repaired the target counters of mission %s: %s", mission_id, counts)
+    return True
+
+
+@task(RECONCILE_STALE_MISSIONS, every='MISSION_RECONCILE_INTERVAL')
+def reconcile_stale_missions():
+    """
+    Periodic sweep: finds the missions whose counters differ from their targets in one query and
+    repairs each of them (reconcile_mission). API and admin writes keep the counters exact, so
+    drift only comes from writes that bypassed them. Returns the number of repaired missions.
+    """
+    stale = SpyMission.objects.with_stale_target_counts().values_list('id', flat=True)
+    return sum(reconcile_mission(mission_id) for mission_id in list(stale))
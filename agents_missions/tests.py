@@ -1,3 +1,1246 @@
-from django.test import TestCase
+import asyncio
+import csv
+import itertools
+import json
+import os
+import tempfile
+from importlib import import_module
+from datetime import datetime, timezone
+from io import StringIO
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django import forms
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth import get_user_model
+from django.core.management import call_command, CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from agents_cats.breeds import breed_registry
+from agents_cats.models import SpyCats
+from jobs.models import Job
+from cta_project.caching import response_cache
+from cta_project.pagination import IdCursorPagination
+from cta_project.testing import QueryBudgetMixin
+from .admin import SpyMissionAdminForm
+from .events import append_events, broker, last_seq, read_events
+from .export import iter_missions
+from .search import SEARCH_VECTOR
+from .models import SpyMission, SpyTarget, StatusEvent, derive_mission_status
+from .serializers import SpyMissionSerializer, SpyTargetSerializer
+from .tasks import reconcile_mission, reconcile_stale_missions
+from .views import SpyMissionViewSet
+from cta_project.metrics import REQUEST_DURATION
+from cta_project.renderers import FastJSONRenderer
+
+NOT_STARTED = SpyTarget.TargetStatus.NOT_STARTED
+IN_PROGRESS = SpyTarget.TargetStatus.IN_PROGRESS
+DONE = SpyTarget.TargetStatus.DONE
+FAILED = SpyTarget.TargetStatus.FAILED
+
+
+def create_mission(agent=None, targets=1, **kwargs):
+    mission = SpyMission(agent=agent, **kwargs)
+    mission_targets = [SpyTarget(mission=mission, name=f'Target {i}', country='UA') for i in range(targets)]
+    mission.set_target_counts(target.status for target in mission_targets)
+    mission.save()
+    SpyTarget.objects.bulk_create(mission_targets)
+    return mission
+
+
+class SpyMissionTargetUpdateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+
+    def patch_targets(self, mission, targets_data):
+        return self.client.patch(
+            f'/api/missions/spy-missions/{mission.id}/', {'targets': targets_data}, format='json'
+        )
+
+    def test_target_updates_recompute_mission_status(self):
+        mission = create_mission(self.agent, targets=2)
+        first, second = mission.targets.order_by('id')
+
+        response = self.patch_targets(mission, [{'id': first.id, 'status': IN_PROGRESS, 'notes': 'Seen'}])
+        self.assertEqual(response.status_code, 200)
+        mission.refresh_from_db()
+        self.assertEqual(mission.status, SpyMission.MissionStatus.IN_PROGRESS)
+
+        response = self.patch_targets(mission, [{'id': first.id, 'status': DONE}, {'id': second.id, 'status': FAILED}])
+        self.assertEqual(response.status_code, 200)
+        mission.refresh_from_db()
+        self.assertEqual(mission.status, SpyMission.MissionStatus.DONE)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.notes), (DONE, 'Seen'))
+
+    def test_single_target_update_recomputes_mission_status(self):
+        mission = create_mission(self.agent, targets=2)
+        first, second = mission.targets.order_by('id')
+
+        for target, status in [(first, DONE), (second, DONE)]:
+            serializer = SpyTargetSerializer(target, data={'status': status}, partial=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        mission.refresh_from_db()
+        self.assertEqual((mission.status, mission.version), (SpyMission.MissionStatus.DONE, 3))
+        self.assertEqual(mission.target_counts, {NOT_STARTED: 0, IN_PROGRESS: 0, DONE: 2, FAILED: 0})
+        self.assertEqual(
+            list(StatusEvent.objects.filter(kind='mission').values_list('previous_status', 'status')),
+            [(NOT_STARTED, IN_PROGRESS), (IN_PROGRESS, DONE)],
+        )
+
+    def test_invalid_target_rolls_back_whole_update(self):
+        mission = create_mission(self.agent, targets=2)
+        first, second = mission.targets.order_by('id')
+
+        response = self.patch_targets(mission, [{'id': first.id, 'status': DONE}, {'id': second.id, 'status': 'lost'}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(mission.targets.values_list('status', flat=True)), {NOT_STARTED})
+
+    def test_targets_cannot_be_updated_without_agent(self):
+        mission = create_mission()
+        target = mission.targets.get()
+
+        response = self.patch_targets(mission, [{'id': target.id, 'status': DONE}])
+
+        self.assertEqual(response.status_code, 400)
+        target.refresh_from_db()
+        self.assertEqual(target.status, NOT_STARTED)
+
+    def test_update_query_count_is_constant_in_targets(self):
+        counts = []
+        for size in (2, 40):
+            agent = SpyCats.objects.create(name=f'Agent {size}', breed='Bengal')
+            mission = create_mission(agent, targets=size)
+            targets_data = [{'id': pk, 'status': IN_PROGRESS} for pk in mission.targets.values_list('id', flat=True)]
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.patch_targets(mission, targets_data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(set(mission.targets.values_list('status', flat=True)), {IN_PROGRESS})
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_target_counters_follow_status_changes(self):
+        mission = create_mission(self.agent, targets=3)
+        first, second, third = mission.targets.order_by('id')
+
+        self.patch_targets(mission, [{'id': first.id, 'status': DONE}, {'id': second.id, 'status': IN_PROGRESS}])
+        self.patch_targets(mission, [{'id': second.id, 'status': FAILED}])
+
+        mission.refresh_from_db()
+        self.assertEqual(mission.target_counts, {NOT_STARTED: 1, IN_PROGRESS: 0, DONE: 1, FAILED: 1})
+        self.assertFalse(SpyMission.objects.with_stale_target_counts().exists())
+
+    def test_plain_save_does_not_overwrite_counters(self):
+        mission = create_mission(self.agent, targets=2)
+        stale = SpyMission.objects.get(pk=mission.pk)
+        mission.add_target_counts({NOT_STARTED: -1, DONE: 1})
+
+        stale.save()
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.done_count, 1)
+
+
+class OneActiveMissionPerAgentTests(TestCase):
+    url = '/api/missions/spy-missions/'
+    conflict = "This agent has already been assigned to an active mission."
+
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        self.active = create_mission(self.agent)
+
+    def test_assigning_busy_agent_is_rejected(self):
+        mission = create_mission()
+
+        response = self.client.patch(f'{self.url}{mission.id}/', {'agent_id': self.agent.id}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(str(response.data['agent_id']), self.conflict)
+        mission.refresh_from_db()
+        self.assertIsNone(mission.agent_id)
+
+    def test_creating_mission_for_busy_agent_is_rejected(self):
+        response = self.client.post(self.url, {'agent_id': self.agent.id}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(str(response.data['agent_id']), self.conflict)
+
+    def test_agent_is_free_once_mission_is_finished(self):
+        SpyMission.objects.filter(pk=self.active.pk).update(status=SpyMission.MissionStatus.DONE)
+
+        response = self.client.post(self.url, {'agent_id': self.agent.id}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_bulk_create_reports_conflicts_per_row(self):
+        free_agent = SpyCats.objects.create(name='Luna', breed='Siamese')
+
+        response = self.client.post(f'{self.url}bulk/', [
+            {'agent_id': self.agent.id},
+            {'agent_id': free_agent.id},
+            {'agent_id': free_agent.id},
+            {},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 2])
+
+    def test_admin_form_validates_constraint_on_read_only_status(self):
+        form_class = forms.modelform_factory(SpyMission, form=SpyMissionAdminForm, fields=['agent'])
+
+        form = form_class(data={'agent': self.agent.id})
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), [self.conflict])
+
+
+class SpyMissionAdminTests(TestCase):
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        self.agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+
+    def inline_data(self, targets, initial=0):
+        data = {
+            'targets-TOTAL_FORMS': len(targets),
+            'targets-INITIAL_FORMS': initial,
+            'targets-MIN_NUM_FORMS': 0,
+            'targets-MAX_NUM_FORMS': 1000,
+        }
+        for index, target in enumerate(targets):
+            data.update({f'targets-{index}-{field}': value for field, value in target.items()})
+        return data
+
+    def test_admin_saves_keep_counters_and_status(self):
+        data = self.inline_data([
+            {'name': 'Target 1', 'country': 'UA', 'notes': ''},
+            {'name': 'Target 2', 'country': 'PL', 'notes': ''},
+        ])
+        response = self.client.post('/admin/agents_missions/spymission/add/', {'agent': self.agent.id, **data})
+        self.assertEqual(response.status_code, 302)
+        mission = SpyMission.objects.get()
+        self.assertEqual(mission.not_started_count, 2)
+
+        first, second = mission.targets.order_by('id')
+        data = self.inline_data([
+            {'id': first.id, 'mission': mission.id, 'notes': 'Seen', 'status': DONE},
+            {'id': second.id, 'mission': mission.id, 'notes': '', 'status': IN_PROGRESS},
+        ], initial=2)
+        response = self.client.post(f'/admin/agents_missions/spymission/{mission.id}/change/', {'agent': self.agent.id, **data})
+        self.assertEqual(response.status_code, 302)
+
+        mission.refresh_from_db()
+        self.assertEqual(mission.target_counts, {NOT_STARTED: 0, IN_PROGRESS: 1, DONE: 1, FAILED: 0})
+        self.assertEqual(mission.status, SpyMission.MissionStatus.IN_PROGRESS)
+
+    def change_targets(self, mission, changes):
+        targets = list(mission.targets.order_by('id'))
+        data = self.inline_data([
+            {'id': target.id, 'mission': mission.id, 'notes': target.notes, **changes.get(target.id, {})}
+            for target in targets
+        ], initial=len(targets))
+        return self.client.post(f'/admin/agents_missions/spymission/{mission.id}/change/', {'agent': self.agent.id, **data})
+
+    def test_admin_save_writes_targets_in_one_pass(self):
+        mission = create_mission(agent=self.agent, targets=20)
+        ids = list(mission.targets.values_list('id', flat=True))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.change_targets(mission, {pk: {'status': FAILED} for pk in ids})
+
+        self.assertEqual(response.status_code, 302)
+        writes = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len([sql for sql in writes if 'agents_missions_spytarget' in sql]), 1)
+        self.assertEqual(len([sql for sql in writes if 'agents_missions_spymission' in sql]), 1)
+        mission.refresh_from_db()
+        self.assertEqual(mission.target_counts, {NOT_STARTED: 0, IN_PROGRESS: 0, DONE: 0, FAILED: 20})
+        self.assertEqual(mission.status, SpyMission.MissionStatus.FAILED)
+        self.assertEqual(StatusEvent.objects.filter(kind='target', status=FAILED).count(), 20)
+        self.assertTrue(StatusEvent.objects.filter(kind='mission', object_id=mission.id, status=FAILED).exists())
+
+    def test_admin_save_queries_do_not_grow_with_targets(self):
+        counts = []
+        for size in (2, 20):
+            agent = SpyCats.objects.create(name=f'Agent {size}', breed='Bengal')
+            mission = create_mission(agent=agent, targets=size)
+            self.agent = agent
+            ids = mission.targets.values_list('id', flat=True)
+            with CaptureQueriesContext(connection) as queries:
+                self.change_targets(mission, {pk: {'status': IN_PROGRESS} for pk in ids})
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_admin_follows_api_rules_for_finished_targets(self):
+        mission = create_mission(agent=self.agent, targets=2)
+        first, second = mission.targets.order_by('id')
+        SpyTarget.objects.filter(pk=first.pk).update(status=DONE, notes='Original')
+        mission.add_target_counts({NOT_STARTED: -1, DONE: 1})
+
+        response = self.change_targets(mission, {
+            first.id: {'notes': 'Rewritten', 'status': DONE},
+            second.id: {'notes': 'Seen', 'status': IN_PROGRESS},
+        })
+
+        self.assertEqual(response.status_code, 302)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.notes, 'Original')
+        self.assertEqual(second.notes, 'Seen')
+        self.assertEqual(SpyMission.objects.get(pk=mission.pk).status, SpyMission.MissionStatus.IN_PROGRESS)
+
+
+class SpyMissionVersionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        self.mission = create_mission(self.agent, targets=2)
+        self.url = f'/api/missions/spy-missions/{self.mission.id}/'
+        self.first, self.second = self.mission.targets.order_by('id')
+
+    def test_every_write_bumps_the_versions(self):
+        response = self.client.patch(self.url, {'version': 1, 'targets': [
+            {'id': self.first.id, 'version': 1, 'status': IN_PROGRESS},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 2)
+        self.assertEqual([target['version'] for target in response.data['targets']], [2, 1])
+        self.assertEqual(self.client.get(self.url).data, response.data)
+        self.client.patch(self.url, {'targets': [{'id': self.second.id, 'notes': 'Seen'}]}, format='json')
+        self.assertEqual(SpyMission.objects.get(pk=self.mission.pk).version, 3)
+
+    def test_stale_mission_version_is_a_conflict(self):
+        self.client.patch(self.url, {'targets': [{'id': self.first.id, 'status': IN_PROGRESS}]}, format='json')
+
+        response = self.client.patch(self.url, {'version': 1, 'targets': [
+            {'id': self.second.id, 'status': DONE},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('version 2, not 1', str(response.data['detail']))
+        self.second.refresh_from_db()
+        self.assertEqual((self.second.status, self.second.version), (NOT_STARTED, 1))
+
+    def test_stale_target_version_rolls_back_the_update(self):
+        SpyTarget.objects.filter(pk=self.second.pk).update(version=5)
+
+        response = self.client.patch(self.url, {'targets': [
+            {'id': self.first.id, 'version': 1, 'status': DONE},
+            {'id': self.second.id, 'version': 4, 'status': DONE},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(set(self.mission.targets.values_list('status', flat=True)), {NOT_STARTED})
+        self.assertEqual(SpyMission.objects.get(pk=self.mission.pk).version, 1)
+
+    def test_invalid_version_is_rejected(self):
+        response = self.client.patch(self.url, {'version': '1'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('version', response.data)
+
+    def test_updates_start_from_the_committed_state(self):
+        # Another writer committed after this instance was loaded.
+        stale = SpyMission.objects.get(pk=self.mission.pk)
+        SpyTarget.objects.filter(pk=self.first.pk).update(status=DONE)
+        SpyMission.objects.filter(pk=self.mission.pk).update(
+            status=SpyMission.MissionStatus.IN_PROGRESS, not_started_count=1, done_count=1, version=2
+        )
+
+        serializer = SpyMissionSerializer(
+            stale, data={'targets': [{'id': self.second.id, 'status': FAILED}]}, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        mission = SpyMission.objects.get(pk=self.mission.pk)
+        self.assertEqual(mission.target_counts, {NOT_STARTED: 0, IN_PROGRESS: 0, DONE: 1, FAILED: 1})
+        self.assertEqual((mission.status, mission.version), (SpyMission.MissionStatus.DONE, 3))
+
+    def test_admin_reports_stale_version(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        change_url = f'/admin/agents_missions/spymission/{self.mission.id}/change/'
+        self.assertContains(self.client.get(change_url), 'name="base_version" value="1"')
+        SpyMission.objects.filter(pk=self.mission.pk).update(version=2)
+
+        response = self.client.post(change_url, {
+            'agent': self.agent.id, 'base_version': 1,
+            'targets-TOTAL_FORMS': 2, 'targets-INITIAL_FORMS': 2,
+            'targets-MIN_NUM_FORMS': 0, 'targets-MAX_NUM_FORMS': 1000,
+            'targets-0-id': self.first.id, 'targets-0-mission': self.mission.id, 'targets-0-notes': '',
+            'targets-0-status': DONE,
+            'targets-1-id': self.second.id, 'targets-1-mission': self.mission.id, 'targets-1-notes': '',
+            'targets-1-status': NOT_STARTED,
+        })
+
+        # The form is shown again with the error, nothing is reported as saved.
+        self.assertContains(response, 'Миссию изменили в другом окне')
+        self.assertNotContains(response, 'was changed successfully')
+        self.assertFalse(LogEntry.objects.exists())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, NOT_STARTED)
+        self.assertEqual(SpyMission.objects.get(pk=self.mission.pk).version, 2)
+
+    def test_admin_agent_conflict_on_save_rolls_back_the_view(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        change_url = f'/admin/agents_missions/spymission/{self.mission.id}/change/'
+        conflict = IntegrityError(f'duplicate key value violates unique constraint "{SpyMission.ONE_ACTIVE_MISSION_CONSTRAINT}"')
+
+        with mock.patch('agents_missions.admin.save_mission', side_effect=conflict):
+            response = self.client.post(change_url, {
+                'agent': self.agent.id, 'base_version': 1,
+                'targets-TOTAL_FORMS': 0, 'targets-INITIAL_FORMS': 0,
+                'targets-MIN_NUM_FORMS': 0, 'targets-MAX_NUM_FORMS': 1000,
+            }, follow=True)
+
+        self.assertContains(response, 'Этот агент уже назначен на активную миссию')
+        self.assertNotContains(response, 'was changed successfully')
+        self.assertFalse(LogEntry.objects.exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', "Concurrent writers need PostgreSQL row locks")
+class ConcurrentOptimisticUpdateTests(TransactionTestCase):
+    threads = 8
+    increments = 5
+
+    def test_retried_conflicts_lose_no_update(self):
+        agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        mission = create_mission(agent, targets=1)
+        target = mission.targets.get()
+        url = f'/api/missions/spy-missions/{mission.id}/'
+        conflicts = []
+
+        def increment():
+            # Read-modify-write of the notes, retried on 409 with the fresh version.
+            client = APIClient()
+            try:
+                for _ in range(self.increments):
+                    while True:
+                        current = client.get(url).data['targets'][0]
+                        response = client.patch(url, {'targets': [{
+                            'id': target.id, 'version': current['version'],
+                            'notes': str(int(current['notes'] or 0) + 1),
+                        }]}, format='json')
+                        if response.status_code != 409:
+                            break
+                        conflicts.append(1)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=increment) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        target.refresh_from_db()
+        total = self.threads * self.increments
+        self.assertEqual((target.notes, target.version), (str(total), total + 1))
+        self.assertEqual(SpyMission.objects.get(pk=mission.pk).version, total + 1)
+
+
+class ReconcileMissionTests(TestCase):
+    def setUp(self):
+        self.agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        self.mission = create_mission(self.agent, targets=2)
+
+    def test_repairs_drifted_counters_and_status(self):
+        # A write that bypassed the counters
+        self.mission.targets.update(status=DONE)
+
+        with self.assertLogs('agents_missions.tasks', 'WARNING'):
+            self.assertTrue(reconcile_mission(self.mission.id))
+
+        mission = SpyMission.objects.get(pk=self.mission.pk)
+        self.assertEqual(mission.target_counts, {NOT_STARTED: 0, IN_PROGRESS: 0, DONE: 2, FAILED: 0})
+        self.assertEqual((mission.status, mission.version), (SpyMission.MissionStatus.DONE, 2))
+        self.assertTrue(StatusEvent.objects.filter(kind='mission', object_id=mission.id, status=DONE).exists())
+        self.assertFalse(reconcile_mission(self.mission.id))
+        self.assertFalse(reconcile_mission(0))
+
+    def test_writes_queue_no_job_and_the_sweep_repairs_drift(self):
+        url = f'/api/missions/spy-missions/{self.mission.id}/'
+        first, second = self.mission.targets.order_by('id')
+        other = create_mission(SpyCats.objects.create(name='Kit', breed='Bengal'), targets=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            APIClient().patch(url, {'targets': [{'id': first.id, 'status': IN_PROGRESS}]}, format='json')
+        self.assertFalse(Job.objects.exists())
+
+        other.targets.update(status=FAILED)
+        with self.assertLogs('agents_missions.tasks', 'WARNING'):
+            self.assertEqual(reconcile_stale_missions(), 1)
+        self.assertEqual(SpyMission.objects.get(pk=other.pk).status, SpyMission.MissionStatus.FAILED)
+        self.assertEqual(reconcile_stale_missions(), 0)
+
+
+class MissionStatusRuleTests(TestCase):
+    def test_sql_expression_matches_derive_mission_status(self):
+        expected = {}
+        for counts in itertools.product(range(2), repeat=4):
+            counts = dict(zip([NOT_STARTED, IN_PROGRESS, DONE, FAILED], counts))
+            for has_agent in (True, False):
+                for current in SpyMission.MissionStatus.values:
+                    # Одна активная миссия на агента: каждой миссии свой агент
+                    agent = SpyCats.objects.create(name='Tom', breed='Bengal') if has_agent else None
+                    mission = SpyMission(agent=agent, status=current)
+                    mission.set_target_counts(status for status, count in counts.items() for _ in range(count))
+                    mission.save()
+                    expected[mission.pk] = derive_mission_status(counts, has_agent, current)
+
+        SpyMission.objects.recompute_status()
+
+        self.assertEqual(dict(SpyMission.objects.values_list('pk', 'status')), expected)
+
+
+class RebuildMissionCountersCommandTests(TestCase):
+    def test_check_and_rebuild(self):
+        mission = create_mission(targets=3)
+        consistent = create_mission(targets=2)
+        SpyMission.objects.filter(pk=mission.pk).update(not_started_count=0, failed_count=5)
+
+        with self.assertRaisesMessage(CommandError, '1 missions have stale target counters'):
+            call_command('rebuild_mission_counters', '--check', stdout=StringIO())
+        call_command('rebuild_mission_counters', stdout=StringIO())
+
+        mission.refresh_from_db()
+        self.assertEqual(mission.target_counts, {NOT_STARTED: 3, IN_PROGRESS: 0, DONE: 0, FAILED: 0})
+        consistent.refresh_from_db()
+        self.assertEqual(consistent.not_started_count, 2)
+        call_command('rebuild_mission_counters', '--check', stdout=StringIO())
+
+
+class SpyMissionCreateTests(TestCase):
+    url = '/api/missions/spy-missions/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+
+    def mission_data(self, targets, **kwargs):
+        return {
+            'targets': [{'name': f'Target {i}', 'country': 'UA', 'notes': ''} for i in range(targets)],
+            **kwargs
+        }
+
+    def test_create_derives_status_from_targets(self):
+        data = self.mission_data(2, agent_id=self.agent.id)
+        data['targets'][0]['status'] = IN_PROGRESS
+
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status'], SpyMission.MissionStatus.IN_PROGRESS)
+        self.assertEqual(len(response.data['targets']), 2)
+        mission = SpyMission.objects.get(pk=response.data['id'])
+        self.assertEqual((mission.not_started_count, mission.in_progress_count), (1, 1))
+
+    def test_create_query_count_is_constant_in_targets(self):
+        counts = []
+        for size in (2, 40):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, self.mission_data(size), format='json')
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(SpyTarget.objects.count(), 42)
+
+    def test_bulk_create(self):
+        rows = [
+            self.mission_data(3, agent_id=self.agent.id),
+            {'agent_id': 0},
+            self.mission_data(2),
+        ]
+
+        response = self.client.post(f'{self.url}bulk/', rows, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([len(mission['targets']) for mission in response.data['created']], [3, 2])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(SpyMission.objects.count(), 2)
+        self.assertEqual(SpyTarget.objects.count(), 5)
+
+
+class SpyMissionPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+
+    def test_list_is_cursor_paginated_by_id(self):
+        ids = [create_mission(targets=2).id for _ in range(5)]
+
+        seen = []
+        url = '/api/missions/spy-missions/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [mission['id'] for mission in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(seen, ids)
+
+    @mock.patch.object(IdCursorPagination, 'max_page_size', 3)
+    def test_page_size_is_capped(self):
+        for _ in range(5):
+            create_mission()
+
+        response = self.client.get('/api/missions/spy-missions/?page_size=1000')
+
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class SpyMissionFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+
+    def test_filters_by_status_and_agent(self):
+        agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        assigned = create_mission(agent)
+        unassigned = create_mission()
+        done = create_mission(status=SpyMission.MissionStatus.DONE)
+
+        def ids(query):
+            response = self.client.get(f'/api/missions/spy-missions/{query}')
+            self.assertEqual(response.status_code, 200)
+            return [mission['id'] for mission in response.data['results']]
+
+        self.assertEqual(ids('?status=not_started'), [assigned.id, unassigned.id])
+        self.assertEqual(ids('?status=done,not_started'), [assigned.id, unassigned.id, done.id])
+        self.assertEqual(ids(f'?agent_id={agent.id}'), [assigned.id])
+        self.assertEqual(self.client.get('/api/missions/spy-missions/?status=lost').status_code, 400)
+        self.assertEqual(self.client.get('/api/missions/spy-missions/?agent_id=tom').status_code, 400)
+
+
+class TargetSearchTests(TestCase):
+    url = '/api/missions/targets/search/'
+
+    def setUp(self):
+        self.client = APIClient()
+        mission = create_mission(targets=0)
+        other = create_mission(targets=0)
+        self.in_notes, self.in_name, self.elsewhere, self.other_mission = SpyTarget.objects.bulk_create([
+            SpyTarget(mission=mission, name='Courier', country='UA', notes='Seen at the harbour at night'),
+            SpyTarget(mission=mission, name='Harbour master', country='UA', notes='Harbour office, second floor'),
+            SpyTarget(mission=mission, name='Banker', country='PL', notes='Never goes to the harbour'),
+            SpyTarget(mission=other, name='Clerk', country='UA', notes='Lives by the harbour', status=DONE),
+        ])
+
+    def search(self, query):
+        response = self.client.get(f'{self.url}{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_results_are_ranked_and_filtered(self):
+        results = self.search('?q=Harbour')['results']
+        self.assertEqual(results[0]['id'], self.in_name.id)
+        self.assertEqual(
+            {target['id'] for target in results},
+            {self.in_notes.id, self.in_name.id, self.elsewhere.id, self.other_mission.id}
+        )
+        self.assertEqual(
+            set(results[0]), {'id', 'mission_id', 'name', 'country', 'notes', 'status', 'rank'}
+        )
+
+        results = self.search('?q=harbour&country=UA&status=not_started,in_progress')['results']
+        self.assertEqual([target['id'] for target in results], [self.in_name.id, self.in_notes.id])
+        results = self.search(f'?q=harbour night&mission_id={self.in_notes.mission_id}')['results']
+        self.assertEqual([target['id'] for target in results], [self.in_notes.id])
+
+    def test_results_are_paginated_by_rank(self):
+        seen = []
+        url = f'{self.url}?q=harbour&page_size=1'
+        while url:
+            data = self.client.get(url).data
+            self.assertLessEqual(len(data['results']), 1)
+            seen += [target['id'] for target in data['results']]
+            url = data['next']
+
+        self.assertEqual(seen, [target['id'] for target in self.search('?q=harbour')['results']])
+        self.assertEqual(len(seen), 4)
+
+    def test_tied_ranks_page_past_the_offset_cutoff(self):
+        mission = create_mission(targets=0)
+        tied = [target.id for target in SpyTarget.objects.bulk_create(
+            SpyTarget(mission=mission, name=f'Alpha {i}', country='UA') for i in range(1300)
+        )]
+        pages, url = [], f'{self.url}?q=alpha&page_size=500'
+        while url:
+            data = self.client.get(url).data
+            pages.append(data)
+            url = data['next']
+
+        self.assertEqual([target['id'] for page in pages for target in page['results']], sorted(tied))
+        self.assertEqual(len({target['rank'] for page in pages for target in page['results']}), 1)
+        previous = self.client.get(pages[2]['previous']).data
+        self.assertEqual(previous['results'], pages[1]['results'])
+        self.assertEqual(self.client.get(previous['previous']).data['results'], pages[0]['results'])
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(f'{self.url}?q=harbour&cursor=bm9wZQ').status_code, 404)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}?q=%20').status_code, 400)
+        # Without the trailing slash too
+        self.assertEqual(self.client.get('/api/missions/targets/search?q=courier').data['results'][0]['name'], 'Courier')
+
+    def test_full_text_index_matches_the_queries(self):
+        migration = import_module('agents_missions.migrations.0007_search_indexes')
+
+        self.assertEqual(migration.SEARCH_INDEXES['spytarget_search_idx'], SEARCH_VECTOR)
+
+
+class SpyMissionConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+        self.agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        self.mission = create_mission(self.agent, targets=2)
+        self.url = f'/api/missions/spy-missions/{self.mission.id}/'
+
+    def test_unchanged_mission_is_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0), mock.patch('cta_project.caching.time.time', return_value=time.time() + 1):
+            response = self.client.get(self.url)
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(
+                self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+            )
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(cached['ETag'], etag)
+
+    def test_last_modified_waits_for_the_end_of_its_second(self):
+        response_cache.cache.set(response_cache.version_key('missions', self.mission.id), 1000.3)
+
+        with mock.patch('cta_project.caching.time.time', return_value=1000.6):
+            response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=http_date(1000))
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('Last-Modified', response)
+        # A write later in the same second must not be answered with 304.
+        response_cache.cache.set(response_cache.version_key('missions', self.mission.id), 1000.8)
+        with mock.patch('cta_project.caching.time.time', return_value=1001.1):
+            response = self.client.get(self.url)
+            self.assertEqual(response['Last-Modified'], http_date(1000))
+            self.assertEqual(
+                self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+            )
+
+    def test_write_during_first_read_is_not_cached_under_its_version(self):
+        load = SpyMissionViewSet.get_object
+        target = self.mission.targets.first()
+
+        def load_then_write(view):
+            instance = load(view)
+            # A write commits between the read and the seeding of the version.
+            SpyTarget.objects.filter(pk=target.pk).update(status=DONE)
+            response_cache.cache.set(response_cache.version_key('missions', self.mission.id), time.time() + 5)
+            return instance
+
+        with mock.patch.object(SpyMissionViewSet, 'get_object', load_then_write):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data['targets'][0]['status'], DONE)
+        self.assertEqual(self.client.get(self.url).data['targets'][0]['status'], DONE)
+
+    def test_agent_deletion_changes_mission_validators(self):
+        etag = self.client.get(self.url)['ETag']
+        updated_at = SpyMission.objects.get(pk=self.mission.id).updated_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/agents-cats/spy-cats/{self.agent.id}/')
+        # Versions expire: the one seeded again from the row must not bring the old ETag back.
+        response_cache.clear()
+
+        self.assertGreater(SpyMission.objects.get(pk=self.mission.id).updated_at, updated_at)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['agent_id'])
+
+    def test_target_update_invalidates_mission_and_list(self):
+        detail_etag = self.client.get(self.url)['ETag']
+        list_etag = self.client.get('/api/missions/spy-missions/')['ETag']
+        target = self.mission.targets.first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'targets': [{'id': target.id, 'status': DONE}]}, format='json')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['targets'][0]['status'], DONE)
+        self.assertNotEqual(response['ETag'], detail_etag)
+        self.assertEqual(self.client.get('/api/missions/spy-missions/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_other_mission_write_keeps_detail_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        other = create_mission()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/missions/spy-missions/{other.id}/', {'agent_id': None}, format='json')
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_admin_save_invalidates_mission(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(admin)
+        first, second = self.mission.targets.order_by('id')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/admin/agents_missions/spymission/{self.mission.id}/change/', {
+                'agent': self.agent.id,
+                'targets-TOTAL_FORMS': 2,
+                'targets-INITIAL_FORMS': 2,
+                'targets-0-id': first.id, 'targets-0-mission': self.mission.id, 'targets-0-status': DONE,
+                'targets-1-id': second.id, 'targets-1-mission': self.mission.id, 'targets-1-status': NOT_STARTED,
+            })
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SpyMissionExportTests(TestCase):
+    url = '/api/missions/spy-missions/export/'
+
+    def setUp(self):
+        self.client = APIClient()
+        agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        self.missions = [create_mission(agent, targets=2), create_mission(targets=0), create_mission(targets=3)]
+        SpyTarget.objects.filter(pk=self.missions[0].targets.first().pk).update(notes='Line one\n"quoted", ünïcode')
+
+    def expected(self):
+        return SpyMissionSerializer(SpyMission.objects.order_by('id'), many=True).data
+
+    def test_ndjson_export_matches_api_schema(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, json.loads(json.dumps(self.expected())))
+
+    def test_csv_export_has_one_row_per_target(self):
+        response = self.client.get(f'{self.url}?export_format=csv')
+
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['target_notes'], 'Line one\n"quoted", ünïcode')
+        self.assertEqual(rows[2]['target_id'], '')
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get(f'{self.url}?export_format=xml').status_code, 400)
+
+    def test_query_count_is_constant(self):
+        with self.assertNumQueries(2):
+            b''.join(self.client.get(self.url).streaming_content)
+        create_mission(targets=5)
+        with self.assertNumQueries(2):
+            b''.join(self.client.get(self.url).streaming_content)
+
+    async def test_asgi_export_is_streamed(self):
+        response = await AsyncClient().get(self.url)
+
+        # The ASGI handler reads a sync iterator to the end before sending anything.
+        self.assertTrue(response.is_async)
+        rows = [json.loads(line) for line in b''.join([chunk async for chunk in response.streaming_content]).splitlines()]
+        self.assertEqual(rows, json.loads(json.dumps(await sync_to_async(self.expected)())))
+
+    def test_missions_cursor_is_opened_before_targets_cursor(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(next(iter_missions(chunk_size=10))['id'], self.missions[0].id)
+
+        self.assertEqual(
+            [query['sql'].split(' FROM ')[1].split()[0].strip('"') for query in queries],
+            [SpyMission._meta.db_table, SpyTarget._meta.db_table],
+        )
+
+    def test_command_writes_export(self):
+        stdout = StringIO()
+
+        call_command('export_missions', '--chunk-size', '1', stdout=stdout)
+
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [mission.id for mission in self.missions])
+
+
+class SpyMissionReadPathTests(TestCase):
+    url = '/api/missions/spy-missions/'
+
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+        agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        self.missions = [create_mission(agent, targets=3), create_mission(targets=0), create_mission(targets=2)]
+        SpyTarget.objects.filter(mission=self.missions[2]).update(notes='ünïcode "quoted"\n\u2028', status=DONE)
+
+    def test_list_and_retrieve_match_serializer(self):
+        missions = SpyMission.objects.order_by('id')
+
+        response = self.client.get(f'{self.url}?page_size=2')
+        next_page = self.client.get(response.json()['next'])
+
+        self.assertEqual(
+            response.json()['results'] + next_page.json()['results'],
+            json.loads(JSONRenderer().render(SpyMissionSerializer(missions, many=True).data))
+        )
+        for mission in missions:
+            response_cache.clear()
+            response_cache.seed_version('missions', mission.id)
+            self.assertEqual(
+                self.client.get(f'{self.url}{mission.id}/').content,
+                JSONRenderer().render(SpyMissionSerializer(mission).data)
+            )
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {
+            'results': SpyMissionSerializer(SpyMission.objects.all(), many=True).data,
+            'when': datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc),
+            'lazy': gettext_lazy('Not Started'),
+            'float': 0.1,
+        }
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        # Integers orjson cannot encode fall back to the stdlib encoder.
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=4'),
+            JSONRenderer().render(data, 'application/json; indent=4')
+        )
+        with mock.patch('cta_project.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class SpyMissionQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def seed_missions(self, count):
+        for _ in range(count):
+            agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+            create_mission(agent, targets=3)
+
+    def test_list(self):
+        self.assertQueriesDoNotScale(
+            self.seed_missions, lambda: self.client.get('/api/missions/spy-missions/'), budget=2
+        )
+
+    def test_retrieve(self):
+        agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        mission = create_mission(agent)
+
+        self.assertQueriesDoNotScale(
+            lambda count: SpyTarget.objects.bulk_create(
+                SpyTarget(mission=mission, name='Target', country='UA') for _ in range(count)
+            ),
+            lambda: self.client.get(f'/api/missions/spy-missions/{mission.id}/'),
+            budget=2
+        )
+
+    def test_admin_changelist(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+
+        self.assertQueriesDoNotScale(
+            self.seed_missions, lambda: self.client.get('/admin/agents_missions/spymission/')
+        )
+
+
+class ImportAgencyCommandTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.object(breed_registry, 'snapshot', return_value=frozenset({'bengal', 'siamese'}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, rows):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            if name.endswith('.csv'):
+                writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                output.writelines(json.dumps(row) + '\n' for row in rows)
+        return path
+
+    def import_agency(self, *args):
+        stdout = StringIO()
+        call_command('import_agency', '--chunk-size', '2', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_imports_resolves_legacy_ids_and_recomputes_statuses(self):
+        cats = self.write('cats.ndjson', [
+            {'id': 'c1', 'name': 'Tom', 'breed': 'Bengal', 'salary': 10},
+            {'id': 'c2', 'name': 'Kit', 'breed': 'Siamese', 'salary': 20},
+            {'id': 'c3', 'name': 'Bad', 'breed': 'Dragon'},
+        ])
+        missions = self.write('missions.csv', [
+            {'id': 'm1', 'agent_id': 'c1', 'status': 'not_started'},
+            {'id': 'm2', 'agent_id': 'c2', 'status': 'not_started'},
+            {'id': 'm3', 'agent_id': 'c2', 'status': 'in_progress'},
+            {'id': 'm4', 'agent_id': 'c3', 'status': 'not_started'},
+            {'id': 'm5', 'agent_id': '', 'status': 'not_started'},
+        ])
+        targets = self.write('targets.ndjson', [
+            {'mission_id': 'm1', 'name': 'A', 'country': 'UA', 'status': 'done'},
+            {'mission_id': 'm1', 'name': 'B', 'country': 'UA', 'status': 'in_progress'},
+            {'mission_id': 'm2', 'name': 'C', 'country': 'PL', 'status': 'failed'},
+            {'mission_id': 'm5', 'name': 'D', 'country': 'DE', 'notes': 'tab\tand\nnewline'},
+            {'mission_id': 'm9', 'name': 'E', 'country': 'DE'},
+        ])
+        rejects = os.path.join(self.tmp.name, 'rejects.ndjson')
+
+        output = self.import_agency('--cats', cats, '--missions', missions, '--targets', targets, '--rejects', rejects)
+
+        self.assertIn('cats: 2 loaded, 1 rejected', output)
+        self.assertIn('rows/s', output)
+        tom, kit = SpyCats.objects.order_by('id')
+        m1, m2, m5 = SpyMission.objects.order_by('id')
+        self.assertEqual((m1.agent, m1.status, m1.target_counts['done'], m1.target_counts['in_progress']),
+                         (tom, IN_PROGRESS, 1, 1))
+        self.assertEqual((m2.agent, m2.status, m2.failed_count), (kit, FAILED, 1))
+        self.assertEqual((m5.agent, m5.status), (None, NOT_STARTED))
+        self.assertEqual(m5.targets.get().notes, 'tab\tand\nnewline')
+        self.assertFalse(SpyMission.objects.with_stale_target_counts().exists())
+        with open(rejects, encoding='utf-8') as log:
+            errors = [(row['stage'], row['record']) for row in map(json.loads, log)]
+        self.assertEqual(errors, [('cats', 2), ('missions', 2), ('missions', 3), ('targets', 4)])
+
+    def test_resumes_from_checkpoint(self):
+        cats = self.write('cats.ndjson', [{'id': i, 'name': f'Cat {i}', 'breed': 'Bengal'} for i in range(5)])
+        missions = self.write('missions.ndjson', [{'id': 'm', 'agent_id': 4}])
+        checkpoint = os.path.join(self.tmp.name, 'import.log')
+
+        self.import_agency('--cats', cats, '--checkpoint', checkpoint)
+        with open(checkpoint, 'a', encoding='utf-8') as log:
+            # A chunk whose transaction never committed.
+            log.write(json.dumps({'stage': 'cats', 'offset': 7, 'last_id': 10 ** 9, 'ids': [[4, 10 ** 9]]}) + '\n')
+        output = self.import_agency('--cats', cats, '--missions', missions, '--checkpoint', checkpoint)
+
+        self.assertIn('cats: 0 loaded', output)
+        self.assertEqual(SpyCats.objects.count(), 5)
+        self.assertEqual(SpyMission.objects.get().agent, SpyCats.objects.get(name='Cat 4'))
+
+    def test_reports_agents_left_with_two_active_missions_by_their_targets(self):
+        cats = self.write('cats.ndjson', [{'id': 'c1', 'name': 'Tom', 'breed': 'Bengal'}])
+        missions = self.write('missions.ndjson', [
+            {'id': 'm1', 'agent_id': 'c1', 'status': 'done'},
+            {'id': 'm2', 'agent_id': 'c1', 'status': 'not_started'},
+        ])
+        # An unfinished target makes m1 IN_PROGRESS again.
+        targets = self.write('targets.ndjson', [{'mission_id': 'm1', 'name': 'A', 'country': 'UA', 'status': 'in_progress'}])
+
+        with self.assertRaises(CommandError) as raised:
+            self.import_agency('--cats', cats, '--missions', missions, '--targets', targets)
+
+        m1, m2 = SpyMission.objects.order_by('id')
+        self.assertIn(f"agent {m1.agent_id}: missions {m1.id} (legacy m1), {m2.id} (legacy m2)", str(raised.exception))
+        self.assertEqual((m1.status, m1.in_progress_count), (DONE, 0))
+
+    def test_requires_an_input(self):
+        with self.assertRaises(CommandError):
+            call_command('import_agency')
+
+
+class GenerateAgencyDataCommandTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(breed_registry, 'snapshot', return_value=frozenset({'bengal', 'maine coon'}))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self, seed=7):
+        call_command(
+            'generate_agency_data', '--cats', '5', '--missions', '23', '--targets-per-mission', '3',
+            '--seed', str(seed), '--chunk-size', '4', stdout=StringIO()
+        )
+        return (
+            list(SpyCats.objects.order_by('id').values_list('name', 'breed', 'salary')),
+            list(SpyMission.objects.order_by('id').values_list('agent_id', 'status')),
+            list(SpyTarget.objects.order_by('id').values_list('mission_id', 'name', 'country', 'status')),
+        )
+
+    def test_generated_data_respects_business_rules(self):
+        cats, missions, targets = self.generate()
+
+        self.assertEqual((len(cats), len(missions), len(targets)), (5, 23, 69))
+        self.assertTrue({breed for _, breed, _ in cats} <= {'Bengal', 'Maine Coon'})
+        self.assertFalse(SpyMission.objects.with_stale_target_counts().exists())
+        active = SpyMission.objects.filter(status__in=SpyMission.ACTIVE_STATUSES, agent__isnull=False)
+        self.assertEqual(active.count(), active.values('agent').distinct().count())
+        statuses = dict(SpyMission.objects.values_list('id', 'status'))
+        with transaction.atomic():
+            SpyMission.objects.recompute_status()
+            self.assertEqual(dict(SpyMission.objects.values_list('id', 'status')), statuses)
+        self.assertFalse(SpyMission.objects.filter(agent__isnull=True).exclude(status=NOT_STARTED).exists())
+        # New rows get ids after the generated ones.
+        self.assertEqual(SpyCats.objects.create(name='Tom', breed='Bengal').id, 6)
+
+    def test_same_seed_gives_same_data(self):
+        first = self.generate()
+        SpyCats.objects.all().delete()
+        SpyMission.objects.all().delete()
+
+        self.assertEqual(self.generate(), first)
+        SpyCats.objects.all().delete()
+        SpyMission.objects.all().delete()
+        self.assertNotEqual(self.generate(seed=8), first)
+
+
+class StatusEventFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = SpyCats.objects.create(name='Tom', breed='Bengal')
+        self.mission = create_mission(self.agent, targets=2)
+        self.first, self.second = self.mission.targets.order_by('id')
+
+    def transitions(self):
+        return list(StatusEvent.objects.order_by('seq').values_list('kind', 'object_id', 'previous_status', 'status'))
+
+    def test_mission_update_appends_target_and_mission_transitions(self):
+        self.client.patch(f'/api/missions/spy-missions/{self.mission.id}/', {'targets': [
+            {'id': self.first.id, 'status': DONE}, {'id': self.second.id, 'notes': 'Seen'},
+        ]}, format='json')
+
+        self.assertEqual(self.transitions(), [
+            ('target', self.first.id, NOT_STARTED, DONE),
+            ('mission', self.mission.id, NOT_STARTED, IN_PROGRESS),
+        ])
+
+    def test_target_update_appends_transition(self):
+        serializer = SpyTargetSerializer(self.first, data={'status': FAILED}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        serializer = SpyTargetSerializer(self.first, data={'notes': 'Unchanged status'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(self.transitions(), [
+            ('target', self.first.id, NOT_STARTED, FAILED),
+            ('mission', self.mission.id, NOT_STARTED, IN_PROGRESS),
+        ])
+
+    def test_long_poll_returns_events_after_since(self):
+        position = self.client.get('/api/missions/events/').json()['last_seq']
+        self.client.patch(f'/api/missions/spy-missions/{self.mission.id}/', {'targets': [
+            {'id': self.first.id, 'status': IN_PROGRESS},
+        ]}, format='json')
+
+        response = self.client.get(f'/api/missions/events/?since={position}&timeout=0')
+
+        body = response.json()
+        self.assertEqual([event['kind'] for event in body['events']], ['target', 'mission'])
+        self.assertEqual(body['last_seq'], body['events'][-1]['seq'])
+        self.assertEqual(self.client.get(f'/api/missions/events/?since={body["last_seq"]}&timeout=0').json(), {
+            'events': [], 'last_seq': body['last_seq'],
+        })
+
+    def test_invalid_since_is_rejected(self):
+        self.assertEqual(self.client.get('/api/missions/events/?since=-1').status_code, 400)
+
+    @override_settings(STATUS_FEED_POLL_INTERVAL=30)
+    async def test_long_poll_is_woken_by_an_append(self):
+        request = asyncio.create_task(AsyncClient().get('/api/missions/events/?since=0&timeout=10'))
+        await asyncio.sleep(0.2)
+        started = time.monotonic()
+
+        await sync_to_async(StatusEvent.objects.create)(
+            kind='target', object_id=self.first.id, mission_id=self.mission.id, previous_status=NOT_STARTED, status=DONE
+        )
+        broker.publish()
+        response = await request
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual([event['status'] for event in response.json()['events']], [DONE])
+
+    async def test_event_stream_sends_backlog(self):
+        await sync_to_async(StatusEvent.objects.create)(
+            kind='mission', object_id=self.mission.id, mission_id=self.mission.id,
+            previous_status=NOT_STARTED, status=IN_PROGRESS
+        )
+
+        response = await AsyncClient().get('/api/missions/events/stream/?since=0&timeout=0')
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        # Measured once the stream is over
+        self.assertIn('{view="status-event-stream",method="GET",status="2xx"}', REQUEST_DURATION.expose())
+        self.assertIn('event: mission\n', body)
+        self.assertIn('"status":"in_progress"', body)
+
+    def test_event_stream_needs_asgi(self):
+        self.assertEqual(self.client.get('/api/missions/events/stream/').status_code, 501)
+
+
+    def test_feed_follows_transaction_order(self):
+        # An older transaction committing after a newer one: its event has the higher seq.
+        newer, older = StatusEvent.objects.bulk_create([
+            StatusEvent(kind='mission', object_id=1, mission_id=1, previous_status=NOT_STARTED, status=DONE, txid=20),
+            StatusEvent(kind='mission', object_id=2, mission_id=2, previous_status=NOT_STARTED, status=DONE, txid=10),
+        ])
+
+        self.assertEqual([event['seq'] for event in read_events(0)], [older.seq, newer.seq])
+        self.assertEqual([event['seq'] for event in read_events(older.seq)], [newer.seq])
+        self.assertEqual(read_events(newer.seq), [])
+        self.assertEqual(last_seq(), newer.seq)
+
+
+@skipUnless(connection.vendor == 'postgresql', "Transaction ids and snapshots are PostgreSQL's")
+class ConcurrentStatusEventTests(TransactionTestCase):
+    def append(self, mission_id):
+        return append_events([StatusEvent(
+            kind='mission', object_id=mission_id, mission_id=mission_id, previous_status=NOT_STARTED, status=DONE,
+        )])[0].seq
+
+    def test_appends_do_not_wait_and_readers_wait_for_older_transactions(self):
+        appended, release = threading.Event(), threading.Event()
+        older = []
+
+        def slow_writer():
+            try:
+                with transaction.atomic():
+                    older.append(self.append(1))
+                    appended.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        writer = threading.Thread(target=slow_writer)
+        writer.start()
+        try:
+            self.assertTrue(appended.wait(10))
+            # Not blocked by the open transaction, but held back until it ends.
+            with transaction.atomic():
+                newer = self.append(2)
+            self.assertEqual(read_events(0), [])
+            self.assertEqual(last_seq(), 0)
+        finally:
+            release.set()
+            writer.join()
+
+        self.assertEqual([event['seq'] for event in read_events(0)], [older[0], newer])
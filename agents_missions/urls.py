@@ -1,10 +1,13 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from .views import SpyMissionViewSet
+from .views import SpyMissionViewSet, TargetSearchView, status_event_stream, status_events
 
 router = DefaultRouter()
 router.register(r'spy-missions', SpyMissionViewSet, basename='spymission')
 
 urlpatterns = [
+    path('events/', status_events, name='status-events'),
+    path('events/stream/', status_event_stream, name='status-event-stream'),
+    re_path(r'^targets/search/?$', TargetSearchView.as_view(), name='target-search'),
     path('', include(router.urls)),
 ]
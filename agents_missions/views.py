@@ -1,11 +1,48 @@
-from rest_framework import viewsets, status
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Prefetch
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import generics, viewsets, status
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from .models import SpyMission
-from .serializers import SpyMissionSerializer
 
-class SpyMissionViewSet(viewsets.ModelViewSet):
-    queryset = SpyMission.objects.all()
+from agency_stats.summaries import forget_missions, mission_key, record_missions, record_targets, target_key
+from cta_project.authentication import api_access_denied
+from cta_project.bulk import BulkActionMixin
+from cta_project.caching import ConditionalGetMixin, response_cache
+from cta_project.filters import FilterParam, QueryParamFilterBackend, choice_list, integer
+from cta_project.negotiation import IgnoreClientContentNegotiation
+from cta_project.parsers import NDJSONParser
+from cta_project.reads import ValuesReadMixin
+from .events import broker, last_seq, read_events
+from .export import EXPORT_FORMATS, aiter_chunks, export_missions
+from .models import SpyMission, SpyTarget
+from .search import RankCursorPagination, TargetSearchFilter
+from .serializers import SpyMissionSerializer, TargetSearchResultSerializer, agent_conflict_error, attach_targets
+
+class SpyMissionViewSet(ConditionalGetMixin, ValuesReadMixin, BulkActionMixin, viewsets.ModelViewSet):
+    queryset = SpyMission.objects.prefetch_related(Prefetch('targets', queryset=SpyTarget.objects.order_by('id')))
     serializer_class = SpyMissionSerializer
+    cache_namespace = 'missions'
+    values_fields = ['id', 'agent_id', 'status', 'version']
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'status': FilterParam(
+            'status__in', choice_list(SpyMission.MissionStatus.values),
+            "Missions in this status, or in any of several separated by commas."
+        ),
+        'agent_id': FilterParam('agent_id', integer, "Missions of this agent.", 'integer'),
+    }
+
+    def expand_rows(self, rows):
+        return attach_targets(rows)
 
     def destroy(self, request, *args, **kwargs):
         mission = self.get_object()
@@ -15,3 +52,212 @@ class SpyMissionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         return super().destroy(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            forget_missions(SpyMission.objects.filter(pk=instance.pk))
+            super().perform_destroy(instance)
+
+    @action(detail=False, methods=['get'], content_negotiation_class=IgnoreClientContentNegotiation)
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"export_format": f"Must be one of: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        chunks = export_missions(export_format, settings.EXPORT_CHUNK_SIZE)
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiter_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="missions.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        rows = self.get_bulk_rows(request)
+        batch_size = self.get_batch_size(request)
+
+        built, errors = [], []
+        for index, row in enumerate(rows):
+            serializer = self.get_serializer(data=row)
+            if not serializer.is_valid():
+                errors.append({'index': index, 'errors': serializer.errors})
+                continue
+            validated_data = dict(serializer.validated_data)
+            targets_data = validated_data.pop('targets', [])
+            built.append((index, *serializer.build_mission(validated_data, targets_data)))
+
+        # Report agent conflicts per row up front; the constraint still guards against concurrent writers.
+        busy_agent_ids = set(SpyMission.objects.filter(
+            agent_id__in={mission.agent_id for _, mission, _ in built if mission.agent_id is not None},
+            status__in=SpyMission.ACTIVE_STATUSES
+        ).values_list('agent_id', flat=True))
+        missions, targets = [], []
+        for index, mission, mission_targets in built:
+            if mission.agent_id is not None and mission.status in SpyMission.ACTIVE_STATUSES:
+                if mission.agent_id in busy_agent_ids:
+                    errors.append({'index': index, 'errors': {
+                        'agent_id': ["This agent has already been assigned to an active mission."]
+                    }})
+                    continue
+                busy_agent_ids.add(mission.agent_id)
+            missions.append(mission)
+            targets.extend(mission_targets)
+        errors.sort(key=lambda error: error['index'])
+
+        try:
+            with transaction.atomic():
+                SpyMission.objects.bulk_create(missions, batch_size=batch_size)
+                SpyTarget.objects.bulk_create(targets, batch_size=batch_size)
+                record_missions((None, mission_key(mission)) for mission in missions)
+                record_targets((None, target_key(target)) for target in targets)
+                response_cache.invalidate('missions', *(mission.pk for mission in missions))
+        except IntegrityError as e:
+            raise agent_conflict_error(e)
+
+        created = SpyMission.objects.filter(id__in=[mission.id for mission in missions])\
+            .prefetch_related('targets').order_by('id')
+        return Response(
+            {'created': self.get_serializer(created, many=True).data, 'errors': errors},
+            status=status.HTTP_201_CREATED if missions or not errors else status.HTTP_400_BAD_REQUEST
+        )
+
+
+class TargetSearchView(generics.ListAPIView):
+    """
+    Ranked search over target names and notes, optionally filtered by country, status and mission.
+    Results are read with .values() (see ValuesReadMixin) and paginated by rank.
+    """
+    queryset = SpyTarget.objects.all()
+    serializer_class = TargetSearchResultSerializer
+    filter_backends = [QueryParamFilterBackend, TargetSearchFilter]
+    filter_params = {
+        'country': FilterParam('country', description="Targets in this country."),
+        'status': FilterParam(
+            'status__in', choice_list(SpyTarget.TargetStatus.values),
+            "Targets in this status, or in any of several separated by commas."
+        ),
+        'mission_id': FilterParam('mission_id', integer, "Targets of this mission.", 'integer'),
+    }
+    pagination_class = RankCursorPagination
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).values(*TargetSearchResultSerializer.Meta.fields)
+        return self.get_paginated_response(self.paginate_queryset(queryset))
+
+
+def feed_position(value):
+    """``since``/Last-Event-ID as a sequence number, None when absent; raises ValueError when invalid."""
+    if value in (None, ''):
+        return None
+    since = int(value)
+    if since < 0:
+        raise ValueError(value)
+    return since
+
+
+def feed_timeout(request, default):
+    try:
+        timeout = float(request.GET.get('timeout', default))
+    except ValueError:
+        timeout = default
+    return min(max(timeout, 0), settings.STATUS_FEED_MAX_TIMEOUT)
+
+
+def read_feed(since):
+    # Waiting consumers must not each keep a database connection open.
+    try:
+        return read_events(since)
+    finally:
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+async def wait_for_events(subscription, since, timeout):
+    """
+    Reads the events after ``since``; when there are none yet, waits until an append wakes the
+    subscription or the poll interval elapses and reads again, for at most ``timeout`` seconds.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        events = await sync_to_async(read_feed)(since)
+        remaining = deadline - loop.time()
+        if events or remaining <= 0:
+            return events
+        await subscription.wait(min(remaining, settings.STATUS_FEED_POLL_INTERVAL))
+
+
+async def status_events(request):
+    """
+    Long-poll change feed: ``GET ?since=<seq>`` answers with the status events after ``seq`` as soon as
+    there are any, or with an empty list after ``timeout`` seconds. Without ``since`` it answers at
+    once with the current position, to start from.
+    """
+    denied = await sync_to_async(api_access_denied)(request)
+    if denied is not None:
+        return denied
+    try:
+        since = feed_position(request.GET.get('since'))
+    except ValueError:
+        return JsonResponse({'since': "Must be a non-negative integer."}, status=400)
+
+    if since is None:
+        return JsonResponse({'events': [], 'last_seq': await sync_to_async(last_seq)()})
+    with broker.subscribe() as subscription:
+        events = await wait_for_events(subscription, since, feed_timeout(request, settings.STATUS_FEED_TIMEOUT))
+    return JsonResponse({'events': events, 'last_seq': events[-1]['seq'] if events else since})
+
+
+def format_event(event):
+    data = json.dumps(event, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f'id: {event["seq"]}\nevent: {event["kind"]}\ndata: {data}\n\n'
+
+
+async def status_event_stream(request):
+    """
+    Server-Sent Events change feed, served by the ASGI application only. Resumes after the
+    Last-Event-ID header or ``?since=<seq>``, otherwise starts at the current position.
+    The stream ends after ``timeout`` seconds if given; EventSource clients reconnect by themselves.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': "Event streams need the ASGI server (SERVER_INTERFACE=asgi); use the long-poll feed."},
+            status=501
+        )
+    denied = await sync_to_async(api_access_denied)(request)
+    if denied is not None:
+        return denied
+    try:
+        since = feed_position(request.headers.get('Last-Event-ID') or request.GET.get('since'))
+    except ValueError:
+        return JsonResponse({'since': "Must be a non-negative integer."}, status=400)
+    duration = feed_timeout(request, settings.STATUS_FEED_MAX_TIMEOUT) if 'timeout' in request.GET else None
+
+    async def stream(since):
+        loop = asyncio.get_running_loop()
+        ends_at = loop.time() + duration if duration is not None else None
+        yield f'retry: {int(settings.STATUS_FEED_POLL_INTERVAL * 1000)}\n\n'
+        with broker.subscribe() as subscription:
+            if since is None:
+                since = await sync_to_async(last_seq)()
+            while True:
+                timeout = settings.STATUS_FEED_HEARTBEAT
+                if ends_at is not None:
+                    timeout = min(timeout, max(ends_at - loop.time(), 0))
+                events = await wait_for_events(subscription, since, timeout)
+                for event in events:
+                    yield format_event(event)
+                if events:
+                    since = events[-1]['seq']
+                elif ends_at is not None and loop.time() >= ends_at:
+                    return
+                else:
+                    # Comment line keeping proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+
+    response = StreamingHttpResponse(stream(since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,135 @@
+"""
+Measures concurrent target updates (PATCH /api/missions/spy-missions/<id>/) on a throwaway PostgreSQL
+test database: --threads clients update targets as fast as they can, spread over 1, 2, 4... missions.
+Writers of one mission wait for its row lock, writers of different missions do not, so throughput
+should grow with the number of distinct missions until another resource saturates:
+
+    python -m benchmarks.contention --threads 16 --updates 50 --missions 1 4 16
+
+Every run also checks that the counters, statuses, versions and summaries are consistent afterwards.
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+STATUSES = ['not_started', 'in_progress', 'failed']
+
+
+def run_updates(mission_targets, threads, updates, seed=0):
+    """
+    Runs ``threads`` clients doing ``updates`` target PATCHes each, client i working on mission
+    i % len(mission_targets). ``mission_targets`` maps mission ids to their target ids.
+    Returns the elapsed seconds and the number of successful updates per mission.
+    """
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    mission_ids = sorted(mission_targets)
+    succeeded = {mission_id: 0 for mission_id in mission_ids}
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def client(index):
+        rng = random.Random(seed + index)
+        mission_id = mission_ids[index % len(mission_ids)]
+        target_ids = mission_targets[mission_id]
+        api = APIClient()
+        try:
+            start.wait()
+            for _ in range(updates):
+                changes = [
+                    {'id': target_id, 'status': rng.choice(STATUSES)}
+                    for target_id in rng.sample(target_ids, min(2, len(target_ids)))
+                ]
+                response = api.patch(f'/api/missions/spy-missions/{mission_id}/', {'targets': changes}, format='json')
+                with lock:
+                    if response.status_code == 200:
+                        succeeded[mission_id] += 1
+                    else:
+                        errors.append((response.status_code, response.content[:200]))
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=client, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise AssertionError(f"{len(errors)} updates failed, first: {errors[0]}")
+    return elapsed, succeeded
+
+
+def check_consistency(succeeded):
+    """Raises AssertionError unless counters, versions and summaries match the targets."""
+    from agency_stats.summaries import check_summaries
+    from agents_missions.models import SpyMission
+
+    stale = list(SpyMission.objects.with_stale_target_counts().values_list('id', flat=True))
+    assert not stale, f"stale target counters: {stale}"
+    versions = dict(SpyMission.objects.filter(pk__in=succeeded).values_list('id', 'version'))
+    for mission_id, count in succeeded.items():
+        assert versions[mission_id] == count + 1, f"mission {mission_id}: version {versions[mission_id]}, {count} updates"
+    differences = check_summaries()
+    assert not differences, f"summaries differ: {differences[:3]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--updates', type=int, default=50, help="Updates per thread.")
+    parser.add_argument('--targets', type=int, default=4, help="Targets per mission.")
+    parser.add_argument('--missions', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cta_project.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+
+    from agency_stats.summaries import rebuild_summaries
+    from agents_cats.models import SpyCats
+    from agents_missions.models import SpyMission, SpyTarget
+
+    if connection.vendor != 'postgresql':
+        parser.exit(1, "The contention benchmark needs PostgreSQL: SQLite locks the whole database on writes.\n")
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print(f"{args.threads} threads x {args.updates} updates, {args.targets} targets per mission")
+        baseline = None
+        for count in args.missions:
+            SpyMission.objects.all().delete()
+            SpyCats.objects.all().delete()
+            cats = SpyCats.objects.bulk_create(
+                SpyCats(name=f'Agent {i}', breed='Bengal', salary=1000) for i in range(count)
+            )
+            missions = SpyMission.objects.bulk_create(
+                SpyMission(agent=cat, not_started_count=args.targets) for cat in cats
+            )
+            targets = SpyTarget.objects.bulk_create(
+                SpyTarget(mission=mission, name=f'Target {i}', country='UA')
+                for mission in missions for i in range(args.targets)
+            )
+            rebuild_summaries()
+            mission_targets = {mission.pk: [] for mission in missions}
+            for target in targets:
+                mission_targets[target.mission_id].append(target.pk)
+
+            elapsed, succeeded = run_updates(mission_targets, args.threads, args.updates)
+            check_consistency(succeeded)
+            rate = sum(succeeded.values()) / elapsed
+            baseline = baseline or rate
+            print(f"{count:4} missions {rate:10.0f} updates/s ({rate / baseline:.1f}x)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
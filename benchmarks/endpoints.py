@@ -0,0 +1,408 @@
+"""
+Endpoint benchmark suite: seeds a throwaway test database, drives every API route in-process through
+the test client against a local TheCatAPI stub and records p50/p95/p99 latency, SQL query count and
+peak memory per route.
+
+    python -m benchmarks.endpoints --scale 1000 --iterations 50
+    python -m benchmarks.endpoints --update-baseline
+
+Query counts and peak memory are compared with benchmarks/baseline-<database vendor>.json, which is
+committed: they do not depend on the machine. Latencies are compared with the baseline of this host
+only, benchmarks/host-baselines/<host>-<database vendor>.json, which stays out of git. The run fails
+(exit code 1) when a route runs more queries, or uses more memory or gets slower than its baseline by
+more than --threshold, and when there is no shared baseline unless --allow-missing-baseline is given.
+DB_ENGINE=sqlite runs it without PostgreSQL.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BASELINE_DIR = Path(__file__).resolve().parent
+HOST_BASELINE_DIR = BASELINE_DIR / 'host-baselines'
+
+# Metrics of the committed baseline; latencies only mean something on the host that measured them.
+SHARED_METRICS = ('queries', 'peak_kib')
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+# Latency differences below this are noise, whatever the threshold.
+MIN_LATENCY_REGRESSION_MS = 1.0
+
+
+class Scenario:
+    """
+    One route exercised ``iterations`` times; ``request(client, fixtures, i)`` returns the response
+    of the i-th call and must leave the data ready for the next one.
+    """
+
+    def __init__(self, name, route, request, status=200, cold=True, setup=None):
+        self.name = name
+        self.route = route
+        self.request = request
+        self.status = status
+        self.setup = setup
+        # Cold reads start from an empty response cache, so the view does the work every time.
+        self.cold = cold
+
+
+def cycle(items, i):
+    return items[i % len(items)]
+
+
+def build_scenarios():
+    from django.conf import settings
+
+    cats = '/api/agents-cats/spy-cats/'
+    missions = '/api/missions/spy-missions/'
+
+    def mission_targets(fixtures, i):
+        mission = cycle(fixtures['assigned_missions'], i)
+        return missions + f'{mission["id"]}/', {'targets': [
+            {'id': target_id, 'notes': f'Update {i}', 'status': 'in_progress'} for target_id in mission['targets']
+        ]}
+
+    return [
+        Scenario('cats-root', 'api-root', lambda c, f, i: c.get('/api/agents-cats/')),
+        Scenario('cats-list', 'spycat-list', lambda c, f, i: c.get(cats)),
+        Scenario('cats-list-not-modified', 'spycat-list',
+                 lambda c, f, i: c.get(cats, HTTP_IF_NONE_MATCH=f['etag']), status=304, cold=False,
+                 setup=lambda c, f: f.update(etag=c.get(cats)['ETag'])),
+        Scenario('cats-list-filtered', 'spycat-list',
+                 lambda c, f, i: c.get(f'{cats}?breed=bengal&salary_min=1000&salary_max=1500')),
+        Scenario('cats-retrieve', 'spycat-detail', lambda c, f, i: c.get(f'{cats}{cycle(f["cats"], i)}/')),
+        Scenario('cats-create', 'spycat-list',
+                 lambda c, f, i: c.post(cats, {'name': f'Recruit {i}', 'breed': 'Bengal', 'salary': 1000},
+                                        format='json'), status=201),
+        Scenario('cats-update-salary', 'spycat-detail',
+                 lambda c, f, i: c.put(f'{cats}{cycle(f["cats"], i)}/', {'salary': 2000 + i}, format='json')),
+        Scenario('cats-partial-update', 'spycat-detail',
+                 lambda c, f, i: c.patch(f'{cats}{cycle(f["cats"], i)}/', {'salary': 3000 + i}, format='json')),
+        Scenario('cats-destroy', 'spycat-detail',
+                 lambda c, f, i: c.delete(f'{cats}{f["spare_cats"].pop()}/'), status=204),
+        Scenario('cats-available', 'spycat-available', lambda c, f, i: c.get(f'{cats}available/')),
+        Scenario('cats-bulk-create', 'spycat-bulk',
+                 lambda c, f, i: c.post(f'{cats}bulk/', [
+                     {'name': f'Batch {i}-{n}', 'breed': 'Siamese', 'salary': 100} for n in range(50)
+                 ], format='json'), status=201),
+        Scenario('cats-bulk-salary', 'spycat-bulk',
+                 lambda c, f, i: c.patch(f'{cats}bulk/', [
+                     {'id': pk, 'salary': 500 + i} for pk in f['cats'][:50]
+                 ], format='json')),
+        Scenario('missions-root', 'api-root', lambda c, f, i: c.get('/api/missions/')),
+        Scenario('missions-list', 'spymission-list', lambda c, f, i: c.get(missions)),
+        Scenario('missions-list-filtered', 'spymission-list',
+                 lambda c, f, i: c.get(f'{missions}?status=not_started,in_progress')),
+        Scenario('missions-retrieve', 'spymission-detail',
+                 lambda c, f, i: c.get(f'{missions}{cycle(f["assigned_missions"], i)["id"]}/')),
+        Scenario('missions-create', 'spymission-list',
+                 lambda c, f, i: c.post(missions, {'targets': [
+                     {'name': f'Target {n}', 'country': 'UA', 'notes': 'Harbour'} for n in range(3)
+                 ]}, format='json'), status=201),
+        Scenario('missions-update-targets', 'spymission-detail',
+                 lambda c, f, i: c.patch(*mission_targets(f, i), format='json')),
+        Scenario('missions-destroy', 'spymission-detail',
+                 lambda c, f, i: c.delete(f'{missions}{f["spare_missions"].pop()}/'), status=204),
+        Scenario('missions-bulk-create', 'spymission-bulk',
+                 lambda c, f, i: c.post(f'{missions}bulk/', [
+                     {'targets': [{'name': 'Target', 'country': 'PL'}]} for _ in range(20)
+                 ], format='json'), status=201),
+        Scenario('missions-export', 'spymission-export',
+                 lambda c, f, i: consume(c.get(f'{missions}export/?export_format=ndjson'))),
+        Scenario('token-obtain', 'token_obtain_pair',
+                 lambda c, f, i: c.post('/api/token/', f['credentials'], format='json')),
+        Scenario('token-refresh', 'token_refresh',
+                 lambda c, f, i: c.post('/api/token/refresh/', {'refresh': f['refresh']}, format='json')),
+        Scenario('swagger-schema', 'schema-swagger-ui', lambda c, f, i: c.get('/swagger/?format=openapi')),
+        Scenario('swagger-schema-yaml', 'schema-json', lambda c, f, i: c.get('/swagger.yaml')),
+        Scenario('targets-search', 'target-search',
+                 lambda c, f, i: c.get('/api/missions/targets/search/?q=harbour&country=UA')),
+        Scenario('status-events', 'status-events',
+                 lambda c, f, i: c.get('/api/missions/events/?since=0&timeout=0')),
+        Scenario('status-event-stream', 'status-event-stream',
+                 lambda c, f, i: read_event_stream('/api/missions/events/stream/?since=0&timeout=0', f['access'])),
+        Scenario('agency-stats', 'agency-stats', lambda c, f, i: c.get('/api/stats/')),
+        Scenario('metrics', 'metrics',
+                 lambda c, f, i: c.get('/metrics', HTTP_AUTHORIZATION=f'Bearer {settings.METRICS_TOKEN}')),
+    ]
+
+
+def consume(response):
+    for _ in response.streaming_content:
+        pass
+    return response
+
+
+def read_event_stream(path, access_token):
+    """The SSE feed is only served by the ASGI stack: drive it with the async test client."""
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+
+    async def read():
+        response = await AsyncClient().get(path, headers={'Authorization': f'Bearer {access_token}'})
+        async for _ in response.streaming_content:
+            pass
+        return response
+
+    return async_to_sync(read)()
+
+
+def api_route_names():
+    """Names of every non-admin route in the URLconf, to check that the suite covers them all."""
+    from django.urls import URLPattern, URLResolver, get_resolver
+
+    names = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                if pattern.namespace != 'admin':
+                    walk(pattern.url_patterns)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                names.add(pattern.name)
+
+    walk(get_resolver().url_patterns)
+    return names
+
+
+def seed(scale, iterations):
+    from django.contrib.auth import get_user_model
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    from agency_stats.summaries import rebuild_summaries
+    from agents_cats.models import SpyCats
+    from agents_missions.models import SpyMission, SpyTarget
+
+    cats = SpyCats.objects.bulk_create(
+        SpyCats(name=f'Agent {i}', breed='Bengal', salary=1000 + i) for i in range(scale + iterations + 1)
+    )
+    agents, spare_cats = cats[:scale // 2], cats[scale:]
+
+    missions = [SpyMission(agent=agents[i] if i < len(agents) else None) for i in range(scale + iterations + 1)]
+    targets = []
+    for mission in missions:
+        mission_targets = [
+            SpyTarget(mission=mission, name=f'Target {n}', country='UA', notes='Seen near the harbour')
+            for n in range(3)
+        ]
+        mission.set_target_counts(target.status for target in mission_targets)
+        targets.extend(mission_targets)
+    SpyMission.objects.bulk_create(missions)
+    SpyTarget.objects.bulk_create(targets)
+    rebuild_summaries()
+
+    targets_by_mission = {}
+    for target in targets:
+        targets_by_mission.setdefault(target.mission_id, []).append(target.pk)
+
+    user = get_user_model().objects.create_user('benchmark', password='benchmark-password')
+    return user, {
+        'cats': [cat.pk for cat in cats[:scale]],
+        'spare_cats': [cat.pk for cat in spare_cats],
+        'assigned_missions': [
+            {'id': mission.pk, 'targets': targets_by_mission[mission.pk]} for mission in missions[:len(agents)]
+        ],
+        'spare_missions': [mission.pk for mission in missions[scale:]],
+        'credentials': {'username': 'benchmark', 'password': 'benchmark-password'},
+        'refresh': str(RefreshToken.for_user(user)),
+        'access': str(RefreshToken.for_user(user).access_token),
+    }
+
+
+def percentile(sorted_values, fraction):
+    index = fraction * (len(sorted_values) - 1)
+    lower = int(index)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (index - lower)
+
+
+def measure(scenario, client, fixtures, iterations):
+    from django.db import connection
+
+    from cta_project.caching import response_cache
+
+    if scenario.setup:
+        scenario.setup(client, fixtures)
+
+    def call(i):
+        if scenario.cold:
+            response_cache.clear()
+        response = scenario.request(client, fixtures, i)
+        if response.status_code != scenario.status:
+            raise AssertionError(
+                f"{scenario.name}: expected {scenario.status}, got {response.status_code}: {response.content[:500]!r}"
+            )
+        return response
+
+    # Warm-up call, which also gives the query count and peak memory of one request.
+    # Counted with a wrapper rather than connection.queries, whose log is capped with DEBUG on.
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    tracemalloc.start()
+    with connection.execute_wrapper(count):
+        call(0)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = []
+    for i in range(1, iterations + 1):
+        started = time.perf_counter()
+        call(i)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'queries': len(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_suite(scale=200, iterations=30, report=print):
+    """
+    Runs every scenario on the current (empty, test) database and returns the results per scenario.
+    """
+    from django.db import connection
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+
+    from agents_cats.breeds import breed_registry
+    from cta_project.testing import StubCatAPIServer
+
+    scenarios = build_scenarios()
+    uncovered = api_route_names() - {scenario.route for scenario in scenarios}
+    if uncovered:
+        raise AssertionError(f"Routes without a benchmark scenario: {', '.join(sorted(uncovered))}")
+
+    with StubCatAPIServer() as cat_api, override_settings(CAT_API_BREEDS_URL=cat_api.breeds_url):
+        breed_registry.clear()
+        try:
+            user, fixtures = seed(scale, iterations)
+            client = APIClient()
+            client.force_authenticate(user)
+
+            results = {}
+            for scenario in scenarios:
+                results[scenario.name] = measure(scenario, client, fixtures, iterations)
+                report(f"{scenario.name:26} " + '  '.join(f'{k}={v}' for k, v in results[scenario.name].items()))
+        finally:
+            breed_registry.wait_for_refresh()
+            breed_registry.clear()
+
+    return {
+        'meta': {
+            'vendor': connection.vendor,
+            'scale': scale,
+            'iterations': iterations,
+            'python': platform.python_version(),
+        },
+        'routes': results,
+    }
+
+
+def select_metrics(results, metrics):
+    """``results`` reduced to ``metrics`` for every route, as written to a baseline."""
+    return {
+        'meta': results['meta'],
+        'routes': {name: {metric: route[metric] for metric in metrics} for name, route in results['routes'].items()},
+    }
+
+
+def host_baseline_path(vendor):
+    return HOST_BASELINE_DIR / f"{platform.node() or 'localhost'}-{vendor}.json"
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the regressions of ``results`` against ``baseline`` as human-readable strings.
+    Only the metrics present in the baseline are compared.
+    """
+    regressions = []
+    for name, current in results['routes'].items():
+        previous = baseline['routes'].get(name)
+        if previous is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if metric in previous and current[metric] > previous[metric] * (1 + threshold) and \
+               current[metric] - previous[metric] > MIN_LATENCY_REGRESSION_MS:
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+        if 'queries' in previous and current['queries'] > previous['queries']:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+        if 'peak_kib' in previous and current['peak_kib'] > previous['peak_kib'] * (1 + threshold):
+            regressions.append(f"{name}: peak_kib {previous['peak_kib']} -> {current['peak_kib']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=200, help="Cats and missions to seed.")
+    parser.add_argument('--iterations', type=int, default=30, help="Timed requests per route.")
+    parser.add_argument('--baseline', help="Query and memory baseline, benchmarks/baseline-<vendor>.json by default.")
+    parser.add_argument('--host-baseline',
+                        help="Latency baseline, benchmarks/host-baselines/<host>-<vendor>.json by default.")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed relative growth of latency and memory (0.25 = 25%%).")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Write the results as the new query and memory baseline and latency baseline of this host.")
+    parser.add_argument('--output', help="Also write the results to this file.")
+    parser.add_argument('--allow-missing-baseline', action='store_true',
+                        help="Exit with code 0 when there is no baseline to compare with.")
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cta_project.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run_suite(args.scale, args.iterations)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + '\n')
+
+    vendor = results['meta']['vendor']
+    baseline_path = Path(args.baseline or BASELINE_DIR / f"baseline-{vendor}.json")
+    host_path = Path(args.host_baseline or host_baseline_path(vendor))
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(select_metrics(results, SHARED_METRICS), indent=2) + '\n')
+        host_path.parent.mkdir(parents=True, exist_ok=True)
+        host_path.write_text(json.dumps(select_metrics(results, LATENCY_METRICS), indent=2) + '\n')
+        print(f"Baselines written to {baseline_path} and {host_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path}; rerun with --update-baseline to record one.")
+        return 0 if args.allow_missing_baseline else 1
+
+    regressions = []
+    for path in (baseline_path, host_path):
+        if not path.exists():
+            print(f"No latency baseline for this host at {path}; latencies are not compared.")
+            continue
+        baseline = json.loads(path.read_text())
+        if (baseline['meta']['scale'], baseline['meta']['iterations']) != (args.scale, args.iterations):
+            print(f"Warning: {path} was recorded with scale={baseline['meta']['scale']} "
+                  f"iterations={baseline['meta']['iterations']}.")
+        regressions += compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regression(s)")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
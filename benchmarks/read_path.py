@@ -0,0 +1,76 @@
+"""
+Compares the serializer read path with the .values() fast path, and JSONRenderer with
+FastJSONRenderer, on a throwaway test database:
+
+    python -m benchmarks.read_path --missions 1000 --targets 3
+"""
+import argparse
+import os
+import time
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--missions', type=int, default=1000)
+    parser.add_argument('--targets', type=int, default=3, help="Targets per mission.")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cta_project.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from rest_framework.renderers import JSONRenderer
+
+    from agents_cats.models import SpyCats
+    from agents_cats.serializers import SpyCatsSerializer
+    from agents_missions.models import SpyMission, SpyTarget
+    from agents_missions.serializers import SpyMissionSerializer, attach_targets
+    from cta_project.renderers import FastJSONRenderer, orjson
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        cats = SpyCats.objects.bulk_create(
+            SpyCats(name=f'Agent {i}', breed='Bengal', salary=1000 + i) for i in range(args.missions)
+        )
+        missions = SpyMission.objects.bulk_create(SpyMission(agent=cat) for cat in cats)
+        SpyTarget.objects.bulk_create(
+            SpyTarget(mission=mission, name=f'Target {i}', country='UA', notes='Seen near the harbour')
+            for mission in missions for i in range(args.targets)
+        )
+
+        cases = [
+            ('cats', lambda: SpyCatsSerializer(SpyCats.objects.order_by('id'), many=True).data,
+             lambda: list(SpyCats.objects.order_by('id').values(*SpyCatsSerializer.Meta.fields))),
+            ('missions', lambda: SpyMissionSerializer(
+                SpyMission.objects.order_by('id').prefetch_related('targets'), many=True).data,
+             lambda: attach_targets(list(SpyMission.objects.order_by('id').values('id', 'agent_id', 'status', 'version')))),
+        ]
+        print(f"{args.missions} missions x {args.targets} targets, best of {args.repeat}; "
+              f"orjson {'installed' if orjson else 'not installed'}")
+        for name, slow, fast in cases:
+            slow_data, fast_data = slow(), fast()
+            assert JSONRenderer().render(slow_data) == FastJSONRenderer().render(fast_data), name
+            serializer = best_of(args.repeat, lambda: JSONRenderer().render(slow()))
+            values = best_of(args.repeat, lambda: JSONRenderer().render(fast()))
+            fast_render = best_of(args.repeat, lambda: FastJSONRenderer().render(fast()))
+            print(f"{name:9} serializer+JSONRenderer {len(slow_data) / serializer:10.0f} rows/s | "
+                  f".values()+JSONRenderer {len(fast_data) / values:10.0f} rows/s ({serializer / values:.1f}x) | "
+                  f".values()+FastJSONRenderer {len(fast_data) / fast_render:10.0f} rows/s "
+                  f"({serializer / fast_render:.1f}x)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import json
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from agency_stats.summaries import rebuild_summaries
+from agents_cats.models import SpyCats
+from agents_missions.models import SpyMission, SpyTarget
+from .contention import check_consistency, run_updates
+from .endpoints import BASELINE_DIR, SHARED_METRICS, compare, run_suite, select_metrics
+
+
+class EndpointBenchmarkTests(TestCase):
+    def test_every_route_runs(self):
+        results = run_suite(scale=4, iterations=2, report=lambda line: None)
+
+        self.assertIn('missions-update-targets', results['routes'])
+        self.assertEqual(results['routes']['cats-list-not-modified']['queries'], 0)
+        # The committed baseline must be recorded again when a route is added.
+        baseline = json.loads((BASELINE_DIR / 'baseline-sqlite.json').read_text())
+        self.assertEqual(sorted(baseline['routes']), sorted(results['routes']))
+        # Latencies depend on the machine: they are kept in host baselines, out of git.
+        self.assertEqual({tuple(route) for route in baseline['routes'].values()}, {SHARED_METRICS})
+
+    def test_compare_flags_regressions(self):
+        route = {'p50_ms': 10.0, 'p95_ms': 20.0, 'p99_ms': 30.0, 'queries': 2, 'peak_kib': 100.0}
+        baseline = {'routes': {'cats-list': route}}
+
+        self.assertEqual(compare({'routes': {'cats-list': dict(route, p99_ms=30.9)}}, baseline, 0.25), [])
+        self.assertEqual(
+            compare({'routes': {'cats-list': dict(route, p95_ms=40.0, queries=3)}}, baseline, 0.25),
+            ['cats-list: p95_ms 20.0 -> 40.0', 'cats-list: queries 2 -> 3']
+        )
+        shared = select_metrics({'meta': {}, 'routes': baseline['routes']}, SHARED_METRICS)
+        self.assertEqual(
+            compare({'routes': {'cats-list': dict(route, p95_ms=40.0, queries=3)}}, shared, 0.25),
+            ['cats-list: queries 2 -> 3']
+        )
+
+
+@skipUnless(connection.vendor == 'postgresql', "Concurrent writers need PostgreSQL row locks")
+class ContentionStressTests(TransactionTestCase):
+    threads = 16
+    updates = 20
+
+    def seed(self, missions, targets=3):
+        mission_targets = {}
+        for i in range(missions):
+            mission = SpyMission.objects.create(
+                agent=SpyCats.objects.create(name=f'Agent {i}', breed='Bengal'), not_started_count=targets
+            )
+            mission_targets[mission.pk] = [
+                target.pk for target in SpyTarget.objects.bulk_create(
+                    SpyTarget(mission=mission, name=f'Target {j}', country='UA') for j in range(targets)
+                )
+            ]
+        rebuild_summaries()
+        return mission_targets
+
+    def test_one_hot_mission_stays_consistent(self):
+        _, succeeded = run_updates(self.seed(1), self.threads, self.updates)
+
+        self.assertEqual(sum(succeeded.values()), self.threads * self.updates)
+        check_consistency(succeeded)
+
+    def test_many_missions_stay_consistent(self):
+        _, succeeded = run_updates(self.seed(self.threads // 2), self.threads, self.updates)
+
+        self.assertEqual(sum(succeeded.values()), self.threads * self.updates)
+        check_consistency(succeeded)
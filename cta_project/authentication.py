@@ -0,0 +1,109 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    Bounded, per-process LRU of user objects by id, each entry kept for at most AUTH_USER_CACHE_TTL seconds.
+    Saves and deletes of a user drop its entry in this process; other processes see the change
+    once their entry expires.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def get(self, pk):
+        with self._lock:
+            entry = self._users.get(pk)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._users[pk]
+                return None
+            self._users.move_to_end(pk)
+        # Every request gets its own copy, so attributes set on request.user do not leak.
+        return copy.copy(user)
+
+    def set(self, pk, user):
+        with self._lock:
+            self._users[pk] = (copy.copy(user), time.monotonic() + settings.AUTH_USER_CACHE_TTL)
+            self._users.move_to_end(pk)
+            while len(self._users) > settings.AUTH_USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def invalidate(self, pk):
+        with self._lock:
+            self._users.pop(pk, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that takes the user id from the signed token and serves the user from
+    ``user_cache``: in the steady state an authenticated request runs no query. The active-user
+    and revoked-token checks of JWTAuthentication still run against the cached user.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(str(user_id)) if user_id is not None else None
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(str(user_id), user)
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Any save may deactivate the user, change its password or its permission flags.
+    user_cache.invalidate(str(getattr(instance, api_settings.USER_ID_FIELD)))
+
+
+post_save.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL, dispatch_uid='invalidate_cached_user')
+post_delete.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL, dispatch_uid='invalidate_cached_user')
+
+
+def api_access_denied(request):
+    """
+    Applies the REST_FRAMEWORK authentication, permission and throttle classes to a plain Django
+    view, such as the async feed views, which cannot be DRF views. Returns the rendered error
+    response when access is denied, otherwise None.
+    """
+    # rest_framework.views imports the DEFAULT_AUTHENTICATION_CLASSES, i.e. this module.
+    from rest_framework.views import APIView
+
+    view = APIView()
+    view.args, view.kwargs = (), {}
+    view.headers = view.default_response_headers
+    view.request = view.initialize_request(request)
+    try:
+        view.initial(view.request)
+    except APIException as exc:
+        return view.finalize_response(view.request, view.handle_exception(exc)).render()
+    return None
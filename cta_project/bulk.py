@@ -0,0 +1,20 @@
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+
+class BulkActionMixin:
+    """
+    Helpers shared by the viewsets' bulk actions.
+    """
+
+    def get_bulk_rows(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({"detail": "Expected a list of objects."})
+        return request.data
+
+    def get_batch_size(self, request):
+        try:
+            batch_size = int(request.query_params.get('batch_size', settings.BULK_BATCH_SIZE))
+        except ValueError:
+            raise ValidationError({"batch_size": "A valid integer is required."})
+        return max(1, min(batch_size, settings.BULK_MAX_BATCH_SIZE))
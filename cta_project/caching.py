@@ -0,0 +1,127 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+
+
+class ResponseCache:
+    """
+    Versioned cache of read responses.
+
+    Every resource namespace has a list version and every object its own version; versions are
+    write timestamps and are bumped on commit of every write through the serializers or the admin.
+    ETags are derived from versions, so answering a repeated poll only needs cache reads.
+    """
+
+    def __init__(self, alias=None):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias or settings.RESPONSE_CACHE_ALIAS]
+
+    def version_key(self, namespace, pk=None):
+        return f'version:{namespace}' if pk is None else f'version:{namespace}:{pk}'
+
+    def get_version(self, namespace, pk=None):
+        return self.cache.get(self.version_key(namespace, pk))
+
+    def seed_version(self, namespace, pk=None, version=None):
+        key = self.version_key(namespace, pk)
+        self.cache.add(key, version or time.time())
+        return self.cache.get(key)
+
+    def invalidate(self, namespace, *pks):
+        """
+        Bumps the list version of ``namespace`` and the versions of ``pks`` once the current transaction commits.
+        """
+        def bump():
+            now = time.time()
+            self.cache.set_many({self.version_key(namespace, pk): now for pk in (None, *pks)})
+
+        transaction.on_commit(bump)
+
+    def get(self, etag):
+        return self.cache.get(f'response:{etag}')
+
+    def set(self, etag, data):
+        self.cache.set(f'response:{etag}', data)
+
+    def clear(self):
+        self.cache.clear()
+
+
+response_cache = ResponseCache()
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin adding ETag/Last-Modified validation and a response cache to list and retrieve.
+    Writes must call ``response_cache.invalidate(cache_namespace, *pks)``.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        version = response_cache.get_version(self.cache_namespace) or response_cache.seed_version(self.cache_namespace)
+        return self.conditional_response(request, version, lambda: super(ConditionalGetMixin, self).list(
+            request, *args, **kwargs
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        version = response_cache.get_version(self.cache_namespace, pk)
+        instance = None
+        if version is None:
+            instance = self.get_object()
+            loaded = instance.updated_at.timestamp()
+            version = response_cache.seed_version(self.cache_namespace, pk, loaded)
+            if version != loaded:
+                # A write committed since the object was read and bumped the version: the loaded
+                # object may predate it, so read it again rather than cache it under that version.
+                instance = None
+        if instance is not None:
+            render = lambda: Response(self.get_serializer(instance).data)
+        else:
+            render = lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        return self.conditional_response(request, version, render)
+
+    def perform_destroy(self, instance):
+        pk = instance.pk
+        super().perform_destroy(instance)
+        response_cache.invalidate(self.cache_namespace, pk)
+
+    def conditional_response(self, request, version, render):
+        etag = quote_etag(hashlib.md5(
+            f'{self.cache_namespace}:{version}:{request.build_absolute_uri()}'.encode()
+        ).hexdigest())
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        # Last-Modified has a one second resolution: until the second of the version is over, a later
+        # write can still fall into it, so a date-only validator is neither sent nor honoured before.
+        settled = int(version) < int(time.time())
+        if settled:
+            headers['Last-Modified'] = http_date(version)
+
+        if_none_match = request.headers.get('If-None-Match')
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if if_none_match is not None:
+            not_modified = etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        else:
+            not_modified = settled and if_modified_since is not None and int(version) <= if_modified_since
+        if not_modified:
+            return HttpResponseNotModified(headers=headers)
+
+        data = response_cache.get(etag)
+        if data is not None:
+            return Response(data, headers=headers)
+
+        response = render()
+        if response.status_code == 200:
+            response_cache.set(etag, response.data)
+            for header, value in headers.items():
+                response[header] = value
+        return response
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cta_project.schema import code_version, write_artifacts
+
+
+class Command(BaseCommand):
+    help = "Generate the OpenAPI schema of the current code version into OPENAPI_SCHEMA_DIR (JSON and YAML)."
+    # Runs at image build time, without a database
+    requires_system_checks = []
+
+    def handle(self, *args, **options):
+        for path in write_artifacts():
+            self.stdout.write(f"Wrote {path}")
+        self.stdout.write(self.style.SUCCESS(f"OpenAPI schema built for code version {code_version()}."))
@@ -0,0 +1,272 @@
+import hmac
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.fields import empty
+
+_current = ContextVar('request_metrics', default=None)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus text format, kept in process memory.
+    Every worker process exposes its own counts; Prometheus sums them per instance label.
+    """
+
+    def __init__(self, name, documentation, labelnames, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, labels, value):
+        # One bucket per observation; the cumulative counts are only computed on exposition.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            label_text = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{float(bound)}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return '\n'.join(lines)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', "Total request latency.", ('view', 'method', 'status'))
+DB_DURATION = Histogram(
+    'http_request_db_seconds', "Time spent in SQL queries per request.", ('view', 'method'))
+DB_QUERIES = Histogram(
+    'http_request_db_queries', "SQL queries per request.", ('view', 'method'), buckets=QUERY_BUCKETS)
+OUTBOUND_DURATION = Histogram(
+    'http_request_outbound_seconds', "Time spent in outbound HTTP calls (TheCatAPI) per request.", ('view', 'method'))
+SERIALIZE_DURATION = Histogram(
+    'http_request_serialize_seconds', "Time spent serializing and validating payloads per request.", ('view', 'method'))
+RENDER_DURATION = Histogram(
+    'http_request_render_seconds', "Time spent rendering the response body per request.", ('view', 'method'))
+
+HISTOGRAMS = [REQUEST_DURATION, DB_DURATION, DB_QUERIES, OUTBOUND_DURATION, SERIALIZE_DURATION, RENDER_DURATION]
+
+# Timer name -> histogram, in Server-Timing order.
+TIMERS = {'http': OUTBOUND_DURATION, 'serialize': SERIALIZE_DURATION, 'render': RENDER_DURATION}
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db', 'timers', 'active')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.timers = dict.fromkeys(TIMERS, 0.0)
+        self.active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+def count_queries(execute, sql, params, many, context):
+    """Execute wrapper of every connection: counts the query towards the current request, if any."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_counter(sender=None, connection=None, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        # First, so that execute_wrapper() blocks opened before the connection still pop their own wrapper.
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+connection_created.connect(install_query_counter, dispatch_uid='install_query_counter')
+
+
+@contextmanager
+def timed(name):
+    """
+    Adds the time spent in the block to timer ``name`` of the current request, if any.
+    Nested blocks of the same timer are counted once.
+    """
+    metrics = _current.get()
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timers[name] += time.perf_counter() - started
+        metrics.active.discard(name)
+
+
+class TimedSerializerMixin:
+    """Serializer mixin counting representation and validation towards the ``serialize`` timer."""
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+    def run_validation(self, data=empty):
+        with timed('serialize'):
+            return super().run_validation(data)
+
+
+class MetricsMiddleware:
+    """
+    Measures every request: SQL queries (count and time, through the count_queries execute wrapper),
+    outbound HTTP, serializer and render time, and total latency. Sends them back in a
+    Server-Timing header and aggregates them per view into the histograms served at /metrics.
+    Works in both the WSGI and the ASGI stack, so async views are not pushed onto a thread.
+    Streaming responses are measured until their body has been sent and get no Server-Timing header.
+
+    The metrics of the request are in a context variable, which sync_to_async copies to the thread
+    running the sync code, so the queries of an ASGI request are counted on whichever thread's
+    connection they run.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        # Connections opened before this module was imported did not get the wrapper.
+        install_query_counter(connection=connection)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def finish(self, request, response, metrics, started):
+        if response.streaming:
+            # The body is produced while the server sends it, after this returns: keep the metrics
+            # current while it is read and record them once it is over. No Server-Timing header,
+            # which leaves before the body.
+            content = response.streaming_content
+            wrap = self.stream_async if response.is_async else self.stream
+            response.streaming_content = wrap(content, metrics, lambda: self.record(request, response, metrics, started))
+            return response
+
+        total = self.record(request, response, metrics, started)
+        timings = [f'db;dur={metrics.db * 1000:.2f};desc="{metrics.queries} queries"']
+        timings.extend(f'{name};dur={value * 1000:.2f}' for name, value in metrics.timers.items() if value)
+        timings.append(f'total;dur={total * 1000:.2f}')
+        response['Server-Timing'] = ', '.join(timings)
+        return response
+
+    @staticmethod
+    def stream(content, metrics, record):
+        try:
+            iterator = iter(content)
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = next(iterator, None)
+                finally:
+                    _current.reset(token)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            record()
+
+    @staticmethod
+    async def stream_async(content, metrics, record):
+        try:
+            iterator = aiter(content)
+            while True:
+                token = _current.set(metrics)
+                try:
+                    chunk = await anext(iterator, None)
+                finally:
+                    _current.reset(token)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            record()
+
+    def record(self, request, response, metrics, started):
+        """Adds the request to the histograms; returns its total duration."""
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        labels = (view, request.method)
+        REQUEST_DURATION.observe((*labels, f'{response.status_code // 100}xx'), total)
+        DB_DURATION.observe(labels, metrics.db)
+        DB_QUERIES.observe(labels, metrics.queries)
+        for name, histogram in TIMERS.items():
+            histogram.observe(labels, metrics.timers[name])
+        return total
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of the request histograms of this process.
+    With METRICS_TOKEN set, requests must send ``Authorization: Bearer <token>``.
+    """
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponseForbidden()
+    body = '\n'.join(histogram.expose() for histogram in HISTOGRAMS) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,38 @@
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from .metrics import timed
+
+
+class ValuesReadMixin:
+    """
+    Read-only fast path for list and retrieve: payloads are built from ``.values()`` rows
+    instead of going through the serializer's field machinery; writes still use the serializer.
+
+    ``values_fields`` (the serializer's fields by default) are read from the viewset's queryset and
+    ``expand_rows`` may add nested data to a page of rows. The result must be exactly what the
+    serializer returns. Object-level permissions are not checked, as no model instance is loaded.
+    """
+    values_fields = None
+
+    def get_values_queryset(self):
+        fields = self.values_fields or self.get_serializer_class().Meta.fields
+        return self.filter_queryset(self.get_queryset()).prefetch_related(None).values(*fields)
+
+    def expand_rows(self, rows):
+        return rows
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_values_queryset()
+        page = self.paginate_queryset(queryset)
+        with timed('serialize'):
+            rows = self.expand_rows(page if page is not None else list(queryset))
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(self.get_values_queryset(), **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        with timed('serialize'):
+            return Response(self.expand_rows([row])[0])
@@ -0,0 +1,36 @@
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import timed
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; without it JSONRenderer does all the work
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed, with the same output as the stdlib encoder
+    (only floats in exponent notation are spelled differently, 1e16 instead of 1e+16).
+    Indented output, non-default JSON settings and values orjson rejects go through JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii or self.get_indent(
+            accepted_media_type, renderer_context or {}
+        ) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            # Dates go through DRF's encoder, which formats them differently from orjson.
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import threading
+from functools import cache
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import quote_etag
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.renderers import _SpecRenderer
+from drf_yasg.views import get_schema_view
+from rest_framework import permissions
+
+API_INFO = openapi.Info(
+    title="SpyCats API",
+    default_version='v1',
+    description="API documentation for SpyCats project",
+    contact=openapi.Contact(email=settings.ADMIN_EMAIL),
+)
+
+schema_view = get_schema_view(
+    API_INFO,
+    public=True,
+    permission_classes=(permissions.AllowAny,),
+)
+
+# Artifact extension -> codec
+CODECS = {'json': OpenAPICodecJson, 'yaml': OpenAPICodecYaml}
+
+
+@cache
+def code_version():
+    """
+    CODE_VERSION when set (e.g. the commit the image was built from), otherwise a hash of the
+    sources of the project's own apps, which is what the schema is generated from.
+    """
+    if settings.CODE_VERSION:
+        return settings.CODE_VERSION
+    digest = hashlib.sha256()
+    base_dir = Path(settings.BASE_DIR)
+    for app_config in apps.get_app_configs():
+        path = Path(app_config.path)
+        if base_dir not in path.parents:
+            continue
+        for source in sorted(path.rglob('*.py')):
+            digest.update(str(source.relative_to(base_dir)).encode())
+            digest.update(source.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def generate_schema():
+    """Full schema of every endpoint, as seen by an anonymous client, without a host (relative to the server)."""
+    generator = schema_view.generator_class(API_INFO)
+    return generator.get_schema(request=None, public=True)
+
+
+def artifact_path(extension, version=None):
+    return Path(settings.OPENAPI_SCHEMA_DIR) / f'openapi-{version or code_version()}.{extension}'
+
+
+def write_artifacts(schema=None):
+    """
+    Writes the schema of the current code version as JSON and YAML next to each other
+    and removes the artifacts of other versions. Returns the written paths.
+    """
+    schema = schema or generate_schema()
+    directory = Path(settings.OPENAPI_SCHEMA_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for extension, codec in CODECS.items():
+        path = artifact_path(extension)
+        temporary = path.with_name(f'.{path.name}.tmp')
+        temporary.write_bytes(codec(validators=[]).encode(schema))
+        os.replace(temporary, path)
+        paths.append(path)
+    for stale in directory.glob('openapi-*.*'):
+        if stale not in paths:
+            stale.unlink()
+    return paths
+
+
+class SchemaCache:
+    """
+    Encoded schema documents of the running code version, kept in process memory.
+    They come from the artifacts written by build_openapi_schema when present,
+    otherwise the schema is generated once on first use.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = None
+
+    def get(self, extension):
+        documents = self._documents
+        if documents is None:
+            documents = self._load()
+        return documents[extension]
+
+    def clear(self):
+        with self._lock:
+            self._documents = None
+
+    def _load(self):
+        with self._lock:
+            if self._documents is not None:
+                return self._documents
+            paths = {extension: artifact_path(extension) for extension in CODECS}
+            if all(path.exists() for path in paths.values()):
+                bodies = {extension: path.read_bytes() for extension, path in paths.items()}
+            else:
+                schema = generate_schema()
+                bodies = {extension: codec(validators=[]).encode(schema) for extension, codec in CODECS.items()}
+            self._documents = {
+                extension: (body, quote_etag(hashlib.md5(body).hexdigest())) for extension, body in bodies.items()
+            }
+            return self._documents
+
+
+schema_cache = SchemaCache()
+
+
+class CachedSchemaView(schema_view):
+    """
+    drf_yasg schema view answering spec requests (?format=openapi, .json, .yaml) from ``schema_cache``
+    with an ETag; the UI pages are rendered as before.
+    """
+
+    def get(self, request, version='', format=None):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, _SpecRenderer):
+            return super().get(request, version, format)
+
+        body, etag = schema_cache.get('yaml' if renderer.codec_class is OpenAPICodecYaml else 'json')
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            return HttpResponseNotModified(headers=headers)
+        return HttpResponse(body, content_type=f'{renderer.media_type}; charset=utf-8', headers=headers)
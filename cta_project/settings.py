@@ -21,6 +21,15 @@ ADMIN_EMAIL = os.getenv('ADMIN_EMAIL', 'admin@example.com')
 
 ALLOWED_HOSTS = []
 
+# Bearer token required by /metrics; empty leaves it open
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Version of the deployed code (e.g. the git commit); when empty it is derived from the sources.
+# The cached OpenAPI schema is tied to it.
+CODE_VERSION = os.getenv('CODE_VERSION', '')
+# Where build_openapi_schema writes the schema artifacts
+OPENAPI_SCHEMA_DIR = os.getenv('OPENAPI_SCHEMA_DIR', BASE_DIR / 'openapi')
+
 
 # Application definition
 
@@ -37,9 +46,15 @@ INSTALLED_APPS = [
 
     'agents_cats',
     'agents_missions',
+    'agency_stats',
+    'jobs',
+    # Project-wide management commands (build_openapi_schema)
+    'cta_project',
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its total latency covers the whole stack
+    'cta_project.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,9 +95,21 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', 'SPYCATPASSWORD'),
         'HOST': os.getenv('DB_HOST', 'db'),  # в Docker Compose указываем имя сервиса
         'PORT': os.getenv('DB_PORT', 5432),
+        # Persistent connections: each worker thread reuses its connection for DB_CONN_MAX_AGE seconds
+        # (0 closes it after every request) and checks it is still alive before reusing it.
+        # Under ASGI every request runs its sync code on a thread of its own, so connections are not kept.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0 if os.getenv('SERVER_INTERFACE') == 'asgi' else 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# DB_ENGINE=sqlite runs the project (e.g. tests and benchmarks) without a PostgreSQL server
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -120,10 +147,90 @@ else:
             'rest_framework.permissions.IsAuthenticated',
         ],
         'DEFAULT_AUTHENTICATION_CLASSES': [
-            'rest_framework_simplejwt.authentication.JWTAuthentication',
+            # JWTAuthentication with a per-process user cache (no user query per request)
+            'cta_project.authentication.CachedJWTAuthentication',
         ],
     }
 
+# CachedJWTAuthentication: users kept per process, at most AUTH_USER_CACHE_TTL seconds
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', 1024))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 60))
+
+# orjson-backed JSON rendering and keyset (cursor) pagination on id for every list endpoint
+REST_FRAMEWORK.update({
+    'DEFAULT_RENDERER_CLASSES': [
+        'cta_project.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'cta_project.pagination.IdCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 100)),
+})
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
+
+# The tests run against an open API under either VERSION (see cta_project/testing.py)
+TEST_RUNNER = 'cta_project.testing.OpenApiTestRunner'
+
+
+# Caches. The "responses" cache holds read responses and their versions for conditional GETs
+# (see cta_project/caching.py). Local memory is per process: with several worker processes
+# point it to a shared backend, e.g. django.core.cache.backends.redis.RedisCache (docker-compose does).
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', 'responses'),
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300)),
+        'OPTIONS': (
+            {'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000))}
+            if RESPONSE_CACHE_BACKEND.endswith('LocMemCache') else {}
+        ),
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+
+
+# TheCatAPI breed catalog
+CAT_API_BREEDS_URL = os.getenv('CAT_API_BREEDS_URL', 'https://api.thecatapi.com/v1/breeds')
+CAT_API_TIMEOUT = float(os.getenv('CAT_API_TIMEOUT', 5))
+CAT_API_POOL_SIZE = int(os.getenv('CAT_API_POOL_SIZE', 10))
+BREED_CACHE_TTL = int(os.getenv('BREED_CACHE_TTL', 60 * 60))
+# Leave the TheCatAPI calls to the job workers (run_workers): web processes revalidate their catalog
+# from the CatBreed table and queue a refresh instead of fetching it themselves.
+BREED_REFRESH_IN_WORKERS = os.getenv('BREED_REFRESH_IN_WORKERS', 'false').lower() in ('1', 'true', 'yes')
+
+# Bulk endpoints
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', 500))
+BULK_MAX_BATCH_SIZE = int(os.getenv('BULK_MAX_BATCH_SIZE', 5000))
+
+# Streaming exports: rows fetched per server-side cursor round trip
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+# import_agency: rows loaded per transaction
+IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 5000))
+
+# Status change feed (/api/missions/events/). "local" wakes consumers of the same process only,
+# others see new events within STATUS_FEED_POLL_INTERVAL; "postgres" fans out with LISTEN/NOTIFY.
+STATUS_FEED_BACKEND = os.getenv('STATUS_FEED_BACKEND', 'local')
+STATUS_FEED_POLL_INTERVAL = float(os.getenv('STATUS_FEED_POLL_INTERVAL', 2))
+STATUS_FEED_TIMEOUT = float(os.getenv('STATUS_FEED_TIMEOUT', 25))
+STATUS_FEED_MAX_TIMEOUT = float(os.getenv('STATUS_FEED_MAX_TIMEOUT', 60))
+STATUS_FEED_HEARTBEAT = float(os.getenv('STATUS_FEED_HEARTBEAT', 15))
+STATUS_FEED_BATCH_SIZE = int(os.getenv('STATUS_FEED_BATCH_SIZE', 500))
+
+# Background jobs (jobs app), run by `manage.py run_workers`. Failed jobs are retried after
+# JOB_RETRY_DELAY, 2 * JOB_RETRY_DELAY... seconds (at most JOB_RETRY_MAX_DELAY), JOB_MAX_ATTEMPTS times in all;
+# a job claimed more than JOB_CLAIM_TIMEOUT seconds ago is considered abandoned by its worker and run again.
+JOB_WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', 5))
+JOB_RETRY_MAX_DELAY = float(os.getenv('JOB_RETRY_MAX_DELAY', 10 * 60))
+JOB_CLAIM_TIMEOUT = int(os.getenv('JOB_CLAIM_TIMEOUT', 10 * 60))
+# Seconds between two sweeps repairing missions whose target counters drifted (0 disables them)
+MISSION_RECONCILE_INTERVAL = int(os.getenv('MISSION_RECONCILE_INTERVAL', 60 * 60))
 
 
 # Internationalization
@@ -0,0 +1,151 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test.runner import DiscoverRunner
+
+DEFAULT_BREEDS = ['Abyssinian', 'Bengal', 'Maine Coon', 'Persian', 'Siamese']
+
+
+class StubCatAPIServer:
+    """
+    Local stand-in for TheCatAPI serving /v1/breeds from a background thread.
+
+        with StubCatAPIServer() as stub, override_settings(CAT_API_BREEDS_URL=stub.breeds_url):
+            ...
+    """
+
+    def __init__(self, breeds=None):
+        self.breeds = list(DEFAULT_BREEDS if breeds is None else breeds)
+        self.status = 200
+        self.hits = 0
+        self._server = None
+
+    @property
+    def breeds_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/breeds"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                body = json.dumps([{'id': name[:4].lower(), 'name': name} for name in stub.breeds]).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubCatAPIMixin:
+    """TestCase mixin pointing the breed registry at a fresh StubCatAPIServer."""
+
+    @classmethod
+    def setUpClass(cls):
+        from django.test import override_settings
+
+        cls.cat_api = StubCatAPIServer().start()
+        cls._cat_api_settings = override_settings(CAT_API_BREEDS_URL=cls.cat_api.breeds_url)
+        cls._cat_api_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._cat_api_settings.disable()
+        cls.cat_api.stop()
+
+    def setUp(self):
+        from agents_cats.breeds import breed_registry
+
+        super().setUp()
+        self.cat_api.breeds = list(DEFAULT_BREEDS)
+        self.cat_api.status = 200
+        self.cat_api.hits = 0
+        breed_registry.clear()
+
+    def tearDown(self):
+        from agents_cats.breeds import breed_registry
+
+        breed_registry.wait_for_refresh()
+        super().tearDown()
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for asserting that an endpoint's query count does not grow with the data.
+
+        self.assertQueriesDoNotScale(lambda n: create_missions(n), lambda: self.client.get(url))
+    """
+
+    query_budget_sizes = (1, 5, 25)
+
+    def count_queries(self, call):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from cta_project.caching import response_cache
+
+        # Measure the uncached cost: seeding with the ORM bypasses response cache invalidation.
+        response_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = call()
+        if hasattr(response, 'status_code'):
+            self.assertLess(response.status_code, 400, getattr(response, 'content', b'')[:500])
+        return len(queries)
+
+    def assertQueriesDoNotScale(self, seed, call, sizes=None, budget=None):
+        """
+        Grows the data to each total in ``sizes`` by calling ``seed(new_rows)`` and checks that
+        ``call()`` runs the same number of queries every time, and at most ``budget`` if given.
+        """
+        counts = {}
+        seeded = 0
+        for size in sizes or self.query_budget_sizes:
+            seed(size - seeded)
+            seeded = size
+            counts[size] = self.count_queries(call)
+
+        self.assertEqual(len(set(counts.values())), 1, f"Query count grows with result size: {counts}")
+        if budget is not None:
+            self.assertLessEqual(max(counts.values()), budget, f"Query budget of {budget} exceeded: {counts}")
+
+
+class OpenApiTestRunner(DiscoverRunner):
+    """
+    Test runner (TEST_RUNNER) that opens the API whatever VERSION selects: the tests exercise the
+    API itself, and the ones about authentication patch JWT back in on APIView or on a view.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        from rest_framework.permissions import AllowAny
+        from rest_framework.views import APIView
+
+        super().setup_test_environment(**kwargs)
+        self._open_api = mock.patch.multiple(APIView, authentication_classes=[], permission_classes=[AllowAny])
+        self._open_api.start()
+
+    def teardown_test_environment(self, **kwargs):
+        self._open_api.stop()
+        super().teardown_test_environment(**kwargs)
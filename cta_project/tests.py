@@ -0,0 +1,295 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from agents_cats.breeds import breed_registry
+from agents_cats.models import SpyCats
+from agents_cats.views import SpyCatsViewSet
+from agents_missions.models import SpyMission
+from .authentication import CachedJWTAuthentication, api_access_denied, user_cache
+from .caching import response_cache
+from .metrics import HISTOGRAMS, Histogram
+from . import schema
+from .schema import artifact_path, code_version, schema_cache, write_artifacts
+from .testing import StubCatAPIMixin
+from .warmup import warm_up
+
+
+class MetricsMiddlewareTests(StubCatAPIMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        response_cache.clear()
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+
+    def server_timing(self, response):
+        return dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+
+    def test_server_timing_reports_queries_and_phases(self):
+        SpyCats.objects.create(name='Tom', breed='Bengal')
+
+        response = self.client.get('/api/agents-cats/spy-cats/')
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertEqual({'db', 'serialize', 'render', 'total'} - set(self.server_timing(response)), set())
+
+    async def test_asgi_request_queries_are_counted(self):
+        await SpyCats.objects.acreate(name='Tom', breed='Bengal')
+
+        # Under ASGI the sync view and its queries run on another thread than the middleware.
+        response = await AsyncClient().get('/api/agents-cats/spy-cats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertGreater(float(self.server_timing(response)['db']), 0)
+
+    def db_queries_sum(self, view):
+        body = self.client.get('/metrics').content.decode()
+        match = re.search(rf'http_request_db_queries_sum{{view="{view}",method="GET"}} (\S+)', body)
+        return float(match.group(1)) if match else None
+
+    def test_streamed_body_is_measured_once_sent(self):
+        SpyMission.objects.create()
+
+        response = self.client.get('/api/missions/spy-missions/export/')
+        self.assertIsNone(self.db_queries_sum('spymission-export'))
+        b''.join(response.streaming_content)
+
+        self.assertNotIn('Server-Timing', response)
+        self.assertGreaterEqual(self.db_queries_sum('spymission-export'), 2)
+
+    async def test_asgi_streamed_body_is_measured_once_sent(self):
+        await SpyMission.objects.acreate()
+
+        response = await AsyncClient().get('/api/missions/spy-missions/export/')
+        [chunk async for chunk in response.streaming_content]
+
+        self.assertGreaterEqual(await sync_to_async(self.db_queries_sum)('spymission-export'), 2)
+
+    def test_outbound_call_is_timed(self):
+        response = self.client.post('/api/agents-cats/spy-cats/', {'name': 'Tom', 'breed': 'Bengal'}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('http', self.server_timing(response))
+
+    def test_metrics_exposes_histograms_per_view(self):
+        self.client.get('/api/agents-cats/spy-cats/')
+        self.client.get('/api/agents-cats/spy-cats/')
+
+        body = self.client.get('/metrics').content.decode()
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'http_request_duration_seconds_count{view="spycat-list",method="GET",status="2xx"} 2', body
+        )
+        self.assertIn('http_request_db_queries_bucket{view="spycat-list",method="GET",le="+Inf"} 2', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class HistogramTests(TestCase):
+    def test_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', "Latency.", ('view',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(('a"b',), value)
+
+        self.assertEqual(histogram.expose().splitlines()[2:], [
+            'latency_seconds_bucket{view="a\\"b",le="0.1"} 1',
+            'latency_seconds_bucket{view="a\\"b",le="1.0"} 2',
+            'latency_seconds_bucket{view="a\\"b",le="+Inf"} 3',
+            'latency_seconds_sum{view="a\\"b"} 5.55',
+            'latency_seconds_count{view="a\\"b"} 3',
+        ])
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = get_user_model().objects.create_user('agent', password='first-password')
+
+    def authenticate(self, token=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token or AccessToken.for_user(self.user)}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_user_is_served_from_cache(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertIsNot(user, self.authenticate())
+
+    def test_deactivation_invalidates_cached_user(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    # simplejwt rebinds its api_settings on setting_changed, which importers never see.
+    @mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True, create=True)
+    def test_password_change_revokes_tokens(self):
+        token = AccessToken.for_user(self.user)
+        self.authenticate(token)
+
+        self.user.set_password('second-password')
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    @override_settings(AUTH_USER_CACHE_SIZE=1, AUTH_USER_CACHE_TTL=60)
+    def test_cache_is_bounded_and_expires(self):
+        other = get_user_model().objects.create_user('other', password='password')
+        self.authenticate()
+        self.authenticate(AccessToken.for_user(other))
+
+        self.assertIsNone(user_cache.get(str(self.user.pk)))
+        self.assertIsNotNone(user_cache.get(str(other.pk)))
+        with mock.patch('cta_project.authentication.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(user_cache.get(str(other.pk)))
+
+    def test_authenticated_list_needs_no_auth_query(self):
+        SpyCats.objects.create(name='Tom', breed='Bengal')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+        with mock.patch.multiple(
+            SpyCatsViewSet, authentication_classes=[CachedJWTAuthentication], permission_classes=[IsAuthenticated]
+        ):
+            self.assertEqual(client.get('/api/agents-cats/spy-cats/').status_code, 200)
+            response_cache.clear()
+            with self.assertNumQueries(1):
+                self.assertEqual(client.get('/api/agents-cats/spy-cats/').status_code, 200)
+            self.assertEqual(APIClient().get('/api/agents-cats/spy-cats/').status_code, 401)
+
+
+class ApiAccessDeniedTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('agent', password='secret-password')
+        patcher = mock.patch.multiple(
+            'rest_framework.views.APIView',
+            authentication_classes=[CachedJWTAuthentication], permission_classes=[IsAuthenticated]
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_anonymous_request_gets_rendered_error(self):
+        response = api_access_denied(APIRequestFactory().get('/api/missions/events/'))
+
+        self.assertEqual(response.status_code, 401)
+        self.assertIn(b'credentials', response.content)
+
+    def test_authenticated_request_passes(self):
+        request = APIRequestFactory().get(
+            '/api/missions/events/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}'
+        )
+
+        self.assertIsNone(api_access_denied(request))
+
+
+class ProdSettingsTests(SimpleTestCase):
+    def test_project_loads_with_jwt_authentication(self):
+        # A fresh interpreter: with the Prod REST_FRAMEWORK settings, importing DRF imports the authentication module.
+        env = {**os.environ, 'VERSION': 'Prod', 'DB_ENGINE': 'sqlite', 'DJANGO_SETTINGS_MODULE': 'cta_project.settings'}
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'check'], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class WarmUpTests(StubCatAPIMixin, TestCase):
+    def test_loads_breed_catalog_and_releases_connections(self):
+        with mock.patch.object(connections, 'close_all') as close_all:
+            warm_up()
+
+        close_all.assert_called_once()
+        self.assertTrue(breed_registry.contains('Bengal'))
+        self.assertEqual(self.cat_api.hits, 1)
+
+    def test_unavailable_catalog_does_not_prevent_start(self):
+        self.cat_api.status = 500
+
+        with mock.patch.object(connections, 'close_all'), self.assertLogs('cta_project.warmup', 'WARNING'):
+            warm_up()
+
+
+class CachedSchemaTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema_cache.clear()
+        self.addCleanup(schema_cache.clear)
+        self.client = APIClient()
+
+    def test_schema_is_generated_once(self):
+        with mock.patch.object(schema, 'generate_schema', wraps=schema.generate_schema) as generate:
+            first = self.client.get('/swagger/?format=openapi')
+            second = self.client.get('/swagger.json')
+
+        generate.assert_called_once()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'application/openapi+json; charset=utf-8')
+        self.assertEqual(first.content, second.content)
+        self.assertIn('/agents-cats/spy-cats/', json.loads(first.content)['paths'])
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.client.get('/swagger.yaml')['ETag']
+
+        response = self.client.get('/swagger.yaml', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_served_from_artifacts_without_generating(self):
+        write_artifacts()
+        schema_cache.clear()
+
+        with mock.patch.object(schema, 'generate_schema', side_effect=AssertionError("schema generated")):
+            response = self.client.get('/swagger.yaml')
+
+        self.assertEqual(response.content, artifact_path('yaml').read_bytes())
+
+    def test_artifacts_of_other_versions_are_removed(self):
+        stale = artifact_path('json', version='0ld')
+        stale.write_text('{}')
+
+        write_artifacts()
+
+        self.assertFalse(stale.exists())
+        self.assertTrue(artifact_path('json').exists())
+
+    def test_code_version_setting_wins(self):
+        code_version.cache_clear()
+        self.addCleanup(code_version.cache_clear)
+
+        with override_settings(CODE_VERSION='3f82cc1'):
+            self.assertEqual(artifact_path('json').name, 'openapi-3f82cc1.json')
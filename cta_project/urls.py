@@ -1,33 +1,24 @@
 from django.contrib import admin
-from django.conf import settings
-from django.urls import path, include
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
+from django.urls import path, include, re_path
+from cta_project.metrics import metrics_view
+from cta_project.schema import CachedSchemaView
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
 
 
-schema_view = get_schema_view(
-   openapi.Info(
-      title="SpyCats API",
-      default_version='v1',
-      description="API documentation for SpyCats project",
-      contact=openapi.Contact(email=settings.ADMIN_EMAIL),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
-
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/agents-cats/', include('agents_cats.urls')),
     path('api/missions/', include('agents_missions.urls')),
+    path('api/stats/', include('agency_stats.urls')),
 
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('swagger/', CachedSchemaView.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    re_path(r'^swagger\.(?P<format>json|yaml)$', CachedSchemaView.without_ui(cache_timeout=0), name='schema-json'),
 
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,47 @@
+import logging
+
+from django.db import connections
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from agents_cats.breeds import BreedCatalogUnavailable, breed_registry
+from .schema import schema_cache
+
+logger = logging.getLogger(__name__)
+
+
+def iter_views(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_views(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern.callback
+
+
+def warm_up(breed_timeout=10):
+    """
+    Does once, before the first request, what would otherwise slow down the first requests of every
+    worker: builds the URL resolver, imports every view and builds the fields of its serializer,
+    loads the OpenAPI schema, checks the database and loads the breed catalog. Connections opened
+    here are closed again, so forked workers never share them.
+    """
+    resolver = get_resolver()
+    resolver.reverse_dict  # populates the resolver
+    serializers = set()
+    for view in iter_views(resolver.url_patterns):
+        view_class = getattr(view, 'cls', None)
+        serializer_class = getattr(view_class, 'serializer_class', None)
+        if serializer_class is not None and serializer_class not in serializers:
+            serializers.add(serializer_class)
+            serializer_class().fields
+    schema_cache.get('json')
+
+    try:
+        connections['default'].ensure_connection()
+        breed_registry.snapshot()
+        # A persisted catalog is revalidated in a background thread: let it finish before forking.
+        breed_registry.wait_for_refresh(breed_timeout)
+    except BreedCatalogUnavailable as e:
+        logger.warning("Breed catalog not loaded during warm-up: %s", e)
+    finally:
+        connections.close_all()
+    logger.info("Warmed up %d serializers", len(serializers))
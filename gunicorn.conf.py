@@ -0,0 +1,42 @@
+# Production server: gunicorn -c gunicorn.conf.py
+# SERVER_INTERFACE=asgi serves cta_project/asgi.py with uvicorn workers instead of cta_project/wsgi.py.
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cta_project.settings')
+
+interface = os.getenv('SERVER_INTERFACE', 'wsgi').lower()
+if interface == 'asgi':
+    wsgi_app = 'cta_project.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'cta_project.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then, spread out so they do not all restart at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+# Load Django once in the master and fork the workers from it (copy-on-write memory)
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+accesslog = '-'
+
+
+def when_ready(server):
+    # Master, application loaded, before any worker is started
+    if preload_app:
+        from cta_project.warmup import warm_up
+        warm_up()
+
+
+def post_worker_init(worker):
+    # Without preload every worker loads the application itself
+    if not preload_app:
+        from cta_project.warmup import warm_up
+        warm_up()
@@ -0,0 +1,31 @@
+from django.contrib import admin
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'dedupe_key', 'status', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('kind', 'dedupe_key')
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected failed jobs")
+    def retry(self, request, queryset):
+        retried = 0
+        for job in queryset.filter(status=Job.Status.FAILED):
+            try:
+                with transaction.atomic():
+                    retried += Job.objects.filter(pk=job.pk).update(
+                        status=Job.Status.PENDING, attempts=0, run_at=timezone.now(), claimed_by='', claimed_at=None
+                    )
+            except IntegrityError:
+                # An equal job is already pending.
+                job.delete()
+        self.message_user(request, f"{retried} jobs queued again.")
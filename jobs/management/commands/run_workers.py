@@ -0,0 +1,32 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.queue import run_workers
+
+
+class Command(BaseCommand):
+    help = "Run background jobs with a pool of worker threads until stopped (SIGINT/SIGTERM)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.JOB_WORKER_THREADS)
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help="Seconds an idle worker waits before looking for due jobs again.")
+        parser.add_argument('--once', action='store_true', help="Exit once no job is due.")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            # Running jobs finish, no new one is claimed.
+            stop.set()
+
+        previous = {signum: signal.signal(signum, shutdown) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            done = run_workers(options['threads'], options['once'], options['poll_interval'], stop)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Workers stopped after {done} jobs."))
@@ -0,0 +1,41 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A unit of deferred work, run by `manage.py run_workers` (see queue.py).
+    Finished jobs are deleted; jobs that exhausted their attempts stay as FAILED with their last error.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        FAILED = 'failed', 'Failed'
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    # At most one pending job per key: a job enqueued while an equal one waits is dropped.
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    # Token of the claim that is running the job, and when it was taken (expired claims are taken over).
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'], condition=Q(status='pending'), name='job_pending_dedupe_key'
+            ),
+        ]
+        indexes = [
+            # Workers look for due jobs: status = 'pending' ORDER BY run_at
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk}'
@@ -0,0 +1,182 @@
+import logging
+import random
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# {kind: function}, filled by the @task decorators of the apps' tasks.py modules
+handlers = {}
+# {kind: name of the setting with the seconds between two runs} of the periodic tasks
+periodic = {}
+
+
+def task(kind, every=None):
+    """
+    Registers the decorated function as the handler of the jobs of ``kind``; it gets the payload as kwargs.
+    ``every`` names a setting: the job then also runs periodically, every that many seconds (0 disables it).
+    """
+    def register(func):
+        handlers[kind] = func
+        if every is not None:
+            periodic[kind] = every
+        return func
+    return register
+
+
+def schedule_periodic(kinds=None):
+    """
+    Queues the next run of the periodic jobs of ``kinds`` (all by default). One pending run per kind:
+    queuing again while one waits changes nothing, so every worker process can call it at start.
+    """
+    for kind in periodic if kinds is None else kinds:
+        interval = getattr(settings, periodic[kind])
+        if interval > 0:
+            enqueue(kind, dedupe_key=f'periodic:{kind}', delay=interval)
+
+
+def enqueue(kind, payload=None, dedupe_key=None, delay=0):
+    """Queues one job, see enqueue_many."""
+    enqueue_many(kind, [(payload or {}, dedupe_key)], delay)
+
+
+def enqueue_many(kind, jobs, delay=0):
+    """
+    Queues a job of ``kind`` per ``(payload, dedupe_key)`` pair once the current transaction commits
+    (right away outside one), so a rolled-back write queues nothing and workers never read data that
+    is not committed yet. One INSERT ... ON CONFLICT DO NOTHING for all of them: a job whose
+    ``dedupe_key`` is already pending is dropped, the pending one will see the latest state anyway.
+    """
+    run_at = timezone.now() + timedelta(seconds=delay)
+    rows, keys = [], set()
+    for payload, dedupe_key in jobs:
+        if dedupe_key is not None:
+            if dedupe_key in keys:
+                continue
+            keys.add(dedupe_key)
+        rows.append(Job(kind=kind, payload=payload, dedupe_key=dedupe_key, run_at=run_at))
+    if rows:
+        transaction.on_commit(lambda: Job.objects.bulk_create(rows, ignore_conflicts=True))
+
+
+def backoff(attempts):
+    """Seconds before the next try of a job that failed ``attempts`` times: exponential, capped, jittered."""
+    delay = min(settings.JOB_RETRY_MAX_DELAY, settings.JOB_RETRY_DELAY * 2 ** (attempts - 1))
+    # Jitter spreads the retries of jobs that failed together (e.g. while a dependency was down).
+    return delay * random.uniform(0.5, 1)
+
+
+def claim(worker, limit=1):
+    """
+    Takes up to ``limit`` due jobs for ``worker`` and returns them. Jobs whose claim is older than
+    JOB_CLAIM_TIMEOUT (their worker died) are due again. On PostgreSQL, concurrent workers skip
+    each other's rows (FOR UPDATE SKIP LOCKED) instead of waiting for them.
+    """
+    now = timezone.now()
+    due = Q(status=Job.Status.PENDING, run_at__lte=now) | Q(
+        status=Job.Status.RUNNING, claimed_at__lt=now - timedelta(seconds=settings.JOB_CLAIM_TIMEOUT)
+    )
+    token = f'{worker}:{uuid.uuid4().hex}'
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True).filter(due).order_by('run_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        # The condition is checked again by the UPDATE, so a job is claimed once even without row locks.
+        Job.objects.filter(due, pk__in=ids).update(
+            status=Job.Status.RUNNING, claimed_by=token, claimed_at=now, attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(claimed_by=token).order_by('run_at'))
+
+
+def run_job(job):
+    """Runs a claimed job: deletes it on success, schedules a retry or marks it failed on error."""
+    try:
+        handler = handlers.get(job.kind)
+        if handler is None:
+            raise LookupError(f"No handler for jobs of kind {job.kind!r}")
+        handler(**job.payload)
+    except Exception as e:
+        logger.exception("Job %s failed (attempt %s)", job, job.attempts)
+        retry_or_fail(job, e)
+        return False
+    Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by).delete()
+    if job.kind in periodic:
+        schedule_periodic([job.kind])
+    return True
+
+
+def retry_or_fail(job, error):
+    mine = Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by)
+    last_error = ''.join(traceback.format_exception_only(error)).strip()
+    if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+        mine.update(status=Job.Status.FAILED, last_error=last_error)
+        if job.kind in periodic:
+            schedule_periodic([job.kind])
+        return
+    try:
+        with transaction.atomic():
+            mine.update(
+                status=Job.Status.PENDING, run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)),
+                claimed_by='', claimed_at=None, last_error=last_error,
+            )
+    except IntegrityError:
+        # An equal job was queued meanwhile and will do the work.
+        mine.delete()
+
+
+def work(worker, stop, once=False, poll_interval=None):
+    """
+    Loop of one worker thread: runs due jobs one at a time until ``stop`` is set or, with ``once``,
+    until none is due. Returns the number of jobs run.
+    """
+    poll_interval = settings.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+    done = 0
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            jobs = claim(worker)
+            if not jobs:
+                if once:
+                    break
+                stop.wait(poll_interval)
+                continue
+            for job in jobs:
+                run_job(job)
+                done += 1
+    finally:
+        connection.close()
+    return done
+
+
+def run_workers(threads=1, once=False, poll_interval=None, stop=None, name='worker'):
+    """
+    Runs ``threads`` worker threads in this process until ``stop`` is set (with ``once``: until the
+    queue has no due job), after queuing the periodic jobs that are not pending yet.
+    Scale out by running more processes, each with its own pool.
+    Returns the number of jobs run.
+    """
+    stop = stop or threading.Event()
+    results = [0] * threads
+    schedule_periodic()
+
+    def target(index):
+        results[index] = work(f'{name}-{index}', stop, once, poll_interval)
+
+    pool = [threading.Thread(target=target, args=(index,), name=f'{name}-{index}') for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(results)
@@ -0,0 +1,150 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import backoff, claim, enqueue, enqueue_many, handlers, periodic, run_job, schedule_periodic
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        patcher = mock.patch.dict(handlers, {
+            'tests.record': lambda **payload: self.calls.append(payload),
+            'tests.fail': self.fail_job,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail_job(self, **payload):
+        raise RuntimeError("Catalog unavailable")
+
+    def test_jobs_are_queued_on_commit_once_per_pending_key(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'mission_id': 1}, dedupe_key='mission:1')
+            enqueue_many('tests.record', [({'mission_id': 1}, 'mission:1'), ({'mission_id': 2}, 'mission:2')])
+            self.assertFalse(Job.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue('tests.record', {'mission_id': 1}, dedupe_key='mission:1')
+            enqueue('tests.record')
+
+        self.assertEqual(sorted(Job.objects.values_list('dedupe_key', flat=True), key=str), [None, 'mission:1', 'mission:2'])
+
+    def test_rolled_back_write_queues_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                enqueue('tests.record')
+                raise ValueError
+
+        self.assertFalse(Job.objects.exists())
+
+    def test_successful_job_is_deleted(self):
+        Job.objects.create(kind='tests.record', payload={'mission_id': 3})
+
+        job, = claim('test')
+        self.assertEqual((job.status, job.attempts), (Job.Status.RUNNING, 1))
+        self.assertEqual(claim('test'), [])
+        self.assertTrue(run_job(job))
+
+        self.assertEqual(self.calls, [{'mission_id': 3}])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=60)
+    def test_failed_job_is_retried_with_backoff_then_kept_as_failed(self):
+        Job.objects.create(kind='tests.fail')
+
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(claim('test')[0]))
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), (Job.Status.PENDING, 1, "RuntimeError: Catalog unavailable"))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(claim('test'), [])
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(claim('test')[0]))
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 2))
+        self.assertEqual(claim('test'), [])
+
+    def test_failed_job_yields_to_an_equal_pending_job(self):
+        Job.objects.create(kind='tests.fail', dedupe_key='breed-catalog')
+        job, = claim('test')
+        Job.objects.create(kind='tests.fail', dedupe_key='breed-catalog')
+
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_job(job)
+
+        self.assertEqual(list(Job.objects.values_list('status', 'attempts')), [(Job.Status.PENDING, 0)])
+
+    def test_abandoned_claims_are_taken_over(self):
+        with override_settings(JOB_CLAIM_TIMEOUT=60):
+            Job.objects.create(
+                kind='tests.record', status=Job.Status.RUNNING, attempts=1,
+                claimed_by='dead-worker', claimed_at=timezone.now() - timedelta(minutes=5),
+            )
+            job, = claim('test')
+
+        self.assertEqual(job.attempts, 2)
+        self.assertTrue(run_job(job))
+
+    def test_unknown_kind_fails(self):
+        Job.objects.create(kind='tests.unknown')
+
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(claim('test')[0]))
+        self.assertIn("No handler", Job.objects.get().last_error)
+
+    @override_settings(TESTS_INTERVAL=60)
+    def test_periodic_job_queues_its_next_run(self):
+        with mock.patch.dict(periodic, {'tests.record': 'TESTS_INTERVAL'}, clear=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_periodic()
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_periodic()
+            job = Job.objects.get()
+            self.assertEqual(job.dedupe_key, 'periodic:tests.record')
+            self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=55))
+
+            Job.objects.update(run_at=timezone.now())
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(run_job(claim('test')[0]))
+
+        next_run = Job.objects.get()
+        self.assertNotEqual(next_run.pk, job.pk)
+        self.assertGreater(next_run.run_at, timezone.now() + timedelta(seconds=55))
+
+    @override_settings(TESTS_INTERVAL=0)
+    def test_periodic_job_is_disabled_by_a_zero_interval(self):
+        with mock.patch.dict(periodic, {'tests.record': 'TESTS_INTERVAL'}, clear=True), \
+             self.captureOnCommitCallbacks(execute=True):
+            schedule_periodic()
+
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_RETRY_DELAY=5, JOB_RETRY_MAX_DELAY=60)
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertTrue(2.5 <= backoff(1) <= 5)
+        self.assertTrue(10 <= backoff(3) <= 20)
+        self.assertTrue(30 <= backoff(10) <= 60)
+
+
+class RunWorkersCommandTests(TransactionTestCase):
+    def test_once_runs_every_due_job(self):
+        calls = []
+        Job.objects.bulk_create([Job(kind='tests.record', payload={'index': i}) for i in range(3)])
+        Job.objects.create(kind='tests.record', run_at=timezone.now() + timedelta(hours=1))
+        stdout = StringIO()
+
+        with mock.patch.dict(handlers, {'tests.record': lambda **payload: calls.append(payload)}), \
+             mock.patch.dict(periodic, clear=True):
+            call_command('run_workers', '--once', '--threads', '1', stdout=stdout)
+
+        self.assertEqual(sorted(call['index'] for call in calls), [0, 1, 2])
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertIn("after 3 jobs", stdout.getvalue())